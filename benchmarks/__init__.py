@@ -0,0 +1,23 @@
+"""
+
+    Author : A. Emerick
+
+    Purpose: Benchmarks of the kernels most of a run's time goes into
+             (table interpolation, IMF sampling, the SNIa delay time
+             draw, the radiation series, star construction and
+             evolution, star property gathering, and output buffers).
+
+             Benchmarks follow the asv conventions: classes in the
+             bench_*.py modules with time_* methods, optional params /
+             param_names, and setup / teardown called with each
+             combination of params. Run them, and compare two
+             revisions, with:
+
+                 $ python -m benchmarks.run
+                 $ python -m benchmarks.run --quick --filter Interpolate
+                 $ python -m benchmarks.run compare old.json new.json
+
+             Results are written as JSON to benchmarks/results/, named
+             by git revision (see run.py).
+
+"""
@@ -0,0 +1,58 @@
+"""
+    IMF sampling, through IMF.sample and the cython sample_imf directly
+"""
+
+import numpy as np
+
+from onezone import imf
+from onezone.cython_ext import sample_imf as c_sample_imf
+
+_imfs = {'salpeter' : lambda : imf.salpeter(M_min = 1.0, M_max = 100.0, alpha = 1.35),
+         'kroupa'   : lambda : imf.kroupa(M_min = 0.08, M_max = 100.0)}
+
+class IMFSample:
+
+    params      = [list(_imfs.keys()), [1.0E2, 1.0E3, 1.0E4, 1.0E5]]
+    param_names = ['imf', 'M']
+
+    def setup(self, name, M):
+        self.imf = _imfs[name]()
+        self.imf.sample(M = 10.0)      # tabulate the IMF outside the timing
+        self.rng = np.random.default_rng(12345)
+        return
+
+    def time_sample_mass(self, name, M):
+        self.imf.sample(M = M, rng = self.rng)
+
+class IMFSampleNumber:
+
+    params      = [list(_imfs.keys()), [10, 100, 1000]]
+    param_names = ['imf', 'N']
+
+    def setup(self, name, N):
+        self.imf = _imfs[name]()
+        self.imf.sample(M = 10.0)
+        self.rng = np.random.default_rng(12345)
+        return
+
+    def time_sample_number(self, name, N):
+        self.imf.sample(N = N, rng = self.rng)
+
+class SampleIMF:
+    """
+    The cython sampler alone, with and without a Generator
+    """
+
+    params      = [[1.0E3, 1.0E5], [True, False]]
+    param_names = ['M', 'generator']
+
+    def setup(self, M, generator):
+        self.imf = _imfs['salpeter']()
+        self.imf.sample(M = 10.0)
+        self.rng = np.random.default_rng(12345) if generator else None
+        return
+
+    def time_sample_imf(self, M, generator):
+        f = self.imf
+        c_sample_imf.sample_imf(f._tabulated_imf, M, 0, f._tabulated_dm, f._M_min, f._M_max,
+                                np.size(f._tabulated_imf), self.rng)
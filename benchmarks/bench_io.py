@@ -0,0 +1,39 @@
+"""
+    Writing rows through config.chunked_hdf5_buffer
+"""
+
+import numpy as np
+import os, shutil, tempfile
+
+from onezone import config
+
+class ChunkedBufferFlush:
+    """
+    Appending one chunk of rows, which fills the buffer and writes it
+    to the dataset
+    """
+
+    params      = [[100, 1000, 10000], [None, 'lzf', 'gzip'], [16, 128]]
+    param_names = ['chunk_rows', 'compression', 'columns']
+
+    def setup(self, rows, compression, columns):
+        self.tmpdir = tempfile.mkdtemp()
+        self.buffer = config.chunked_hdf5_buffer(os.path.join(self.tmpdir, 'bench.h5'),
+                                                 headers = ['c%i'%(i) for i in range(columns)],
+                                                 compression = compression,
+                                                 chunks = (rows, columns), dtype = np.float64)
+        self.rows   = np.random.default_rng(12345).random((rows, columns))
+        return
+
+    def teardown(self, rows, compression, columns):
+        self.buffer.close()
+        shutil.rmtree(self.tmpdir)
+        return
+
+    def time_append_chunk(self, rows, compression, columns):
+        self.buffer.append(self.rows)
+
+    def time_append_rows(self, rows, compression, columns):
+        # a chunk of rows one at a time, as the summary and event outputs do
+        for row in self.rows:
+            self.buffer.append(row)
@@ -0,0 +1,52 @@
+"""
+    The SNIa delay time draw and the black body series in radiation
+"""
+
+import numpy as np
+
+from onezone import physics
+from onezone import radiation
+from onezone import config
+from onezone.constants import CONST as const
+
+class WDLifetime:
+
+    def setup(self):
+        self.hubble_time = config.units.hubble_time(0.0)
+        self.lifetime    = 100.0 * const.Myr / config.units.time
+        self.rng         = np.random.default_rng(12345)
+        return
+
+    def time_WD_lifetime(self):
+        physics.WD_lifetime(self.lifetime, 0.0, self.lifetime, hubble_time = self.hubble_time,
+                            rng = self.rng)
+
+    def time_SNIa_probability(self):
+        physics.SNIa_probability(2.0 * self.lifetime, 0.0, self.lifetime,
+                                 hubble_time = self.hubble_time)
+
+class Radiation:
+    """
+    Series are slowest for cool stars, where they take the most terms
+    """
+
+    params      = [[5000.0, 20000.0, 60000.0]]
+    param_names = ['Teff']
+
+    def time_average_energy_HI(self, T):
+        radiation.average_energy(const.E_HI / const.eV_erg, T)
+
+    def time_average_energy_HeI(self, T):
+        radiation.average_energy(const.E_HeI / const.eV_erg, T)
+
+    def time_blackbody_q0(self, T):
+        radiation.compute_blackbody_q0(T)
+
+    def time_blackbody_q1(self, T):
+        radiation.compute_blackbody_q1(T)
+
+    def time_fuv_flux(self, T):
+        radiation.fuv_flux_blackbody(T)
+
+    def time_LW_flux(self, T):
+        radiation.LW_flux_blackbody(T)
@@ -0,0 +1,90 @@
+"""
+    Star construction, StarList.evolve, and StarList.property_asarray.
+    Every star in a list is a separate object (see common.make_stars),
+    so the large lists have the memory footprint of a real population.
+"""
+
+import numpy as np
+
+from onezone.cython_ext import cython_star as star
+
+from . import common
+
+class StarInit:
+    """
+    Star.__init__, which interpolates the stellar evolution and
+    radiation tables (_assign_properties / _compute_properties)
+    """
+
+    params      = [[1.0, 10.0, 50.0]]
+    param_names = ['M']
+
+    def setup(self, M):
+        self.rc         = common.run_config()
+        self.params     = star.StarParameters(self.rc)
+        self.abundances = common.abundances()
+        return
+
+    def time_star_init(self, M):
+        star.Star(M = M, Z = 0.001, abundances = self.abundances, tform = 0.0,
+                  params = self.params, write_abundances = False)
+
+    def time_unresolved_star_init(self, M):
+        star.Star(M = M, Z = 0.001, abundances = self.abundances, tform = 0.0,
+                  star_type = 'unresolved_star', params = self.params,
+                  write_abundances = False)
+
+class StarListEvolve:
+    """
+    One step of every star at a fixed time. Ages are set from the time,
+    so repeated steps do the same work, apart from wind mass loss.
+    """
+
+    params      = [[1000, 10000, 100000, 1000000]]
+    param_names = ['N_stars']
+    repeat      = 3
+
+    def setup(self, N):
+        self.rc     = common.run_config()
+        self.params = star.StarParameters(self.rc)
+        self.params.freeze()
+
+        self.stars  = star.StarList(common.make_stars(N, self.params), run_config = self.rc)
+        self.rng    = np.random.default_rng(12345)
+
+        self.t      = 50.0
+        self.dt     = 0.1
+        self.stars.evolve(self.t, self.dt, *common.accumulators()[:2],
+                          special_accumulator = common.accumulators()[2],
+                          params = self.params, rng = self.rng)
+        return
+
+    def time_evolve(self, N):
+        ej, sn, special = common.accumulators()
+        self.stars.evolve(self.t, self.dt, ej_masses = ej, sn_masses = sn,
+                          special_accumulator = special, params = self.params,
+                          rng = self.rng)
+
+    def time_totals(self, N):
+        self.stars.totals()
+
+    def time_summary_sums(self, N):
+        self.stars.summary_sums()
+
+class PropertyAsarray:
+
+    params      = [[1000, 10000, 100000, 1000000], ['mass', 'lifetime']]
+    param_names = ['N_stars', 'name']
+    repeat      = 3
+
+    def setup(self, N, name):
+        self.rc     = common.run_config()
+        self.params = star.StarParameters(self.rc)
+        self.stars  = star.StarList(common.make_stars(N, self.params), run_config = self.rc)
+        return
+
+    def time_all(self, N, name):
+        self.stars.property_asarray(name)
+
+    def time_by_type(self, N, name):
+        self.stars.property_asarray(name, 'star')
@@ -0,0 +1,45 @@
+"""
+    DataTable.interpolate for each of the tables the star kernels use
+"""
+
+import numpy as np
+
+from onezone.cython_ext import cython_star as star
+
+_tables = {'stellar_evolution' : (star.SE_TABLE,                 ['L', 'Teff', 'R', 'lifetime', 'age_agb']),
+           'radiation'         : (star.RAD_TABLE,                ['q0', 'q1', 'FUV_flux', 'LW_flux']),
+           'SNII_yields'       : (star.SN_YIELD_TABLE,           None),
+           'wind_yields'       : (star.WIND_YIELD_TABLE,         None),
+           'massive_yields'    : (star.MASSIVE_STAR_YIELD_TABLE, None)}
+
+def _points(table, N, seed = 12345):
+    # points spread uniformly inside the table grid
+    rng = np.random.default_rng(seed)
+    return [[rng.uniform(x[0], x[-1]) for x in table.x.values()] for i in range(N)]
+
+class Interpolate:
+    """
+    One point (scalar) and 1000 points one after another (batch)
+    """
+
+    params      = [list(_tables.keys())]
+    param_names = ['table']
+
+    def setup(self, name):
+        self.table, self.ynames = _tables[name]
+        if self.ynames is None:
+            self.ynames = list(self.table.y.keys())[:10]
+
+        self.points = _points(self.table, 1000)
+        return
+
+    def time_scalar(self, name):
+        self.table.interpolate(self.points[0], self.ynames)
+
+    def time_batch(self, name):
+        table, ynames = self.table, self.ynames
+        for p in self.points:
+            table.interpolate(p, ynames)
+
+    def time_single_value(self, name):
+        self.table.interpolate(self.points[0], self.ynames[0])
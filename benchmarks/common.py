@@ -0,0 +1,95 @@
+"""
+    Set up shared by the benchmarks: a RunConfig and stars to work on
+"""
+
+import numpy as np
+
+from onezone import config
+from onezone import performance_tools as perf
+from onezone.cython_ext import cython_star as star
+
+species = ['m_tot', 'm_metal', 'H', 'He', 'C', 'N', 'O', 'Mg', 'Fe']
+
+#
+# building a star interpolates several tables (a fraction of a ms
+# each), so only this many stars are built. Longer lists are made of
+# copies of their values (StarList.from_columns), each a separate star
+# with its own formation time
+#
+max_distinct_stars = 10000
+
+_star_columns = {}
+
+def run_config():
+    """
+    RunConfig with the benchmark species and no output files
+    """
+
+    rc = config.RunConfig()
+    rc.zone.species_to_track = list(species)
+
+    rc.io.summary_output_filename = None
+    rc.io.dump_output_basename    = None
+    rc.io.checkpoint_basename     = None
+    rc.io.background_output       = False
+
+    rc.global_values.profiler = perf.Profiler(False)
+
+    return rc
+
+def abundances(Z = 0.001):
+    ab = {e : 0.0 for e in species}
+    ab['m_tot']   = 1.0
+    ab['m_metal'] = Z
+    ab['H']       = 0.75 * (1.0 - Z)
+    ab['He']      = 0.25 * (1.0 - Z)
+    return ab
+
+def stellar_masses(N, seed = 12345):
+    """
+    N birth masses from 1 - 100 Msun, drawn from a Salpeter slope
+    """
+    rng = np.random.default_rng(seed)
+    x   = rng.random(N)
+    a   = -1.35
+    return (1.0 + x * (100.0**a - 1.0))**(1.0 / a)
+
+def make_stars(N, params, Z = 0.001, t_max = 50.0, seed = 12345):
+    """
+    N new stars with formation times spread over t_max (code units), so
+    at t_max they are at all stages of their lives. Above
+    max_distinct_stars the birth masses (and so the properties) of the
+    first max_distinct_stars stars repeat.
+    """
+
+    n   = min(N, max_distinct_stars)
+    key = (n, Z, seed)
+
+    if not (key in _star_columns):
+        ab = abundances(Z)
+        M  = stellar_masses(n, seed)
+
+        stars = [star.Star(M = M[i], Z = Z, abundances = ab, tform = 0.0,
+                           params = params, write_abundances = False) for i in range(n)]
+
+        _star_columns[key] = star.StarList(stars, run_config = params.run_config).as_columns()
+
+    columns = _star_columns[key]
+    index   = np.arange(N) % n
+
+    copy = {'species'                : columns['species'],
+            'wind_ejecta_abundances' : columns['wind_ejecta_abundances'][index],
+            'sn_ejecta_masses'       : columns['sn_ejecta_masses'][index]}
+    for name in ['attributes', 'properties', 'present']:
+        copy[name] = {k : v[index] for k, v in columns[name].items()}
+
+    copy['attributes']['id']    = np.arange(N, dtype = np.int64)
+    copy['attributes']['tform'] = np.random.default_rng(seed + 1).random(N) * t_max
+
+    return star.StarList.from_columns(copy, run_config = params.run_config).stars()
+
+def accumulators():
+    """
+    Ejecta and special mass accumulators as used by Zone._evolve_stars
+    """
+    return ({e : 0.0 for e in species}, {e : 0.0 for e in species}, {'m_massive' : 0.0})
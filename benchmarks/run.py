@@ -0,0 +1,231 @@
+"""
+    Run the benchmarks and write the results as JSON, or compare two
+    result files:
+
+        $ python -m benchmarks.run [--quick] [--filter REGEX] [--output FILE]
+        $ python -m benchmarks.run compare OLD.json NEW.json [--threshold 1.1]
+
+    Each benchmark is timed repeat times (class attribute, default 5),
+    each time over number calls (class attribute, or chosen so a timing
+    takes at least 0.2 s), and the time per call is recorded. --quick
+    uses only the first value of each parameter and one repeat.
+"""
+
+import argparse
+import datetime
+import importlib
+import inspect
+import itertools
+import json
+import os
+import pkgutil
+import platform
+import re
+import subprocess
+import sys
+import timeit
+
+import numpy as np
+
+_benchmark_dir = os.path.dirname(os.path.abspath(__file__))
+_default_repeat = 5
+
+def _my_print(string):
+    print("[Benchmarks]: " + string)
+
+def discover(pattern = None):
+    """
+    (name, class, method name) of every benchmark in the bench_*
+    modules, where name is module.class.method, optionally only those
+    whose name matches the regular expression pattern
+    """
+
+    benchmarks = []
+
+    for info in pkgutil.iter_modules([_benchmark_dir]):
+        if not info.name.startswith('bench_'):
+            continue
+
+        module = importlib.import_module(__package__ + '.' + info.name)
+
+        for cname, cls in inspect.getmembers(module, inspect.isclass):
+            if cls.__module__ != module.__name__:
+                continue
+
+            for mname in sorted(dir(cls)):
+                if not mname.startswith('time_'):
+                    continue
+
+                name = "%s.%s.%s"%(info.name, cname, mname)
+                if (pattern is None) or re.search(pattern, name):
+                    benchmarks.append((name, cls, mname))
+
+    return benchmarks
+
+def _param_sets(cls, quick = False):
+    params = getattr(cls, 'params', [])
+    if len(params) == 0:
+        return [()]
+    if quick:
+        params = [p[:1] for p in params]
+    return list(itertools.product(*params))
+
+def time_benchmark(cls, mname, params, repeat = None):
+    """
+    Time one benchmark method for one set of params. Returns a
+    dictionary of seconds per call (min, median, mean, std) and the
+    number of calls and repeats behind them.
+    """
+
+    instance = cls()
+
+    if hasattr(instance, 'setup'):
+        instance.setup(*params)
+
+    try:
+        method = getattr(instance, mname)
+        timer  = timeit.Timer(lambda : method(*params))
+
+        number = getattr(cls, 'number', 0)
+        if number <= 0:
+            number, _ = timer.autorange()
+
+        if repeat is None:
+            repeat = getattr(cls, 'repeat', _default_repeat)
+
+        times = np.array(timer.repeat(repeat = repeat, number = number)) / number
+
+    finally:
+        if hasattr(instance, 'teardown'):
+            instance.teardown(*params)
+
+    return {'min'    : float(np.min(times)),
+            'median' : float(np.median(times)),
+            'mean'   : float(np.mean(times)),
+            'std'    : float(np.std(times)),
+            'number' : int(number),
+            'repeat' : int(np.size(times))}
+
+def _git(*args):
+    try:
+        return subprocess.check_output(['git'] + list(args), cwd = _benchmark_dir,
+                                       stderr = subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment():
+    """
+    Revision and machine the benchmarks ran on
+    """
+
+    import h5py
+
+    status = _git('status', '--porcelain', '--untracked-files=no')
+
+    return {'revision' : _git('rev-parse', 'HEAD'),
+            'dirty'    : None if status is None else len(status) > 0,
+            'date'     : datetime.datetime.now().isoformat(),
+            'machine'  : platform.node(),
+            'platform' : platform.platform(),
+            'processor': platform.processor(),
+            'python'   : platform.python_version(),
+            'numpy'    : np.__version__,
+            'h5py'     : h5py.__version__}
+
+def run(pattern = None, quick = False, output = None):
+    """
+    Run the benchmarks and write the results to output (default
+    results/<revision>.json). Returns the results.
+    """
+
+    env     = environment()
+    results = {}
+
+    for name, cls, mname in discover(pattern):
+        results[name] = {'param_names' : list(getattr(cls, 'param_names', [])),
+                         'results'     : []}
+
+        for params in _param_sets(cls, quick):
+            stats = time_benchmark(cls, mname, params, repeat = 1 if quick else None)
+            stats['params'] = list(params)
+            results[name]['results'].append(stats)
+
+            _my_print("%-60s %-30s %10.4E s"%(name, str(params), stats['median']))
+
+    if output is None:
+        output = os.path.join(_benchmark_dir, 'results',
+                              (env['revision'] or 'unknown')[:12] + ('-dirty' if env['dirty'] else '') + '.json')
+
+    if not os.path.isdir(os.path.dirname(os.path.abspath(output))):
+        os.makedirs(os.path.dirname(os.path.abspath(output)))
+
+    with open(output, 'w') as f:
+        json.dump({'environment' : env, 'quick' : quick, 'benchmarks' : results}, f, indent = 1)
+
+    _my_print("Results written to " + output)
+
+    return results
+
+def compare(old_file, new_file, threshold = 1.1):
+    """
+    Print the ratio of new to old median time of every benchmark in
+    both files, marking changes beyond threshold. Returns the list of
+    (name, params, ratio).
+    """
+
+    with open(old_file, 'r') as f:
+        old = json.load(f)
+    with open(new_file, 'r') as f:
+        new = json.load(f)
+
+    ratios = []
+
+    for name in sorted(set(old['benchmarks']) & set(new['benchmarks'])):
+        old_times = {json.dumps(r['params']) : r['median'] for r in old['benchmarks'][name]['results']}
+
+        for r in new['benchmarks'][name]['results']:
+            key = json.dumps(r['params'])
+            if not (key in old_times) or old_times[key] <= 0:
+                continue
+
+            ratio = r['median'] / old_times[key]
+            ratios.append((name, r['params'], ratio))
+
+            mark = ''
+            if ratio > threshold:
+                mark = 'slower'
+            elif ratio < 1.0 / threshold:
+                mark = 'faster'
+
+            print("%-60s %-30s %10.4E %10.4E %7.3f %s"%(name, str(r['params']), old_times[key],
+                                                        r['median'], ratio, mark))
+
+    return ratios
+
+def main(argv = None):
+
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if len(argv) > 0 and argv[0] == 'compare':
+        parser = argparse.ArgumentParser(prog = 'python -m benchmarks.run compare')
+        parser.add_argument('old')
+        parser.add_argument('new')
+        parser.add_argument('--threshold', type = float, default = 1.1)
+        args = parser.parse_args(argv[1:])
+
+        compare(args.old, args.new, args.threshold)
+        return
+
+    parser = argparse.ArgumentParser(prog = 'python -m benchmarks.run')
+    parser.add_argument('--filter', default = None, help = 'regular expression on benchmark names')
+    parser.add_argument('--quick',  action = 'store_true', help = 'first parameter values, one repeat')
+    parser.add_argument('--output', default = None, help = 'results file (default results/<revision>.json)')
+    args = parser.parse_args(argv)
+
+    run(args.filter, args.quick, args.output)
+
+    return
+
+if __name__ == "__main__":
+    main()
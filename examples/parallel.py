@@ -1,13 +1,11 @@
 #
 # Example useage for a parallel run
 #
-import numpy as np
-from joblib import Parallel, delayed
 import multiprocessing
-import sys, glob
+import sys
 
 # onezone imports
-from onezone import zone, imf, config
+from onezone import imf, config, ensemble
 from onezone.constants import CONST as const
 
 #------------------------------------
@@ -35,26 +33,12 @@ config.io.dt_dump                = 500.0
 #
 
 # ------------------- Set up and run a parallel run -------
-
-run_basename = "run%0004i"
-summary_basename = "_summary_output.txt"
-istart = len(glob.glob("*_summary_output.txt"))
-
-def run(i):
-  # runs one instance of the one zone model
-  np.random.seed(i) # set different seed on each process
-  config.io.summary_output_filename = run_basename%(istart+i) + summary_basename
-  config.io.dump_output_basename    = run_basename%(istart+i) + '_dump'
-  config.io.abundance_output_filename = run_basename%(istart+i) + '_abundances.dat'
-
-  sim = zone.Zone()
-  sim.set_initial_abundances(config.zone.species_to_track)
-
-  sim.evolve()
-
-  del(sim)
-  return
-
+#
+# Each member is a copy of the above parameters, with the values below
+# changed (here, just different random realizations). Members are seeded
+# with their index. Re-running picks up where an interrupted run left off,
+# using the manifest written to output_dir.
+#
 
 if __name__ == "__main__":
 
@@ -63,9 +47,15 @@ if __name__ == "__main__":
     n_simulations = n_jobs*1
 
     if len(sys.argv) > 1:
-        n_simulations = int(sys.argv[1]))
+        n_simulations = int(sys.argv[1])
     if len(sys.argv) > 2:
         n_jobs = int(sys.argv[2])
 
-    Parallel(n_jobs=n_jobs)(delayed(run)(i) for i in np.arange(n_simulations))
+    ens = ensemble.Ensemble(config.default_run_config(), [{}],
+                            n_realizations   = n_simulations,
+                            seed_policy      = 'index',
+                            output_dir       = '.',
+                            run_basename     = 'run%0004i',
+                            write_abundances = True)
 
+    ens.run(n_workers = n_jobs)
@@ -1,6 +1,7 @@
 import matplotlib.pyplot as plt
 from astropy import units as u
 from onezone.analysis import analysis_tools
+from onezone.io import SummaryTable
 import numpy as np
 
 import os
@@ -182,6 +183,6 @@ if __name__ == "__main__":
 
     print(sys.argv)
     if sys.argv[1] == "2D":
-        data = np.genfromtxt( str(sys.argv[2]), names = True)
+        data = SummaryTable( str(sys.argv[2]) ).as_records()
 
         plot_2D( data, str(sys.argv[3]), str(sys.argv[4]))
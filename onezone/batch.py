@@ -0,0 +1,372 @@
+"""
+
+    Author : A. Emerick
+
+    Purpose: Evolve many zones with different gas parameters
+             together, in lockstep
+
+"""
+
+__author__ = "aemerick <emerick@astro.columbia.edu>"
+
+# external
+import numpy as np
+import os
+
+# internal
+from . import zone as zone
+
+#
+# gas laws that ZoneBatch evaluates across the whole batch at once
+#
+_batch_star_formation_methods = [0, 1, 2]
+_batch_mass_outflow_methods   = [0, 1]
+
+class ZoneBatch:
+    """
+    ZoneBatch Class
+
+    Advances K zones one cycle at a time. Each zone keeps its own
+    RunConfig, timestep, star population, and outputs, and gives the
+    same results in the same number of cycles as when run alone. The
+    gas state is held as (K, N_species) arrays and the star formation,
+    outflow, and inflow laws and the gas update are evaluated for all
+    zones at once. Stellar evolution, timestep, and output work is still
+    done zone by zone, so this saves only the per-zone gas update
+    overhead and is at best a little faster than running the zones one
+    after another. Intended for parameter sweeps over e.g.
+    mass_loading_factor, inflow_factor, SFR_efficiency, or
+    initial_metallicity:
+
+        >>> rc = config.default_run_config().copy()
+        >>> rc.zone.species_to_track = ['m_tot','m_metal','H','He','O','Fe']
+        >>> rc.zone.mass_outflow_method = 1
+        >>> batch = ZoneBatch.from_sweep(rc, {'mass_loading_factor' : [1.0, 5.0, 10.0]})
+        >>> batch.set_initial_abundances(rc.zone.species_to_track)
+        >>> batch.evolve()
+        >>> batch.zones[1].M_gas
+
+    All zones must share t_o, t_final, and species_to_track and use
+    star_formation_method 0, 1, or 2 with (non-cosmological)
+    mass_outflow_method 0 (no outflow) or 1. Stars are evolved zone by
+    zone.
+    """
+
+    def __init__(self, run_configs):
+
+        if len(run_configs) == 0:
+            _my_print("Must provide at least one RunConfig")
+            raise ValueError
+
+        for rc in run_configs:
+            if not (rc.zone.star_formation_method in _batch_star_formation_methods) or\
+               not (rc.zone.mass_outflow_method in _batch_mass_outflow_methods) or\
+               rc.zone.cosmological_evolution:
+                _my_print("Only star_formation_method in " + str(_batch_star_formation_methods) +\
+                          " and non-cosmological mass_outflow_method in " +\
+                          str(_batch_mass_outflow_methods) + " can be batched")
+                raise ValueError
+
+            for name in ['t_o', 't_final']:
+                if getattr(rc.zone, name) != getattr(run_configs[0].zone, name):
+                    _my_print("All zones in a batch must share " + name)
+                    raise ValueError
+
+        self.run_configs = list(run_configs)
+        self.zones       = [zone.Zone(run_config = rc) for rc in self.run_configs]
+
+        self._cycle_number = 0
+
+        return
+
+    @classmethod
+    def from_sweep(cls, base_config, parameters):
+        """
+        Make a batch from copies of base_config, one for each set of
+        zone parameter values in parameters, a dictionary of
+        zone parameter name -> list of values (all lists the same
+        length). Output file names get the zone index appended.
+        """
+
+        values = list(parameters.values())
+        nzones = len(values[0])
+
+        for v in values:
+            if len(v) != nzones:
+                _my_print("All parameter value lists must be the same length")
+                raise ValueError
+
+        run_configs = []
+        for i in range(nzones):
+            rc = base_config.copy()
+
+            for name, v in parameters.items():
+                setattr(rc.zone, name, v[i])
+
+            for name in ['dump_output_basename', 'pickle_output_basename',
+                         'checkpoint_basename']:
+                if not getattr(rc.io, name) is None:
+                    setattr(rc.io, name, getattr(rc.io, name) + "_%0004i"%(i))
+
+            for name in ['summary_output_filename', 'event_output_filename',
+                         'memory_output_filename']:
+                if not getattr(rc.io, name) is None:
+                    root, ext = os.path.splitext(getattr(rc.io, name))
+                    setattr(rc.io, name, root + "_%0004i"%(i) + ext)
+
+            for name in ['profile_filename', 'trace_filename']:
+                root, ext = os.path.splitext(getattr(rc.global_values, name))
+                setattr(rc.global_values, name, root + "_%0004i"%(i) + ext)
+
+            run_configs.append(rc)
+
+        return cls(run_configs)
+
+    @property
+    def N_zones(self):
+        return len(self.zones)
+
+    def set_initial_abundances(self, elements, abundances = None):
+        """
+        Set the same initial abundances (see Zone.set_initial_abundances)
+        in all zones
+        """
+
+        for z in self.zones:
+            z.set_initial_abundances(elements, abundances)
+
+        return
+
+    def _gather_state(self):
+        """
+        Copy gas state from the zones into batch arrays
+        """
+
+        self.species = list(self.zones[0].species_masses.keys())
+
+        for z in self.zones:
+            if list(z.species_masses.keys()) != self.species:
+                _my_print("All zones in a batch must track the same species")
+                raise ValueError
+
+        self.M_gas         = np.array([z.M_gas for z in self.zones])
+        self.Z             = np.array([z.Z     for z in self.zones])
+        self.species_masses = np.array([[z.species_masses[e] for e in self.species] for z in self.zones])
+        self.halo_masses   = np.array([[z.halo_masses[e]    for e in self.species] for z in self.zones])
+
+        self._inflow_abundances = np.array([self.zones[0].Mdot_in_abundances(e) for e in self.species])
+        self._i_metal           = self.species.index('m_metal')
+
+        #
+        # per-zone parameters
+        #
+        zp = [z.config.zone for z in self.zones]
+        self._star_formation_method = np.array([p.star_formation_method for p in zp])
+        self._constant_SFR          = np.array([p.constant_SFR          for p in zp])
+        self._SFR_efficiency        = np.array([p.SFR_efficiency        for p in zp])
+        #
+        # mass_outflow_method 0 has no outflow (and so no inflow)
+        #
+        self._mass_loading_factor   = np.array([p.mass_loading_factor if p.mass_outflow_method == 1 else 0.0
+                                                for p in zp])
+        self._inflow_factor         = np.array([p.inflow_factor         for p in zp])
+        self._constant_metallicity  = np.array([p.constant_metallicity  for p in zp], dtype = bool)
+        self._event_timestep        = np.array([p.event_timestep        for p in zp], dtype = bool)
+        self._discrete_outflow      = np.array([p.use_SF_mass_reservoir or\
+                                                p.use_stochastic_mass_sampling for p in zp], dtype = bool)
+
+        return
+
+    def _scatter_state(self, active):
+        """
+        Copy gas state from the batch arrays back into the active zones
+        """
+
+        for k in active:
+            z = self.zones[k]
+            z.M_gas          = self.M_gas[k]
+            z.Z              = self.Z[k]
+            z.species_masses = dict(zip(self.species, self.species_masses[k].tolist()))
+            z.halo_masses    = dict(zip(self.species, self.halo_masses[k].tolist()))
+
+        return
+
+    def _compute_sfr(self, active, dt, SN_ej_tot, Mdot_ej_tot):
+        """
+        Star formation rates for active zones (see Zone._compute_sfr)
+        """
+
+        Mdot_sf = np.zeros(np.size(active))
+        method  = self._star_formation_method[active]
+
+        select = method == 1
+        Mdot_sf[select] = self._constant_SFR[active][select]
+
+        select = method == 2
+        if np.any(select):
+            M_gas = self.M_gas[active]
+
+            #
+            # step averaged gas mass with event timestepping
+            # (see Zone._step_averaged_gas_mass)
+            #
+            k = self._SFR_efficiency[active] *\
+                (1.0 + self._mass_loading_factor[active] * (1.0 - self._inflow_factor[active]))
+            average = self._event_timestep[active] * (k > 0.0) * (dt > 0.0)
+
+            if np.any(average):
+                x      = np.where(average, k * dt, 1.0)
+                M_o    = M_gas + SN_ej_tot
+                M_eq   = np.where(average, Mdot_ej_tot / np.where(k > 0.0, k, 1.0), 0.0)
+                M_avg  = M_eq + (M_o - M_eq) * (-np.expm1(-x) / x)
+                M_gas  = np.where(average, M_avg, M_gas)
+
+            Mdot_sf[select] = (self._SFR_efficiency[active] * M_gas)[select]
+
+        return Mdot_sf
+
+    def evolve(self):
+        """
+        Evolve all zones until t_final, one cycle of every active zone at
+        a time. Each zone takes its own timestep, so it steps exactly as
+        it would alone and zones finish after different numbers of cycles.
+        Zones whose gas is depleted stop early, as in Zone.evolve.
+        """
+
+        self._gather_state()
+
+        active = np.arange(self.N_zones)
+
+        for z in self.zones:
+            z.config.global_values.profiler.set_context(z._cycle_number, z.t, z.N_stars)
+            z.config.global_values.profiler.start_timer("total_time", True)
+            z._star_parameters.freeze()
+
+        t_final = self.zones[0].config.zone.t_final
+
+        while np.size(active) > 0:
+
+            #
+            # zones past t_final are done
+            #
+            finished = np.array([self.zones[k].t > t_final for k in active], dtype = bool)
+            for k in active[finished]:
+                self._finalize(k)
+            active = active[~finished]
+
+            if np.size(active) == 0:
+                break
+
+            zones = [self.zones[k] for k in active]
+
+            for z in zones:
+                z._star_parameters.refreeze_if_changed()
+                z._compute_dt()
+
+            dt = np.array([z.dt for z in zones])
+
+            #
+            # I) outputs, stellar evolution, and SN counts zone by zone
+            #
+            for z in zones:
+                z._check_output()
+                z._evolve_stars()
+                z._accumulate_new_sn()
+
+            Mdot_ej    = np.array([[z.Mdot_ej_masses[e] for e in self.species] for z in zones])
+            SN_ej      = np.array([[z.SN_ej_masses[e]   for e in self.species] for z in zones])
+            i_tot      = self.species.index('m_tot')
+
+            #
+            # II) SFR across the batch, then form stars in each zone
+            #
+            Mdot_sf = self._compute_sfr(active, dt, SN_ej[:,i_tot], Mdot_ej[:,i_tot])
+
+            M_sf = np.zeros(np.size(active))
+            for i, z in enumerate(zones):
+                z.Mdot_sf = Mdot_sf[i]
+                z.M_sf    = z._make_new_stars()
+                M_sf[i]   = z.M_sf
+
+            #
+            # III) outflow and inflow across the batch
+            #
+            Mdot_out = self._mass_loading_factor[active] *\
+                           np.where(self._discrete_outflow[active], M_sf / dt, Mdot_sf)
+            Mdot_in  = self._inflow_factor[active] * Mdot_out
+
+            #
+            # IV) gas update. As in Zone.evolve, outflow method 1 does not
+            #     remove individual species
+            #
+            M_gas      = self.M_gas[active]
+            abundances = self.species_masses[active] / M_gas[:,None]
+
+            new_gas_mass = M_gas + (Mdot_in + Mdot_ej[:,i_tot] - Mdot_out) * dt - M_sf + SN_ej[:,i_tot]
+
+            depleted = M_gas <= 0
+            if np.any(depleted):
+                for k in active[depleted]:
+                    self.M_gas[k]          = 0.0
+                    self.zones[k].M_gas    = 0.0
+                    _my_print("Gas in zone %i depleted. Ending simulation for this zone"%(k))
+                    self._finalize(k)
+
+                keep       = ~depleted
+                active     = active[keep]
+                zones      = [z for z, kp in zip(zones, keep) if kp]
+                Mdot_ej    = Mdot_ej[keep]
+                SN_ej      = SN_ej[keep]
+                M_sf       = M_sf[keep]
+                Mdot_out   = Mdot_out[keep]
+                Mdot_in    = Mdot_in[keep]
+                dt         = dt[keep]
+                abundances = abundances[keep]
+                new_gas_mass = new_gas_mass[keep]
+
+                if np.size(active) == 0:
+                    break
+
+            self.species_masses[active] = self.species_masses[active] +\
+                                              (Mdot_in[:,None] * self._inflow_abundances[None,:] +\
+                                               Mdot_ej) * dt[:,None] - M_sf[:,None] * abundances + SN_ej
+
+            self.M_gas[active] = new_gas_mass
+
+            update_Z = active[~self._constant_metallicity[active]]
+            self.Z[update_Z] = self.species_masses[update_Z, self._i_metal] / self.M_gas[update_Z]
+
+            self._scatter_state(active)
+
+            #
+            # V) advance time
+            #
+            self._cycle_number += 1
+            for i, z in enumerate(zones):
+                z.Mdot_out = Mdot_out[i]
+                z.Mdot_in  = Mdot_in[i]
+                z.t       += dt[i]
+                z._cycle_number += 1
+                z._update_globals()
+                z._check_memory()
+                z.config.global_values.profiler.end_cycle(z._cycle_number, z.t, z.N_stars)
+
+        return
+
+    def _finalize(self, k):
+        """
+        End of run for zone k: force outputs and clean up
+        """
+
+        z = self.zones[k]
+
+        z.config.global_values.profiler.end_timer("total_time")
+        z.config.global_values.profiler.write_performance(cycle = z._cycle_number, time = z.t)
+        z.config.global_values.profiler.write_trace()
+        z._check_output(force=True)
+        z._clean_up()
+
+        return
+
+def _my_print(string):
+    print("[ZoneBatch]: " + string)
@@ -11,15 +11,39 @@ from .constants import CONST as const
 from . import performance_tools as perf
 
 import os
+import copy
+import json
+import queue
+import threading
+import tracemalloc
 
 #
 # --------- Superclass for all parameters -------
 #
+# every time a parameter is set this counter is bumped, so code that
+# caches parameter values (e.g. the star kernel parameter struct) can
+# cheaply check whether it needs to refresh. In place modification of
+# list / dict valued parameters is not tracked - reassign them instead.
+#
+_parameter_version = 0
+
+def parameter_version():
+    """
+    Counter incremented every time any parameter is set
+    """
+    return _parameter_version
+
 class _parameters(object):
 
     def __init__(self):
         pass
 
+    def __setattr__(self, name, value):
+        global _parameter_version
+        _parameter_version += 1
+        object.__setattr__(self, name, value)
+        return
+
     def help(self):
         print(self.__doc__)
         return
@@ -33,15 +57,45 @@ class _globals(_parameters):
     Global values for setting code behavior
     """
 
+    # time and profiler change every step and are not cached anywhere,
+    # so skip the version counter
+    __setattr__ = object.__setattr__
+
     def __init__(self):
 
         self.time = 0.0
 
-        self.profile_performance = False
-        self.profiler = None # perf.PerformanceTimer()
+        #
+        # profile_performance turns on the timers (see performance_tools),
+        # whose totals are appended to profile_filename every
+        # profile_output_interval cycles and at the end of the run.
+        # With trace_size > 0 the last trace_size timer begin / end
+        # events are kept and written to trace_filename at the end of
+        # the run as Chrome trace event JSON.
+        #
+        # sample_profile turns on the sampling profiler in Zone.evolve,
+        # which samples the stack every sample_interval seconds of CPU
+        # time and writes folded stacks to sample_filename at the end
+        #
+        self.profile_performance     = False
+        self.profile_filename        = 'performance.jsonl'
+        self.profile_output_interval = 100
+        self.trace_size              = 0
+        self.trace_filename          = 'trace.json'
+        self.sample_profile          = False
+        self.sample_interval         = 0.01
+        self.sample_filename         = 'profile.folded'
+        self.profiler = None # perf.Profiler()
 
         return
 
+    def __getstate__(self):
+        # the profiler (and its trace buffer) belongs to the running
+        # process and is made new by each Zone
+        state = self.__dict__.copy()
+        state['profiler'] = None
+        return state
+
 global_values = _globals()
 
 #
@@ -197,6 +251,34 @@ class _zone_parameters(_parameters):
          track_massive_star_ejecta_mass (float, optional): Mass threshold in Msun above which
                     ejecta is tracked separately as "massive" stars. Default : 25.0
 
+         event_timestep (bool, optional) : When used with ``adaptive_timestep'', align
+             the timestep with the next scheduled event (star death, start of an
+             AGB wind phase, Type Ia supernova, or output time) and take large steps
+             between events once star formation has stopped. The gas mass is
+             integrated exactly over these long steps. The reason for each chosen
+             dt is reported in the summary output. Default : False
+         event_timestep_min_dt (float, optional) : Smallest timestep (in Myr) taken
+             when stepping between events, which batches closely spaced events
+             into a single step. Default : 1.0
+         event_timestep_max_dt (float, optional) : Largest timestep (in Myr) taken
+             when stepping between events once star formation has stopped (or
+             with none), in place of ``max_dt''. Default : 1000.0
+
+         random_seed (int, optional) : Seed for the zone's random number
+             generator. Each zone draws from its own numpy Generator, with
+             independent streams for IMF sampling, stochastic star formation,
+             and Type Ia supernova delay times, so results do not depend on
+             what else runs in the same process. If None, the seed is drawn
+             from the global numpy random state (so np.random.seed still makes
+             runs repeatable). Default : None
+
+         totals_check_cycle (int, optional) : The star list keeps running totals
+             (stellar mass, luminosities, ionizing photon rates, counts by
+             type) for the summary output rather than summing over every
+             star each time. Every this many cycles they are recomputed from
+             all of the stars to clear round-off drift. 0 never recomputes.
+             Default : 100
+
 
     """
 
@@ -259,6 +341,14 @@ class _zone_parameters(_parameters):
         self.max_dt                   = 100.0           # Myr (max dt to use when adaptive)
         self.adaptive_timestep        = True
         self.timestep_safety_factor   = 4
+        self.event_timestep           = False           # step between upcoming stellar / output events
+        self.event_timestep_min_dt    = 1.0             # Myr (floor on event aligned dt)
+        self.event_timestep_max_dt    = 1000.0          # Myr (max_dt for event aligned dt without star formation)
+
+        self.random_seed              = None            # None: draw from np.random
+
+        self.totals_check_cycle       = 100             # cycles between full recomputes of
+                                                        # the running star totals (0: never)
 
 
         self._maximum_stars      = None
@@ -382,11 +472,25 @@ stars = _star_particle_parameters()
 # ----------------- Input and Output --------------
 #
 class chunked_hdf5_buffer():
+    """
+    Rows of values kept in memory and appended to an extendable HDF5
+    dataset one full chunk at a time. Rows are added in blocks with
+    append. With background, full chunks are written by a
+    background_writer thread (or by writer, if given). compression may
+    be None, 'lzf', or 'gzip' (with compression_opts the gzip level).
+    Several buffers can share one open file, h5f, each with its own
+    dataset name. dtype is that of the dataset (h5py's default float32
+    if None).
+    """
 
     def __init__(self, filename, headers=None, compression = 'gzip',
-                                 chunks=None, maxshape=None, overwrite=True):
+                                 chunks=None, maxshape=None, overwrite=True,
+                                 compression_opts = None, background = False,
+                                 name = 'abundances', h5f = None, writer = None,
+                                 dtype = None):
 
         self.filename = filename
+        self.name     = name
 
         self.headers = headers
 
@@ -397,7 +501,8 @@ class chunked_hdf5_buffer():
             else:
                 self.maxshape = (None, len(self.headers))
 
-        self.compression = compression
+        self.compression      = compression
+        self.compression_opts = compression_opts if compression == 'gzip' else None
 
         self.chunks = chunks
         if self.chunks is None:
@@ -407,39 +512,99 @@ class chunked_hdf5_buffer():
             else:
                 self.chunks = (1000, len(headers))
 
-        if (not overwrite) and os.path.isfile(self.filename):
-            self.h5f     = h5py.File(filename, 'a')
-            self.dataset = self.h5f['abundances']
+        self._owns_file = h5f is None
+        if self._owns_file:
+            if (not overwrite) and os.path.isfile(self.filename):
+                h5f = h5py.File(filename, 'a')
+            else:
+                h5f = h5py.File(filename, 'w')
+        self.h5f = h5f
+
+        if name in self.h5f:
+            self.dataset = self.h5f[name]
         else:
-            self.h5f     = h5py.File(filename, 'w')
-            self.h5f.attrs.create('names', self.headers)
-            self.dataset = self.h5f.create_dataset("abundances",
+            if name == 'abundances':
+                self.h5f.attrs.create('names', self.headers)
+            self.dataset = self.h5f.create_dataset(name,
                                                     shape=(0,self.chunks[1]),
                                                     maxshape=self.maxshape,
+                                                    dtype=dtype,
                                                     compression=self.compression,
+                                                    compression_opts=self.compression_opts,
                                                     chunks=self.chunks)
+            self.dataset.attrs.create('names', self.headers)
+
+        self.rows_written = self.dataset.shape[0] # including rows still queued
+
+        self._owns_writer = writer is None
+        if self._owns_writer:
+            writer = background_writer(2) if background else None
+        self.writer = writer
+
         self.count  = 0
         self._empty_element_flag = -9999.0
         self.buffer = np.ones(self.chunks) * self._empty_element_flag
         return
 
+    def append(self, rows):
+        """
+        Add a (N, N_columns) block of rows (or a single row), writing out
+        each chunk as it fills
+        """
+
+        rows  = np.atleast_2d(rows)
+        n     = np.shape(rows)[0]
+        start = 0
+
+        while start < n:
+            nfill = min(self.chunks[0] - self.count, n - start)
+
+            self.buffer[self.count:self.count + nfill] = rows[start:start + nfill]
+            self.count += nfill
+            start      += nfill
+
+            self.flush()
+
+        return
+
     def flush(self, force=False):
+        """
+        Write out the buffer if it is full (or, with force, if it has any rows)
+        """
 
-        old_shape = self.dataset.shape
+        if self.count == 0 or ((not force) and self.count < self.chunks[0]):
+            return
 
-        if not force:
-            if not (self.count == (self.chunks[0] - 1)):
-                return
+        rows = self.buffer[:self.count].copy()
+        self.rows_written += self.count
 
-        new_shape = (old_shape[0] + self.count,old_shape[1])
-        self.resize(new_shape)
+        if self.writer is None:
+            self._write_rows(rows)
+        else:
+            self.writer.submit(self._write_rows, rows)
+
+        self.reset_buffer()
+
+        return
 
-        self.dataset[old_shape[0]:new_shape[0],] = self.buffer[:self.count,]
+    def _write_rows(self, rows):
+
+        old_shape = self.dataset.shape
+        new_shape = (old_shape[0] + np.shape(rows)[0], old_shape[1])
+        self.dataset.resize(new_shape)
+
+        self.dataset[old_shape[0]:new_shape[0],] = rows
 
         self.h5f.flush() # actually write to file
 
-        self.reset_buffer()
+        return
 
+    def wait(self):
+        """
+        Wait for rows queued for the background writer to be written
+        """
+        if not (self.writer is None):
+            self.writer.flush()
         return
 
     def reset_buffer(self):
@@ -448,48 +613,677 @@ class chunked_hdf5_buffer():
         return
 
     def resize(self, new_size = None):
+        self.wait()
         if (new_size is None):
             new_size = (self.dataset.shape[0] + self.chunks[0], self.dataset.shape[1])
         self.dataset.resize(new_size)
+        self.rows_written = new_size[0]
+        return
+
+    def truncate(self, rows):
+        """
+        Cut the dataset back to its first rows rows. Asking for more rows
+        than were written is an error, rather than padding with zeros
+        """
+        self.wait()
+        if rows > self.rows_written:
+            print("HDF5 buffer error. Cannot truncate %i rows to %i"%(self.rows_written, rows))
+            raise ValueError
+
+        self.resize( (rows, self.dataset.shape[1]) )
         return
 
     def close(self):
 
-        if self.count > 0: # still some data that hasn't been written
-            self.flush(force=True)
-        else:
+        self.flush(force=True) # still some data that hasn't been written
+
+        if not (self.writer is None) and self._owns_writer:
+            self.writer.close()
+            self.writer = None
+
+        if self._owns_file:
             self.h5f.flush()
+            self.h5f.close()
+        return
+
+class abundance_output():
+    """
+    Output of the gas abundances each star formed from. With format
+    'events', each star formation event (tform, Z, and the abundance of
+    each species) is written once, to the 'events' dataset, and each
+    star gets a short row (id, M, lifetime, event index) in the 'stars'
+    dataset. Format 'rows' writes one full row per star (tform, id, M,
+    Z, lifetime, and each species) to 'abundances', as in older
+    versions. Read either back with abundance_table.
+    """
+
+    def __init__(self, filename, species, format = 'events', compression = 'gzip',
+                       compression_opts = None, overwrite = True, background = False):
+
+        if not (format in ['events', 'rows']):
+            print("Abundance output format must be 'events' or 'rows'")
+            raise ValueError
+
+        self.filename = filename
+        self.species  = list(species)
+        self.format   = format
+
+        if (not overwrite) and os.path.isfile(filename):
+            self.h5f = h5py.File(filename, 'a')
+        else:
+            self.h5f = h5py.File(filename, 'w')
+            self.h5f.attrs['format'] = format
+
+        self.writer = background_writer(2) if background else None
+
+        kwargs = {'compression' : compression, 'compression_opts' : compression_opts,
+                  'h5f' : self.h5f, 'writer' : self.writer}
+
+        if format == 'events':
+            # float64 so star ids and event indices stay exact past 2^24
+            headers      = ['tform', 'Z'] + self.species
+            self.buffers = {'events' : chunked_hdf5_buffer(filename, headers = headers,
+                                                           chunks = (1000, len(headers)),
+                                                           name = 'events', dtype = np.float64,
+                                                           **kwargs),
+                            'stars'  : chunked_hdf5_buffer(filename, headers = ['id', 'M', 'lifetime', 'event'],
+                                                           chunks = (10000, 4),
+                                                           name = 'stars', dtype = np.float64,
+                                                           **kwargs)}
+        else:
+            headers      = ['tform', 'id', 'M', 'Z', 'lifetime'] + self.species
+            self.buffers = {'abundances' : chunked_hdf5_buffer(filename, headers = headers,
+                                                               chunks = (10000, len(headers)),
+                                                               name = 'abundances', **kwargs)}
+
+        return
+
+    def add_stars(self, tform, Z, abundances, ids, masses, lifetimes):
+        """
+        Add the stars formed in one event, at time tform from gas with
+        metallicity Z and species abundances (in the order of species)
+        """
+
+        N = np.size(ids)
+        if N == 0:
+            return
+
+        if self.format == 'events':
+            events = self.buffers['events']
+            event  = events.rows_written + events.count
+
+            events.append( [tform, Z] + list(abundances) )
+
+            rows = np.empty( (N, 4) )
+            rows[:,0] = ids
+            rows[:,1] = masses
+            rows[:,2] = lifetimes
+            rows[:,3] = event
+            self.buffers['stars'].append(rows)
+
+        else:
+            rows = np.empty( (N, 5 + len(self.species)) )
+            rows[:,0]  = tform
+            rows[:,1]  = ids
+            rows[:,2]  = masses
+            rows[:,3]  = Z
+            rows[:,4]  = lifetimes
+            rows[:,5:] = abundances
+            self.buffers['abundances'].append(rows)
+
+        return
+
+    def flush(self, force = False):
+        for b in self.buffers.values():
+            b.flush(force = force)
+        return
+
+    def wait(self):
+        if not (self.writer is None):
+            self.writer.flush()
+        return
+
+    @property
+    def rows_written(self):
+        return {k : b.rows_written for k, b in self.buffers.items()}
+
+    def truncate(self, rows):
+        """
+        Cut the datasets back to the given numbers of rows (as from rows_written)
+        """
+        self.wait()
+        for k, n in rows.items():
+            self.buffers[k].truncate(n)
+        return
+
+    def close(self):
+
+        for b in self.buffers.values():
+            b.close()
+
+        if not (self.writer is None):
+            self.writer.close()
+            self.writer = None
+
+        self.h5f.flush()
+        self.h5f.close()
+        return
+
+class event_log():
+    """
+    Stellar events as they happen: one row per event of time, star id,
+    birth mass, metallicity, event type (index in event_log.types), and
+    the SN ejecta mass of each species. Rows go into a preallocated
+    ring buffer of size rows. With filename, the buffer is drained to
+    the extendable 'events' dataset in that file whenever it fills (and
+    on flush); otherwise the oldest rows are overwritten. counts keeps
+    the number of events of each type.
+    """
+
+    types      = ['SNII', 'SNIa', 'WD', 'direct_collapse']
+
+    # star types a star takes on in the step of each event
+    star_types = {'new_remnant'         : 0,
+                  'new_SNIa_remnant'    : 1,
+                  'new_WD'              : 2,
+                  'new_direct_collapse' : 3}
+
+    def __init__(self, species, size = 1024, filename = None, compression = 'gzip',
+                       compression_opts = None, overwrite = True, background = False):
+
+        self.species  = list(species)
+        self.names    = ['t', 'id', 'M_o', 'Z', 'event'] + self.species
+        self.filename = filename
+
+        self.rows     = np.zeros( (max(size, 1), len(self.names)) )
+        self.count    = 0     # rows in the buffer
+        self.start    = 0     # oldest row in the buffer
+        self.N_events = 0     # all events added
+
+        self.counts   = np.zeros(len(self.types), dtype = np.int64)
+        self._counted = np.zeros(len(self.types), dtype = np.int64)
+
+        self.output = None
+        if not (filename is None):
+            self.output = chunked_hdf5_buffer(filename, headers = self.names,
+                                              compression = compression,
+                                              compression_opts = compression_opts,
+                                              chunks = np.shape(self.rows),
+                                              overwrite = overwrite, dtype = np.float64,
+                                              background = background, name = 'events')
+        return
+
+    def add(self, t, id, M_o, Z, star_type, ejecta):
+        """
+        Add an event for a star that has just become star_type (a key
+        of star_types), with its SN ejecta masses (dictionary by species)
+        """
+
+        event = self.star_types[star_type]
+
+        if self.count == np.shape(self.rows)[0]:
+            if self.output is None:
+                self.start = (self.start + 1) % self.count
+                self.count -= 1
+            else:
+                self.drain()
+
+        row = self.rows[(self.start + self.count) % np.shape(self.rows)[0]]
+        row[0] = t
+        row[1] = id
+        row[2] = M_o
+        row[3] = Z
+        row[4] = event
+        for j, e in enumerate(self.species):
+            row[5 + j] = ejecta[e]
+
+        self.count         += 1
+        self.N_events      += 1
+        self.counts[event] += 1
+
+        return
+
+    def new_counts(self):
+        """
+        Number of events of each type (as a dictionary) since the last call
+        """
+
+        new = self.counts - self._counted
+        self._counted[:] = self.counts
+
+        return dict(zip(self.types, new.tolist()))
+
+    def recent(self):
+        """
+        The events still in the buffer, oldest first
+        """
+        order = (self.start + np.arange(self.count)) % np.shape(self.rows)[0]
+        return self.rows[order]
+
+    def drain(self):
+        """
+        Move the buffered events to the file
+        """
+
+        if self.output is None or self.count == 0:
+            return
+
+        self.output.append(self.recent())
+        self.count = 0
+        self.start = 0
+
+        return
+
+    def flush(self, force = False):
+
+        self.drain()
+
+        if not (self.output is None):
+            self.output.flush(force = force)
+
+        return
+
+    def wait(self):
+        if not (self.output is None):
+            self.output.wait()
+        return
+
+    @property
+    def rows_written(self):
+        return None if self.output is None else self.output.rows_written
+
+    def truncate(self, rows):
+        """
+        Cut the events dataset back to the given number of rows
+        """
+        if not (self.output is None):
+            self.output.truncate(rows)
+        return
+
+    def close(self):
+        self.drain()
+        if not (self.output is None):
+            self.output.close()
+        return
 
+class memory_log():
+    """
+    Memory use of a run, one row per record (see Zone._check_memory):
+    time, cycle, number of stars (in total and of each type in
+    star_types), resident memory and its peak, memory traced by
+    tracemalloc and its peak, estimated bytes per star and for all
+    stars, and the rows held in the summary, abundance, and event
+    buffers and the outputs queued for the background writer. Rows go
+    to the 'memory' dataset of filename, size rows at a time.
+
+    snapshot writes the largest allocation sites found by tracemalloc
+    to tracemalloc_filename, one JSON record per snapshot.
+    """
+
+    star_types = ['star', 'unresolved_star', 'massive_star', 'WD',
+                  'remnant', 'SNIa_remnant', 'direct_collapse']
+
+    names = ['t', 'cycle', 'N_stars'] + ['N_' + x for x in star_types] +\
+            ['rss', 'rss_peak', 'traced', 'traced_peak', 'bytes_per_star', 'star_bytes',
+             'summary_buffer', 'abundance_buffer', 'event_buffer', 'output_queue']
+
+    def __init__(self, filename, size = 100, tracemalloc_filename = None,
+                       compression = 'gzip', compression_opts = None,
+                       overwrite = True, background = False):
+
+        self.filename             = filename
+        self.tracemalloc_filename = tracemalloc_filename
+
+        if overwrite and not (tracemalloc_filename is None) and os.path.isfile(tracemalloc_filename):
+            os.remove(tracemalloc_filename)
+
+        self.output = chunked_hdf5_buffer(filename, headers = self.names,
+                                          compression = compression,
+                                          compression_opts = compression_opts,
+                                          chunks = (max(size, 1), len(self.names)),
+                                          overwrite = overwrite, dtype = np.float64,
+                                          background = background, name = 'memory')
+
+        self._started_tracing = False
+
+        return
+
+    def add(self, values):
+        """
+        Add a row from a dictionary of values by name (missing names are zero)
+        """
+        self.output.append(np.array([values.get(k, 0.0) for k in self.names], dtype = np.float64))
+        return
+
+    def start_tracing(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        return
+
+    def snapshot(self, cycle, t, limit = 20):
+        """
+        Write the limit largest allocation sites traced so far
+        """
+
+        self.start_tracing()
+
+        if self.tracemalloc_filename is None:
+            return
+
+        stats = tracemalloc.take_snapshot().statistics('lineno')[:limit]
+
+        record = {'cycle' : int(cycle), 't' : float(t),
+                  'top'   : [{'where' : str(x.traceback[0]), 'size' : x.size,
+                              'count' : x.count} for x in stats]}
+
+        with open(self.tracemalloc_filename, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+        return
+
+    def flush(self, force = False):
+        self.output.flush(force = force)
+        return
+
+    def wait(self):
+        self.output.wait()
+        return
+
+    @property
+    def rows_written(self):
+        return self.output.rows_written
+
+    def truncate(self, rows):
+        """
+        Cut the memory dataset back to the given number of rows
+        """
+        self.output.truncate(rows)
+        return
+
+    def close(self):
+        self.output.close()
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        return
+
+class abundance_table():
+    """
+    Read an abundance output file (see abundance_output) lazily, one
+    column at a time, as values per star. For 'events' files the event
+    values (tform, Z, and the species) are joined to the stars when
+    asked for:
+
+        >>> table = abundance_table('abundances.h5')
+        >>> table.names
+        >>> Fe    = table['Fe']
+    """
+
+    def __init__(self, filename):
+
+        self.filename = filename
+        self.h5f      = h5py.File(filename, 'r')
+        self.format   = self.h5f.attrs.get('format', 'rows')
+
+        if self.format == 'events':
+            self._datasets = ['stars', 'events']
+        else:
+            self._datasets = ['abundances']
+
+        self._columns = {}
+        for dname in self._datasets:
+            dataset = self.h5f[dname]
+            names   = dataset.attrs['names'] if 'names' in dataset.attrs else self.h5f.attrs['names']
+            for j, n in enumerate(names):
+                n = n.decode() if isinstance(n, bytes) else str(n)
+                if not (n in self._columns):
+                    self._columns[n] = (dname, j)
+
+        self._event_index = None
+        return
+
+    @property
+    def names(self):
+        return list(self._columns.keys())
+
+    def __len__(self):
+        return self.h5f[self._datasets[0]].shape[0]
+
+    def __getitem__(self, name):
+
+        if not (name in self._columns):
+            print("Abundance output has no column " + str(name))
+            raise KeyError(name)
+
+        dname, j = self._columns[name]
+        values   = self.h5f[dname][:, j]
+
+        if dname == 'events':
+            if self._event_index is None:
+                self._event_index = self['event'].astype(np.int64)
+            values = values[self._event_index]
+
+        return values
+
+    def close(self):
         self.h5f.close()
         return
 
+class background_writer():
+    """
+    Runs output jobs (callables) in order on a single background thread
+    so that writing files overlaps with evolving the zone. At most maxsize
+    jobs wait in the queue; submit blocks while it is full. An error in
+    a job is re-raised in the calling thread at the next submit, flush,
+    or close.
+    """
+
+    def __init__(self, maxsize = 4):
+
+        self.queue  = queue.Queue(maxsize = maxsize)
+        self._error = None
+
+        self.thread = threading.Thread(target = self._run, daemon = True)
+        self.thread.start()
+
+        return
+
+    def _run(self):
+
+        while True:
+            job = self.queue.get()
+
+            if job is None:
+                self.queue.task_done()
+                return
+
+            try:
+                if self._error is None: # skip remaining jobs after an error
+                    job[0](*job[1], **job[2])
+            except BaseException as e:
+                self._error = e
+            finally:
+                self.queue.task_done()
+
+    def submit(self, function, *args, **kwargs):
+        self._raise_error()
+        self.queue.put( (function, args, kwargs) )
+        return
+
+    def flush(self):
+        self.queue.join()
+        self._raise_error()
+        return
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self._raise_error()
+        return
+
+    def _raise_error(self):
+
+        if not (self._error is None):
+            error       = self._error
+            self._error = None
+            print("Error in background output writer")
+            raise error
+
+        return
+
 class _io_parameters(_parameters):
 
     def __init__(self):
         self.dump_output_basename     = 'dump'
         self.dt_dump                  = 0.0
         self.cycle_dump               = 0
+        self.dump_single_file         = False  # append all dumps to one file
+        self.dump_compression         = 'gzip' # star data in single file dumps
+        self.dump_delta               = False  # single file: only write changed stars
 
-        self.pickle_output_basename   = 'pickle'
+        self.pickle_output_basename   = None   # full object pickles (slow)
         self.dt_pickle                = 0
         self.cycle_pickle             = 0
 
-        self.summary_output_filename  = 'summary_output.txt'
+        self.checkpoint_basename      = None   # e.g. 'checkpoint' to write restart files
+        self.dt_checkpoint            = 0.0
+        self.cycle_checkpoint         = 0
+        self.checkpoints_to_keep      = 3      # None or 0 keeps all
+
+        # write outputs from a background thread, with at most
+        # output_queue_size outputs waiting to be written
+        self.background_output        = True
+        self.output_queue_size        = 4
+        self._output_writer           = None
+
+        self.summary_output_filename  = 'summary_output.h5' # .h5 / .hdf5 or ASCII
         self.dt_summary               = 0.0
         self.cycle_summary            = 0
+        self.summary_buffer_size      = 100    # rows written to file at a time
+        self.summary_in_memory        = False # also keep summary rows on the Zone
+
+        # setting dump / pickle / checkpoint basenames or summary filename
+        # to None turns that output off
 
-        self._abundance_buffer = None
+        # zone parameters used for the abundance output headers. Kept
+        # across resets so a RunConfig's io stays tied to its own zone
+        self._zone_parameters = getattr(self, '_zone_parameters', zone)
+
+        self._abundance_output = None
+        self.abundance_output_format     = 'events' # or 'rows', one full row per star
+        self.abundance_compression       = 'gzip' # None, 'lzf', or 'gzip'
+        self.abundance_compression_level = None   # gzip level (0-9)
         self.abundance_output_filename = None # 'abundances.dat'
 
-        self.radiation_binned_output  = 0 # bin rad in mass bins - expensive
+        # stellar events (supernovae, white dwarfs), see event_log
+        self._event_log               = None
+        self.event_output_filename    = None  # written to the 'events' dataset if set
+        self.event_buffer_size        = 1024  # events kept in memory
+
+        # memory use (see memory_log), written to the 'memory' dataset
+        # every cycle_memory cycles if set. cycle_tracemalloc > 0 turns on
+        # tracemalloc (slows the run down) and writes the largest
+        # allocation sites to <memory output>_tracemalloc.jsonl that
+        # often. When resident memory goes over memory_budget (MB) the
+        # memory_budget_action is taken: 'warn', 'compact' (write out
+        # all output buffers and collect garbage, again only if memory
+        # keeps growing), or a function called as f(zone, rss)
+        self._memory_log              = None
+        self.memory_output_filename   = None
+        self.cycle_memory             = 1
+        self.cycle_tracemalloc        = 0
+        self.memory_budget            = None
+        self.memory_budget_action     = 'warn'
+
+        self.radiation_binned_output  = 0 # also sum radiation in birth mass bins
+        self.radiation_bin_edges      = [1.0, 8.0, 16.0, 24.0, 1000.0]
+        self.radiation_bin_names      = ['low_mass', 'int_mass', 'high_mass', 'vhigh_mass']
 
         return
 
     def _clean_up(self):
 
-        if not (self._abundance_buffer is None):
-            self._abundance_buffer.close()
+        self.flush_output()
+
+        if not (self._abundance_output is None):
+            self._abundance_output.close()
+
+        if not (self._event_log is None):
+            self._event_log.close()
+
+        if not (self._memory_log is None):
+            self._memory_log.close()
+
+        return
+
+    def _submit_output(self, function, *args):
+        """
+        Call function(*args) to write an output, on the background
+        writer thread if background_output is set
+        """
+
+        if not self.background_output:
+            function(*args)
+            return
+
+        if self._output_writer is None:
+            self._output_writer = background_writer(self.output_queue_size)
+
+        self._output_writer.submit(function, *args)
+
+        return
+
+    def flush_output(self):
+        """
+        Wait for all pending background outputs to be written
+        """
+
+        if not (self._output_writer is None):
+            writer              = self._output_writer
+            self._output_writer = None
+            writer.close()
+
+        return
 
+    def __getstate__(self):
+        # open file handles and threads can't be pickled
+        state = self.__dict__.copy()
+        state['_abundance_output'] = None
+        state['_output_writer']    = None
+        state['_event_log']        = None
+        state['_memory_log']       = None
+        return state
+
+    def get_event_log(self):
+        # made when first used, once species_to_track is known
+        if self._event_log is None:
+            self._initialize_event_log()
+        return self._event_log
+
+    def _initialize_event_log(self, overwrite = True):
+        self._event_log = event_log(self._zone_parameters.species_to_track,
+                                    size = self.event_buffer_size,
+                                    filename = self.event_output_filename,
+                                    compression = self.abundance_compression,
+                                    compression_opts = self.abundance_compression_level,
+                                    overwrite = overwrite,
+                                    background = self.background_output)
+        return
+
+    def get_memory_log(self):
+        if self._memory_log is None:
+            self._initialize_memory_log()
+        return self._memory_log
+
+    def _initialize_memory_log(self, overwrite = True):
+        self._memory_log = memory_log(self.memory_output_filename,
+                                      tracemalloc_filename = os.path.splitext(self.memory_output_filename)[0] +\
+                                                             '_tracemalloc.jsonl',
+                                      compression = self.abundance_compression,
+                                      compression_opts = self.abundance_compression_level,
+                                      overwrite = overwrite,
+                                      background = self.background_output)
         return
 
     @property
@@ -502,17 +1296,19 @@ class _io_parameters(_parameters):
         self._initialize_abundance_output()
         return
 
-    def _initialize_abundance_output(self):
-        if not (self._abundance_buffer is None):
+    def _initialize_abundance_output(self, overwrite = True):
+        if not (self._abundance_output is None):
             print("Error: Abundance output filename already initialized")
             raise RuntimeError
 
         if not (self.abundance_output_filename is None):
-            headers = ['tform','id','M','Z','lifetime'] + list(zone.species_to_track)
-            self._abundance_buffer = chunked_hdf5_buffer(self.abundance_output_filename,
-                                                         headers = headers,
-                                                         compression = 'gzip',
-                                                         chunks = (10000,len(headers)))
+            self._abundance_output = abundance_output(self.abundance_output_filename,
+                                                      self._zone_parameters.species_to_track,
+                                                      format = self.abundance_output_format,
+                                                      compression = self.abundance_compression,
+                                                      compression_opts = self.abundance_compression_level,
+                                                      overwrite = overwrite,
+                                                      background = self.background_output)
         return
 
 #    def _initialize_abundance_output(self):
@@ -544,6 +1340,107 @@ class _data_table(_parameters):
         self.yields_mass_limits = [1.0, 25.0]
 
 data = _data_table()
+
+#
+# ------------- Per-run configuration ----------------
+#
+class RunConfig(object):
+    """
+    Full set of parameters for a single run (one Zone). Each Zone
+    owns a RunConfig and passes it to its stars, so several Zones can
+    run side by side in one process (e.g. in a thread pool) with
+    different parameters while sharing the data tables. The module
+    level parameter objects (zone, stars, io, ...) form the default
+    RunConfig, returned by default_run_config(), which is what a
+    Zone uses if none is given.
+
+    New RunConfigs start from default values:
+
+        >>> rc = RunConfig()
+        >>> rc.zone.initial_gas_mass = 1.0E6
+        >>> sim = Zone(run_config = rc)
+
+    or copy the current module level values:
+
+        >>> rc = default_run_config().copy()
+    """
+
+    _parameter_names = ['global_values', 'units', 'zone', 'stars', 'io', 'data']
+
+    def __init__(self, global_values = None, units = None, zone = None,
+                       stars = None, io = None, data = None):
+
+        self.global_values = _globals()             if global_values is None else global_values
+        self.units         = _units()               if units is None else units
+        self.zone          = _zone_parameters()     if zone is None else zone
+        self.stars         = _star_particle_parameters() if stars is None else stars
+        self.data          = _data_table()          if data is None else data
+
+        if io is None:
+            io = _io_parameters.__new__(_io_parameters)
+            object.__setattr__(io, '_zone_parameters', self.zone)
+            io.__init__()
+        self.io = io
+
+        return
+
+    def copy(self):
+        """
+        Return an independent copy of these parameters. The abundance
+        output file (and its open buffer), the event log, and the profiler
+        are not copied.
+        """
+
+        new = RunConfig()
+
+        for name in ['units', 'zone', 'stars', 'data']:
+            new_params = getattr(new, name)
+            for k, v in getattr(self, name).__dict__.items():
+                object.__setattr__(new_params, k, copy.deepcopy(v))
+
+        for k, v in self.io.__dict__.items():
+            if k in ['_zone_parameters', '_abundance_output',
+                     '_abundance_output_filename', '_output_writer', '_event_log',
+                     '_memory_log']:
+                continue
+            object.__setattr__(new.io, k, copy.deepcopy(v))
+
+        for k in ['profile_performance', 'profile_filename', 'profile_output_interval',
+                  'trace_size', 'trace_filename', 'sample_profile',
+                  'sample_interval', 'sample_filename']:
+            setattr(new.global_values, k, getattr(self.global_values, k))
+
+        return new
+
+    def help(self):
+        for name in ['zone', 'stars', 'io']:
+            getattr(self, name).help()
+        return
+
+    def reset_parameters_to_default(self):
+        for name in ['zone', 'stars', 'io']:
+            getattr(self, name).reset_parameters_to_default()
+        return
+
+    def _clean_up(self):
+        self.io._clean_up()
+        return
+
+    def __reduce__(self):
+        # the default config always refers back to the module objects
+        if self is _default_run_config:
+            return (default_run_config, ())
+
+        return (RunConfig, tuple(getattr(self, name) for name in self._parameter_names))
+
+_default_run_config = RunConfig(global_values = global_values, units = units,
+                                zone = zone, stars = stars, io = io, data = data)
+
+def default_run_config():
+    """
+    The RunConfig made up of the module level parameter objects
+    """
+    return _default_run_config
 #
 # ------------- Helper Functions -------------
 #
@@ -5,9 +5,15 @@ __author__ = "aemerick <emerick@astro.columbia.edu>"
 # when one of the dims is exactly equal to one of the grid points
 _interpolation_hack = 0.999999999 # do this for now
 
+# relative tolerance used when a timestep ends exactly on a stellar event
+# (death, AGB phase, SNIa) so that round-off does not push it to the next step.
+# Only applied with event timestepping (see _tolerance)
+cdef double _event_tolerance = 1.0E-10
+
 # --- external ---
 import numpy as np
 cimport numpy as np
+from libc.math cimport fabs
 
 import gc
 #from collections import OrderedDict
@@ -38,6 +44,137 @@ WIND_YIELD_TABLE         = DT.StellarYieldsTable('wind',data_dir=_data_dir)
 MASSIVE_STAR_YIELD_TABLE = DT.StellarYieldsTable('massive_star',data_dir=_data_dir)
 POPIII_YIELD_TABLE       = DT.StellarYieldsTable("popIII")
 
+#
+# ------- frozen copy of the config values used by the star kernels -----
+#
+cdef struct StarParams:
+    double time_unit
+    double current_redshift
+    double hubble_time
+    double track_massive_star_ejecta_mass
+    double yields_mass_limit
+
+    bint   event_timestep
+    bint   use_snII
+    bint   use_snIa
+    bint   use_stellar_winds
+    bint   use_AGB_wind_phase
+    bint   extrapolate_snII_yields
+    bint   use_massive_star_yields
+    bint   normalize_black_body_to_OSTAR
+
+    double SNII_mass_threshold
+    double direct_collapse_mass_threshold
+    double SNIa_candidate_mass_bounds[2]
+    double DTD_slope
+    double NSNIa
+    double AGB_wind_phase_mass_threshold
+    double AGB_wind_velocity
+
+    double black_body_correction_mass
+    double black_body_q0_factors[2]
+    double black_body_q1_factors[2]
+    double black_body_FUV_factors[2]
+    double black_body_LW_factors[2]
+
+cdef class StarParameters:
+    """
+    Snapshot of the config parameters read by the star kernels, held as
+    a C struct so that evolving a star does no Python attribute lookups.
+    Values are taken from run_config (config.default_run_config() if
+    None), which is also used for star abundance output.
+    Zone freezes one of these at the start of evolve and refreezes it only
+    when config.parameter_version() changes (i.e. a parameter is set).
+    Note that modifying a list parameter in place (e.g.
+    SNIa_candidate_mass_bounds[0] = 2.0) is not seen as a change; assign
+    a new list or call freeze() directly.
+    """
+
+    cdef StarParams p
+    cdef public long version
+    cdef public object run_config
+
+    def __init__(self, run_config = None):
+        if run_config is None:
+            run_config = config.default_run_config()
+
+        self.run_config = run_config
+        self.version    = -1
+        self.freeze()
+        return
+
+    def __reduce__(self):
+        # refreeze from current config on unpickle
+        return (StarParameters, (self.run_config,))
+
+    cpdef void freeze(self):
+        cdef int i
+        cdef object rc = self.run_config
+
+        self.p.time_unit                      = rc.units.time
+        self.p.current_redshift               = rc.zone.current_redshift
+        self.p.hubble_time                    = rc.units.hubble_time(rc.zone.current_redshift)
+        self.p.track_massive_star_ejecta_mass = rc.zone.track_massive_star_ejecta_mass
+        self.p.yields_mass_limit              = rc.data.yields_mass_limits[1]
+
+        self.p.event_timestep                 = rc.zone.adaptive_timestep and rc.zone.event_timestep
+
+        self.p.use_snII                       = rc.stars.use_snII
+        self.p.use_snIa                       = rc.stars.use_snIa
+        self.p.use_stellar_winds              = rc.stars.use_stellar_winds
+        self.p.use_AGB_wind_phase             = rc.stars.use_AGB_wind_phase
+        self.p.extrapolate_snII_yields        = rc.stars.extrapolate_snII_yields
+        self.p.use_massive_star_yields        = rc.stars.use_massive_star_yields
+        self.p.normalize_black_body_to_OSTAR  = rc.stars.normalize_black_body_to_OSTAR
+
+        self.p.SNII_mass_threshold            = rc.stars.SNII_mass_threshold
+        self.p.direct_collapse_mass_threshold = rc.stars.direct_collapse_mass_threshold
+        self.p.DTD_slope                      = rc.stars.DTD_slope
+        self.p.NSNIa                          = rc.stars.NSNIa
+        self.p.AGB_wind_phase_mass_threshold  = rc.stars.AGB_wind_phase_mass_threshold
+        self.p.AGB_wind_velocity              = rc.stars.AGB_wind_velocity
+        self.p.black_body_correction_mass     = rc.stars.black_body_correction_mass
+
+        for i in range(2):
+            self.p.SNIa_candidate_mass_bounds[i] = rc.stars.SNIa_candidate_mass_bounds[i]
+            self.p.black_body_q0_factors[i]      = rc.stars.black_body_q0_factors[i]
+            self.p.black_body_q1_factors[i]      = rc.stars.black_body_q1_factors[i]
+            self.p.black_body_FUV_factors[i]     = rc.stars.black_body_FUV_factors[i]
+            self.p.black_body_LW_factors[i]      = rc.stars.black_body_LW_factors[i]
+
+        self.version = config.parameter_version()
+        return
+
+    cpdef bint refreeze_if_changed(self):
+        """
+        Refreeze if any config parameter was set since the last freeze.
+        Returns True if the snapshot was updated.
+        """
+        if self.version == config.parameter_version():
+            return False
+
+        self.freeze()
+        return True
+
+    def as_dict(self):
+        return self.p
+
+_DEFAULT_PARAMETERS = StarParameters()
+
+cdef inline double _tolerance(StarParams* p):
+    # steps only end exactly on stellar events with event timestepping
+    if p.event_timestep:
+        return _event_tolerance
+    return 0.0
+
+cpdef StarParameters default_parameters():
+    """
+    Module wide parameter snapshot used when none is passed in, kept in
+    step with config
+    """
+    _DEFAULT_PARAMETERS.refreeze_if_changed()
+    return _DEFAULT_PARAMETERS
+
 cdef class StarParticle:
 
     # note to self. public makes these available attributes to python
@@ -117,6 +254,42 @@ cdef class StarParticle:
         """
         pass
 
+#
+# Star attributes stored by StarList.as_columns (in addition to id)
+#
+_column_attributes = ['M', 'Z', 'age', 't_now', 'M_o', 'tform', 'Mdot_ej']
+
+#
+# values summed over all stars by StarList.summary_sums, in order
+#
+_summary_sum_names = ['M', 'M_o', 'Z', 'Mdot_ej', 'L_FUV', 'L_LW', 'Q0', 'Q1',
+                      'L_Q0', 'L_Q1', 'L_bol', 'L_wind']
+
+#
+# of which these are also summed in birth mass bins
+#
+_summary_binned_names = ['L_FUV', 'L_LW', 'L_Q0', 'L_Q1']
+
+#
+# totals that only change when a star forms or changes type, kept
+# running by StarList (see StarList.totals), and where the binned
+# totals are among them
+#
+_running_total_names = ['L_FUV', 'L_LW', 'Q0', 'Q1', 'L_Q0', 'L_Q1', 'L_bol', 'M_o', 'Z']
+_binned_running_index = [_running_total_names.index(name) for name in _summary_binned_names]
+
+cdef inline void _compensated_add(double[:] s, double[:] c, int i, double x):
+    # Neumaier summation: the running totals have values added and much
+    # later removed again (e.g. Q0 of massive stars), which would leave
+    # round-off of the size of the largest values with plain sums
+    cdef double t = s[i] + x
+    if fabs(s[i]) >= fabs(x):
+        c[i] += (s[i] - t) + x
+    else:
+        c[i] += (x - t) + s[i]
+    s[i] = t
+    return
+
 #
 # Star_types: 'star', 'new_WD'
 #
@@ -127,37 +300,56 @@ cdef class Star(StarParticle):
 
     def __init__(self, str star_type = 'star', *args, **kwargs):
 
+        cdef StarParameters params = kwargs.pop('params', None)
+        if params is None:
+            params = default_parameters()
+
+        # False when the caller writes the abundances for many stars at once
+        cdef bint write_abundances = kwargs.pop('write_abundances', True)
+
         super().__init__(*args, **kwargs)
 
         self.properties['type'] = star_type
 
-        self._assign_properties()
+        self._compute_properties(&params.p)
 
-        if 'abundances' in kwargs:
-            self.write_abundance(kwargs['abundances'])
+        if 'abundances' in kwargs and write_abundances:
+            self.write_abundance(kwargs['abundances'], params.run_config)
 
         return
 
 
     cpdef void evolve(self, double t, double dt, dict ej_masses = {}, dict sn_masses = {},
                             int snII_counter = -9999, int snIa_counter = -9999,
-                            dict special_accumulator={}):
+                            dict special_accumulator={}, StarParameters params = None,
+                            object rng = None):
         """
-        Evolve
+        Evolve. rng is the numpy Generator used for the Type Ia delay
+        time draw (global np.random if None)
         """
 
+        if params is None:
+            params = default_parameters()
+
+        self._evolve(t, dt, ej_masses, sn_masses, special_accumulator, &params.p, rng)
+
+        return
+
+    cdef void _evolve(self, double t, double dt, dict ej_masses, dict sn_masses,
+                            dict special_accumulator, StarParams* p, object rng):
+
         self.age = t - self.tform
 
         #
         # check and update Mdot_ej from stellar winds
         #
         self.Mdot_ej = 0.0
-        self.stellar_wind_parameters(self.age, dt)
+        self.stellar_wind_parameters(self.age, dt, p)
         self.Mdot_ej = self.properties['Mdot_wind']
 
         cdef double SN_mass_loss = 0.0
 
-        if (self.age + dt > self.properties['lifetime'] / (config.units.time)):
+        if ((self.age + dt)*(1.0 + _tolerance(p)) > self.properties['lifetime'] / (p.time_unit)):
 
             if 'new' in self.properties['type']:
                 #
@@ -170,32 +362,33 @@ cdef class Star(StarParticle):
                 SN_mass_loss = 0.0
 
             elif self.properties['type'] == 'star':
-                if self.M_o > config.stars.SNII_mass_threshold  and\
-                   self.M_o < config.stars.direct_collapse_mass_threshold:
+                if self.M_o > p.SNII_mass_threshold  and\
+                   self.M_o < p.direct_collapse_mass_threshold:
                     #
                     # Core collapse supernova - change type and compute yields
                     #
-                    self.set_SNII_properties()
+                    self.set_SNII_properties(p)
                     self.properties['type'] = 'new_remnant'
                     SN_mass_loss = self.sn_ejecta_masses['m_tot']
-                    snII_counter += 1
-                elif self.M_o < config.stars.SNII_mass_threshold:
+                elif self.M_o < p.SNII_mass_threshold:
                     #
                     # Otherwise, form a white dwarf when dead and label as
                     # candidate for future SNIa
                     #
                     self.properties['type']               = 'new_WD'
 
-                    if self.M_o > config.stars.SNIa_candidate_mass_bounds[0]\
-                           and self.M_o < config.stars.SNIa_candidate_mass_bounds[1]:
+                    if self.M_o > p.SNIa_candidate_mass_bounds[0]\
+                           and self.M_o < p.SNIa_candidate_mass_bounds[1]:
 
                         self.properties['SNIa_candidate'] = True
                         self.properties['WD_lifetime']    = phys.WD_lifetime(t,
                                                                              self.tform,
-                                                                             self.properties['lifetime']/config.units.time,
-                                                                             config.stars.DTD_slope,
-                                                                             config.stars.NSNIa,
-                                                                             config.zone.current_redshift) * config.units.time
+                                                                             self.properties['lifetime']/p.time_unit,
+                                                                             p.DTD_slope,
+                                                                             p.NSNIa,
+                                                                             p.current_redshift,
+                                                                             p.hubble_time,
+                                                                             rng) * p.time_unit
 
                     else:
                         self.properties['SNIa_candidate'] = False
@@ -211,18 +404,17 @@ cdef class Star(StarParticle):
 
                 if self.properties['SNIa_candidate']:
 
-                    if self.properties['WD_lifetime'] + self.tform <= t*config.units.time:
+                    if self.properties['WD_lifetime'] + self.tform <= t*p.time_unit*(1.0 + _tolerance(p)):
 
                         # go Type Ia supernova
                         self.properties['type'] = 'new_SNIa_remnant'
-                        self.set_SNIa_properties()
+                        self.set_SNIa_properties(p)
                         SN_mass_loss = self.sn_ejecta_masses['m_tot']
-                        snIa_counter += 1
 
         #
         # Compute total mass lost through supernova and wind
         #
-        cdef double M_loss = self.Mdot_ej * (config.units.time) * dt + SN_mass_loss
+        cdef double M_loss = self.Mdot_ej * (p.time_unit) * dt + SN_mass_loss
 
         self.M = self.M - M_loss
 
@@ -253,7 +445,7 @@ cdef class Star(StarParticle):
             for key in ej_masses.keys():
                 ej_masses[key] += self.wind_ejecta_abundances[key] * self.Mdot_ej
 
-            if self.M_o > config.zone.track_massive_star_ejecta_mass:
+            if self.M_o > p.track_massive_star_ejecta_mass:
                 special_accumulator['m_massive'] += self.wind_ejecta_abundances['m_metal'] * self.Mdot_ej
 
         elif self.properties['type'] == 'new_remnant':
@@ -263,7 +455,7 @@ cdef class Star(StarParticle):
                 ej_masses[key] += self.wind_ejecta_abundances[key] * self.Mdot_ej
                 sn_masses[key] += self.sn_ejecta_masses[key]
 
-            if self.M_o > config.zone.track_massive_star_ejecta_mass:
+            if self.M_o > p.track_massive_star_ejecta_mass:
                 special_accumulator['m_massive'] += self.wind_ejecta_abundances['m_metal']*self.Mdot_ej +\
                                                     self.sn_ejecta_masses['m_metal']
 
@@ -272,13 +464,13 @@ cdef class Star(StarParticle):
             for key in sn_masses.keys():
                 sn_masses[key] += self.sn_ejecta_masses[key]
 
-            if self.M_o > config.zone.track_massive_star_ejecta_mass:
+            if self.M_o > p.track_massive_star_ejecta_mass:
                 special_accumulator['m_massive'] += self.sn_ejecta_masses['m_metal']
 
 
         return
 
-    cdef void set_SNIa_properties(self, bint check_mass = False):
+    cdef void set_SNIa_properties(self, StarParams* p, bint check_mass = False):
         """
         If a SNIa candidate, sets SNIa ejecta masses in array. check_mass
         call is in place for versatility. One can set SNIa properties BEFORE turning
@@ -288,7 +480,7 @@ cdef class Star(StarParticle):
         """
         # need to rename and combine this and functions below
 
-        if not config.stars.use_snIa:
+        if not p.use_snIa:
             return
 
 
@@ -296,10 +488,10 @@ cdef class Star(StarParticle):
         cdef int i = 0
         cdef str e = '' # may not work
 
-        if ((self.M_o > config.stars.SNIa_candidate_mass_bounds[0] and\
-           self.M_o < config.stars.SNIa_candidate_mass_bounds[1] and (not check_mass)) or\
-          (check_mass and (self.M_o > config.stars.SNIa_candidate_mass_bounds[0] and\
-           self.M_o < config.stars.SNIa_candidate_mass_bounds[1] and self.M == 0.0))) :
+        if ((self.M_o > p.SNIa_candidate_mass_bounds[0] and\
+           self.M_o < p.SNIa_candidate_mass_bounds[1] and (not check_mass)) or\
+          (check_mass and (self.M_o > p.SNIa_candidate_mass_bounds[0] and\
+           self.M_o < p.SNIa_candidate_mass_bounds[1] and self.M == 0.0))) :
 
             if len(self.wind_ejecta_abundances.keys()) > 0:
                 yields = phys.SNIa_yields(self.wind_ejecta_abundances.keys())
@@ -316,9 +508,9 @@ cdef class Star(StarParticle):
 
         return
 
-    cdef void set_SNII_properties(self):
+    cdef void set_SNII_properties(self, StarParams* p):
 
-        if not config.stars.use_snII:
+        if not p.use_snII:
             return
 
         cdef np.ndarray yields
@@ -327,16 +519,16 @@ cdef class Star(StarParticle):
 
         if len(self.wind_ejecta_abundances.keys()) > 0:
 
-            if self.M_o < config.stars.direct_collapse_mass_threshold and\
-               self.M_o > config.stars.SNII_mass_threshold :
+            if self.M_o < p.direct_collapse_mass_threshold and\
+               self.M_o > p.SNII_mass_threshold :
 
-                if self.M_o < config.data.yields_mass_limits[1]:
+                if self.M_o < p.yields_mass_limit:
                     yields =  np.asarray(SN_YIELD_TABLE.interpolate([self.M_o, self.Z],
                                                           self.wind_ejecta_abundances.keys()))
-                elif config.stars.extrapolate_snII_yields:
-                    yields = np.asarray(SN_YIELD_TABLE.interpolate([config.data.yields_mass_limits[1] * _interpolation_hack, self.Z],
+                elif p.extrapolate_snII_yields:
+                    yields = np.asarray(SN_YIELD_TABLE.interpolate([p.yields_mass_limit * _interpolation_hack, self.Z],
                                                           self.wind_ejecta_abundances.keys()))
-                    yields = yields * self.M_o / (config.data.yields_mass_limits[1] * _interpolation_hack)
+                    yields = yields * self.M_o / (p.yields_mass_limit * _interpolation_hack)
 
             else:
                 # direct collapse supernova - no SN mass injection
@@ -411,9 +603,9 @@ cdef class Star(StarParticle):
         else:
             return 0.0
 
-    cdef public void stellar_wind_parameters(self, double age, double dt):
+    cdef public void stellar_wind_parameters(self, double age, double dt, StarParams* p):
 
-        if not self.properties['type'] == 'star' or not config.stars.use_stellar_winds:
+        if not self.properties['type'] == 'star' or not p.use_stellar_winds:
             return
 
         #cdef bint do_wind
@@ -430,8 +622,12 @@ cdef class Star(StarParticle):
             # check if star's wind is ON
             do_wind = True
 
-            if (self.M_o < config.stars.AGB_wind_phase_mass_threshold) and config.stars.use_AGB_wind_phase:
-                if self.age + dt < self.properties['age_agb'] / config.units.time:
+            if (self.M_o < p.AGB_wind_phase_mass_threshold) and p.use_AGB_wind_phase:
+                # wind stays off until the AGB phase, unless (with event
+                # timestepping) the star also dies this step
+                if (self.age + dt)*(1.0 - _tolerance(p)) < self.properties['age_agb'] / p.time_unit and\
+                   not (p.event_timestep and\
+                        (self.age + dt)*(1.0 + _tolerance(p)) > self.properties['lifetime'] / p.time_unit):
                     do_wind = False
                     wind_lifetime = 0.0
                 else:
@@ -441,11 +637,11 @@ cdef class Star(StarParticle):
                 wind_lifetime = self.properties['lifetime']
 
 
-            if wind_lifetime < dt * config.units.time:
-                wind_lifetime = dt * config.units.time
+            if wind_lifetime < dt * p.time_unit:
+                wind_lifetime = dt * p.time_unit
 
 
-            if do_wind and self.age * config.units.time < self.properties['lifetime']:
+            if do_wind and self.age * p.time_unit < self.properties['lifetime']:
                 Mdot   = self.properties['M_wind_total'] / wind_lifetime
             else:
                 Mdot   = 0.0
@@ -455,7 +651,7 @@ cdef class Star(StarParticle):
             # total amount, set wind ejected to just the difference
             # this can happen when wind phase is < dt and lines up between timesteps
             #
-            final_mass = self.M - Mdot * dt * config.units.time
+            final_mass = self.M - Mdot * dt * p.time_unit
             correct_final_mass = self.M_o - self.properties['M_wind_total']
 
 
@@ -468,18 +664,18 @@ cdef class Star(StarParticle):
                                       self.properties['Teff'], self.Z)
 
 
-        if (self.M > config.stars.AGB_wind_phase_mass_threshold):
+        if (self.M > p.AGB_wind_phase_mass_threshold):
             vwind = phys.s99_wind_velocity( self.properties['luminosity'], self.M_o,
                                             self.properties['Teff'], self.Z)
         else:
-            vwind = config.stars.AGB_wind_velocity * 1.0E5 # km/s -> cm/s
+            vwind = p.AGB_wind_velocity * 1.0E5 # km/s -> cm/s
 
 
         self.properties['Mdot_wind'] = Mdot
         self.properties['v_wind']    = vwind
         return
 
-    cdef np.ndarray compute_stellar_wind_yields(self):
+    cdef np.ndarray compute_stellar_wind_yields(self, StarParams* p):
         """ compute_stellar_wind_yields
 
         Computes yields from stellar winds for all considered species using
@@ -494,11 +690,11 @@ cdef class Star(StarParticle):
 
         cdef np.ndarray yields
 
-        if( self.M_o < config.data.yields_mass_limits[1] ):
+        if( self.M_o < p.yields_mass_limit ):
 
             yields = np.asarray(WIND_YIELD_TABLE.interpolate([self.M_o, self.Z],
                                                               self.wind_ejecta_abundances.keys()))
-        elif (config.stars.use_massive_star_yields):
+        elif (p.use_massive_star_yields):
             # use yields from PARSEC massive star yields
             yields = np.asarray(MASSIVE_STAR_YIELD_TABLE.interpolate([self.M_o, self.Z],
                                                                      self.wind_ejecta_abundances.keys()))
@@ -508,14 +704,18 @@ cdef class Star(StarParticle):
             # For stars off of the grid, scale most massive star
             # to current mass.
             #
-            yields = np.asarray(WIND_YIELD_TABLE.interpolate([config.data.yields_mass_limits[1]*_interpolation_hack, self.Z], self.wind_ejecta_abundances.keys()))
-            yields = yields * self.M_o / (config.data.yields_mass_limits[1] * _interpolation_hack)
+            yields = np.asarray(WIND_YIELD_TABLE.interpolate([p.yields_mass_limit*_interpolation_hack, self.Z], self.wind_ejecta_abundances.keys()))
+            yields = yields * self.M_o / (p.yields_mass_limit * _interpolation_hack)
 
 
         return np.asarray(yields)
 
 
     cdef public void _assign_properties(self):
+        self._compute_properties(&default_parameters().p)
+        return
+
+    cdef void _compute_properties(self, StarParams* p):
 
         # list of properties assigned in this function (remember to update!!)
         cdef list p_list = ['luminosity', 'radius',
@@ -523,14 +723,14 @@ cdef class Star(StarParticle):
                             'Q0', 'E0', 'Q1', 'E1', 'Mdot_wind', 'v_wind', 'M_wind_total']
         cdef int i = 0
         cdef str e = ''
-        cdef str p = ''
+        cdef str pname = ''
         #cdef double L, T, R, lifetime, age_agb, Q0, Q1, FUV, LW, E0, E1, a
         #cdef double interp_error_flag = -123456.0 # unique flag - allows for better dtype
 
         if self.properties['type'] == 'unresolved_star':
             self.Mdot_ej           = 0.0
-            for p in p_list:
-                self.properties[p] = 0.0
+            for pname in p_list:
+                self.properties[pname] = 0.0
             return
 
         L, T, R, lifetime, age_agb = SE_TABLE.interpolate([self.M_o,self.Z],
@@ -566,16 +766,16 @@ cdef class Star(StarParticle):
             Q0  = rad.compute_blackbody_q0(self.properties['Teff'])
             Q1  = rad.compute_blackbody_q1(self.properties['Teff'])
 
-            if config.stars.normalize_black_body_to_OSTAR:
-                if self.M_o < config.stars.black_body_correction_mass:
+            if p.normalize_black_body_to_OSTAR:
+                if self.M_o < p.black_body_correction_mass:
                     corr_ind = 0
                 else:
                     corr_ind = 1
 
-                Q0  *= config.stars.black_body_q0_factors[corr_ind]
-                Q1  *= config.stars.black_body_q1_factors[corr_ind]
-                FUV *= config.stars.black_body_FUV_factors[corr_ind]
-                LW  *= config.stars.black_body_LW_factors[corr_ind]
+                Q0  *= p.black_body_q0_factors[corr_ind]
+                Q1  *= p.black_body_q1_factors[corr_ind]
+                FUV *= p.black_body_FUV_factors[corr_ind]
+                LW  *= p.black_body_LW_factors[corr_ind]
 
 
         self.properties['Q0']    = Q0 * self.surface_area()
@@ -591,7 +791,7 @@ cdef class Star(StarParticle):
         # Interpolate and store wind and supernova abundances
         #
 
-        cdef np.ndarray yields = self.compute_stellar_wind_yields()
+        cdef np.ndarray yields = self.compute_stellar_wind_yields(p)
 
         i = 0
         for e in self.wind_ejecta_abundances.keys():
@@ -604,7 +804,7 @@ cdef class Star(StarParticle):
             for e in self.wind_ejecta_abundances.keys():
                 self.wind_ejecta_abundances[e] /= self.properties['M_wind_total']
 
-        self.set_SNII_properties()
+        self.set_SNII_properties(p)
 
         self.properties['Mdot_wind'] = 0.0
         self.properties['v_wind']    = 0.0
@@ -622,11 +822,11 @@ cdef class Star(StarParticle):
 
     cdef dict return_sn_ejecta_masses(self):
 
-        self.set_SNII_properties()
+        self.set_SNII_properties(&default_parameters().p)
 
         return self.sn_ejecta_masses
 
-    cdef public void write_abundance(self, abundances):
+    cdef public void write_abundance(self, abundances, object run_config):
         """
         Write star particle abundances to file. In principle, if homogenous one-zone
         model is used this is not necessary as abundances will just be identical to gas
@@ -638,25 +838,18 @@ cdef class Star(StarParticle):
         In actuality this just adds the star to a buffer to limit IO
         """
 
-        cdef int i = 0
-        cdef int ei = 0
         cdef str e = ''
 
-        if not (config.io._abundance_buffer is None):
+        if run_config is None:
+            run_config = config.default_run_config()
 
-            config.io._abundance_buffer.flush() # flush if needed
+        cdef object output = run_config.io._abundance_output
 
-            i = config.io._abundance_buffer.count
-            config.io._abundance_buffer.buffer[i][0] = self.tform
-            config.io._abundance_buffer.buffer[i][1] = self.id
-            config.io._abundance_buffer.buffer[i][2] = self.M
-            config.io._abundance_buffer.buffer[i][3] = self.Z
-            config.io._abundance_buffer.buffer[i][4] = self.properties['lifetime']
+        if not (output is None):
+            output.add_stars(self.tform, self.Z,
+                             [abundances[e] for e in run_config.zone.species_to_track],
+                             [self.id], [self.M], [self.properties['lifetime']])
 
-            for ei,e in enumerate(config.zone.species_to_track):
-                config.io._abundance_buffer.buffer[i][ei+5] = abundances[e]
-
-            config.io._abundance_buffer.count += 1
         return
 
 cdef class StarList:
@@ -669,13 +862,21 @@ cdef class StarList:
     cdef public bint _stars_optimized
     cdef public bint _are_there_new_stars
     cdef public  int _N_stars
+    cdef public object run_config
+    cdef public dict _type_counts
+    cdef public object _running, _running_c, _running_scale
+    cdef public object _bin_edges, _bin_sums, _bin_sums_c
+    cdef public double _M_total, _Mdot_total, _L_wind_total
 
-    def __init__(self, list stars = []):
+    def __init__(self, list stars = [], run_config = None):
 
+        if run_config is None:
+            run_config = config.default_run_config()
+        self.run_config = run_config
 
         if len(stars) == 0:
-            if config.zone.maximum_stars != None and config.zone.optimize:
-                self._stars           = [None] * config.zone.maximum_stars
+            if run_config.zone.maximum_stars != None and run_config.zone.optimize:
+                self._stars           = [None] * run_config.zone.maximum_stars
                 self._stars_optimized = True
             else:
                 self._stars           = []
@@ -689,9 +890,14 @@ cdef class StarList:
             self._N_stars = len(self._stars)
             self._are_there_new_stars = True
 
+        self._bin_edges = None
+        self.recompute_totals()
+
         return
 
-    def evolve(self, double t, double dt, *args, **kwargs):
+    def evolve(self, double t, double dt, dict ej_masses = {}, dict sn_masses = {},
+                     dict special_accumulator = {}, StarParameters params = None,
+                     object rng = None):
 
         #map( lambda x : x.evolve(t, dt, *args, **kwargs), self.stars_iterable)
 #        Was debating trying to multi-thread here but that might not do anything
@@ -699,11 +905,216 @@ cdef class StarList:
 #
 #        else:
 
-        for x in self.stars_iterable():
-            x.evolve(t,dt,*args,**kwargs)
+        cdef Star x
+        cdef str old_type
+        cdef bint settling
+        cdef double old_values[9]
+        cdef double M_total      = 0.0
+        cdef double Mdot_total   = 0.0
+        cdef double L_wind_total = 0.0
+        cdef str new_type
+
+        if params is None:
+            params = default_parameters()
+
+        cdef object events = self.run_config.io.get_event_log()
+
+        for x in self.stars():
+            old_type = x.properties['type']
+
+            #
+            # radiation properties are constant over a star's life and
+            # are only zeroed when a 'new_' type settles into its final
+            # type, so only those need their values kept here
+            #
+            settling = old_type.startswith('new_')
+            if settling:
+                self._star_values(x, old_values)
+
+            x._evolve(t, dt, ej_masses, sn_masses, special_accumulator, &params.p, rng)
+
+            new_type = x.properties['type']
+            if not (new_type == old_type):
+                self._change_type(x, old_type, old_values if settling else NULL)
+
+                # stars take on a 'new_' type in the step of an event
+                if new_type.startswith('new_'):
+                    events.add(t, x.id, x.M_o, x.Z, new_type, x.sn_ejecta_masses)
+
+            # these change every step, so just sum them while here
+            M_total      += x.M
+            Mdot_total   += x.Mdot_ej
+            L_wind_total += x.mechanical_luminosity()
+
+        self._M_total      = M_total
+        self._Mdot_total   = Mdot_total
+        self._L_wind_total = L_wind_total
+
+        return
+
+    cdef void _star_values(self, Star x, double* v):
+        # a star's contribution to each of _running_total_names
+        cdef dict p = x.properties
+        v[0] = p['L_FUV']
+        v[1] = p['L_LW']
+        v[2] = p['Q0']
+        v[3] = p['Q1']
+        v[4] = v[2] * p['E0']
+        v[5] = v[3] * p['E1']
+        v[6] = p['luminosity']
+        v[7] = x.M_o
+        v[8] = x.Z
+        return
+
+    cdef void _add_running(self, double* v, double sign):
+        cdef double[:] s = self._running
+        cdef double[:] c = self._running_c
+        cdef double[:] a = self._running_scale
+        cdef int i = 0
+        for i in range(len(_running_total_names)):
+            _compensated_add(s, c, i, sign * v[i])
+            a[i] += fabs(v[i])
+        return
+
+    cdef void _add_to_bins(self, Star x, double* v, double sign):
+
+        if self._bin_edges is None:
+            return
+
+        cdef int nbins = np.size(self._bin_edges) - 1
+        cdef int b     = np.searchsorted(self._bin_edges, x.M_o, side = 'right') - 1
+        cdef int j     = 0
+        cdef double[:] s = self._bin_sums
+        cdef double[:] c = self._bin_sums_c
+
+        if b < 0 or b >= nbins:
+            return
+
+        cdef int nvalues = len(_binned_running_index)
+
+        # one row of nbins per binned value, then the counts
+        for j in range(nvalues):
+            _compensated_add(s, c, j * nbins + b, sign * v[<int>_binned_running_index[j]])
+        _compensated_add(s, c, nvalues * nbins + b, sign)
+
+        # an empty bin is exactly zero
+        if s[nvalues * nbins + b] + c[nvalues * nbins + b] < 0.5:
+            for j in range(nvalues + 1):
+                s[j * nbins + b] = 0.0
+                c[j * nbins + b] = 0.0
 
         return
 
+    cdef void _change_type(self, Star x, str old_type, double* old_values):
+        """
+        Update the running totals for a star that changed from old_type.
+        old_values are its values before, if they may have changed
+        """
+
+        cdef str new_type = x.properties['type']
+        cdef double v[9]
+
+        self._star_values(x, v)
+
+        self._type_counts[old_type] -= 1
+        self._type_counts[new_type]  = self._type_counts.get(new_type, 0) + 1
+
+        # binned totals only count 'star' type
+        if old_type == 'star':
+            self._add_to_bins(x, v, -1.0)
+
+        if old_values != NULL:
+            self._add_running(old_values, -1.0)
+            self._add_running(v, 1.0)
+
+        return
+
+    def totals(self, bin_edges = None):
+        """
+        Running totals over all stars, as returned by summary_sums, but
+        without looping over the stars: these are updated as stars form
+        and change type, and the mass, ejection rate and mechanical
+        luminosity totals are summed during evolve. Changing bin_edges
+        triggers a full recompute.
+        """
+
+        if not (bin_edges is None) and (self._bin_edges is None or\
+                                        list(bin_edges) != list(self._bin_edges)):
+            self._bin_edges = np.asarray(bin_edges, dtype = np.float64)
+            self.recompute_totals()
+
+        total = np.asarray(self._running) + np.asarray(self._running_c)
+
+        sums = dict(zip(_running_total_names, total.tolist()))
+        sums['M']       = self._M_total
+        sums['Mdot_ej'] = self._Mdot_total
+        sums['L_wind']  = self._L_wind_total
+        sums['N']       = self._N_stars
+
+        if not (bin_edges is None):
+            binned = (np.asarray(self._bin_sums) + np.asarray(self._bin_sums_c)).reshape(len(_binned_running_index) + 1, -1)
+            sums['bins'] = {name : binned[j] for j, name in enumerate(_summary_binned_names)}
+            sums['bins']['count'] = np.rint(binned[-1]).astype(np.int64)
+
+        return sums
+
+    def type_counts(self):
+        """
+        Number of stars of each type, kept running
+        """
+        return {k : v for k, v in self._type_counts.items() if v > 0}
+
+    def recompute_totals(self):
+        """
+        Recompute the running totals from all of the stars. Returns the
+        largest relative difference from the running values (zero the
+        first time), as a check on round-off drift. Running totals are
+        compared relative to the sum of the magnitudes of everything
+        added to and removed from them since the last recompute, so
+        that a total left small after large values were removed (e.g.
+        Q0 once the massive stars die) does not look like drift.
+        """
+
+        cdef Star x
+        cdef str star_type
+        cdef double drift = 0.0
+        cdef double scale = 0.0
+
+        sums = self.summary_sums(self._bin_edges)
+
+        if not (self._running is None):
+            old = self.totals()
+            for name in _summary_sum_names:
+                if name in _running_total_names:
+                    scale = self._running_scale[_running_total_names.index(name)]
+                else:
+                    scale = abs(sums[name])
+                if scale > 0.0:
+                    drift = max(drift, abs(old[name] - sums[name]) / scale)
+
+        self._running       = np.array([sums[name] for name in _running_total_names], dtype = np.float64)
+        self._running_c     = np.zeros(len(_running_total_names))
+        self._running_scale = np.abs(self._running)
+
+        self._M_total      = sums['M']
+        self._Mdot_total   = sums['Mdot_ej']
+        self._L_wind_total = sums['L_wind']
+
+        if not (self._bin_edges is None):
+            self._bin_sums   = np.concatenate([sums['bins'][name] for name in _summary_binned_names] +\
+                                              [sums['bins']['count'].astype(np.float64)])
+            self._bin_sums_c = np.zeros(np.size(self._bin_sums))
+        else:
+            self._bin_sums   = None
+            self._bin_sums_c = None
+
+        self._type_counts = {}
+        for x in self.stars():
+            star_type = x.properties['type']
+            self._type_counts[star_type] = self._type_counts.get(star_type, 0) + 1
+
+        return drift
+
 #    @property
     cpdef list stars(self):
         if self._stars_optimized:
@@ -730,9 +1141,53 @@ cdef class StarList:
         return self._N_stars
 
 
+    cpdef double next_event_time(self, double t, StarParameters params = None):
+        """
+        Return the earliest time (code units) after t at which any star
+        dies, enters its AGB wind phase, or explodes as a Type Ia
+        supernova. Returns -1 if no event is scheduled.
+        """
+
+        cdef double t_next  = -1.0
+        cdef double t_event = -1.0
+        cdef double t_agb   = -1.0
+        cdef str star_type
+        cdef Star x
+
+        if params is None:
+            params = default_parameters()
+
+        cdef double tunit   = params.p.time_unit
+        cdef bint   use_agb = params.p.use_AGB_wind_phase
+        cdef double M_agb   = params.p.AGB_wind_phase_mass_threshold
+
+        for x in self.stars():
+            star_type = x.properties['type']
+
+            if star_type == 'star':
+                t_event = x.tform + x.properties['lifetime'] / tunit
+
+                if use_agb and x.M_o < M_agb:
+                    t_agb = x.tform + x.properties['age_agb'] / tunit
+                    if t_agb > t and t_agb < t_event:
+                        t_event = t_agb
+
+            elif (star_type == 'WD' or star_type == 'new_WD') and\
+                  x.properties['SNIa_candidate']:
+                # mirrors the explosion condition in Star.evolve
+                t_event = (x.properties['WD_lifetime'] + x.tform) / tunit
+
+            else:
+                continue
+
+            if t_event > t and (t_next < 0.0 or t_event < t_next):
+                t_next = t_event
+
+        return t_next
+
     cdef bint _values_outdated(self):
 
-        return self._internal_time < config.global_values.time
+        return self._internal_time < self.run_config.global_values.time
 
     cpdef void add_new_star(self, Star new_star):
         """
@@ -741,7 +1196,7 @@ cdef class StarList:
         number of stars is provided
         """
 
-        config.global_values.profiler.start_timer('add_new_star', True)
+        self.run_config.global_values.profiler.start_timer('add_new_star', True)
 
         if self._stars_optimized:
             #
@@ -754,7 +1209,24 @@ cdef class StarList:
 
         self._N_stars += 1
 
-        config.global_values.profiler.end_timer('add_new_star')
+        #
+        # running totals
+        #
+        cdef double v[9]
+        cdef str star_type = new_star.properties['type']
+
+        self._star_values(new_star, v)
+        self._add_running(v, 1.0)
+
+        self._M_total      += new_star.M
+        self._Mdot_total   += new_star.Mdot_ej
+        self._L_wind_total += new_star.mechanical_luminosity()
+
+        self._type_counts[star_type] = self._type_counts.get(star_type, 0) + 1
+        if star_type == 'star':
+            self._add_to_bins(new_star, v, 1.0)
+
+        self.run_config.global_values.profiler.end_timer('add_new_star')
 
         return
 
@@ -777,14 +1249,14 @@ cdef class StarList:
     cdef np.ndarray _property_asarray(self, str name, str star_type, subset_condition):
 
 
-        config.global_values.profiler.start_timer('property_asarray', True)
+        self.run_config.global_values.profiler.start_timer('property_asarray', True)
 
         cdef list _star_subset
         cdef np.ndarray array
         cdef Star x # may break
 
         if self.N_stars() == 0:
-            config.global_values.profiler.end_timer('property_asarray')
+            self.run_config.global_values.profiler.end_timer('property_asarray')
 
             return np.zeros(1)
 
@@ -812,6 +1284,8 @@ cdef class StarList:
             array = np.asarray( [x.id for x in _star_subset])
         elif name == 'age':
             array = np.asarray( [x.age for x in _star_subset])
+        elif name == 'tform':
+            array = np.asarray( [x.tform for x in _star_subset])
         else:
             try:
                 array = np.asarray( [x.properties[name] for x in _star_subset] )
@@ -822,7 +1296,7 @@ cdef class StarList:
         #
         # as can happen if there are no stars in subset
         #
-        config.global_values.profiler.end_timer('property_asarray')
+        self.run_config.global_values.profiler.end_timer('property_asarray')
 
         if len(array) == 0:
             if name == 'type':
@@ -875,9 +1349,9 @@ cdef class StarList:
         Returns iterable
         """
 
-        config.global_values.profiler.start_timer('get_subset',True)
+        self.run_config.global_values.profiler.start_timer('get_subset',True)
         cdef list res = [ x for x in self.stars_iterable() if expr(x) ]
-        config.global_values.profiler.end_timer('get_subset')
+        self.run_config.global_values.profiler.end_timer('get_subset')
         return res
 
 #        return itertools.ifilterfalse( expr,  self.stars)
@@ -927,6 +1401,152 @@ cdef class StarList:
         else:
             return return_list
 
+    def as_columns(self):
+        """
+        All star data as typed arrays, one per Star attribute and per
+        entry in Star.properties, plus (N_stars, N_species) arrays of the
+        wind ejecta abundances and SN ejecta masses. Used for compact
+        checkpoints; StarList.from_columns rebuilds the list. Properties
+        that are not set for every star (e.g. WD_lifetime) come with a
+        boolean 'present' array.
+        """
+
+        cdef list stars = self.stars()
+        cdef int N = len(stars)
+        cdef int i = 0
+        cdef int j = 0
+        cdef Star x
+        cdef str k
+        cdef list species = []
+
+        if N > 0:
+            species = list(stars[0].wind_ejecta_abundances.keys())
+
+        cdef np.ndarray[np.float64_t, ndim=2] wind = np.zeros((N, len(species)))
+        cdef np.ndarray[np.float64_t, ndim=2] sn   = np.zeros((N, len(species)))
+        cdef dict values = {}
+
+        attributes = {name : np.zeros(N) for name in _column_attributes}
+        attributes['id'] = np.zeros(N, dtype = np.int64)
+
+        for i, x in enumerate(stars):
+            attributes['M'][i]       = x.M
+            attributes['Z'][i]       = x.Z
+            attributes['age'][i]     = x.age
+            attributes['t_now'][i]   = x.t_now
+            attributes['M_o'][i]     = x.M_o
+            attributes['tform'][i]   = x.tform
+            attributes['Mdot_ej'][i] = x.Mdot_ej
+            attributes['id'][i]      = x.id
+
+            if list(x.wind_ejecta_abundances.keys()) != species:
+                _my_print("All stars must track the same species to be stored as columns")
+                raise ValueError
+
+            for j, k in enumerate(species):
+                wind[i,j] = x.wind_ejecta_abundances[k]
+                sn[i,j]   = x.sn_ejecta_masses[k]
+
+            for k, v in x.properties.items():
+                if not k in values:
+                    values[k] = [None] * N
+                values[k][i] = v
+
+        properties = {}
+        present    = {}
+        for k, vlist in values.items():
+            mask = np.array([v is not None for v in vlist], dtype = bool)
+            set_values = [v for v in vlist if v is not None]
+
+            if all(isinstance(v, str) for v in set_values):
+                properties[k] = np.array([v if v is not None else '' for v in vlist]).astype('S')
+            elif all(isinstance(v, (bool, np.bool_)) for v in set_values):
+                properties[k] = np.array([bool(v) for v in vlist], dtype = bool)
+            else:
+                properties[k] = np.array([v if v is not None else np.nan for v in vlist], dtype = np.float64)
+
+            if not np.all(mask):
+                present[k] = mask
+
+        return {'attributes'             : attributes,
+                'properties'             : properties,
+                'present'                : present,
+                'species'                : species,
+                'wind_ejecta_abundances' : wind,
+                'sn_ejecta_masses'       : sn}
+
+    @classmethod
+    def from_columns(cls, dict columns, run_config = None):
+        """
+        Rebuild a StarList from the output of StarList.as_columns without
+        recomputing any stellar properties
+        """
+
+        cdef StarList new = cls(run_config = run_config)
+        cdef Star x
+        cdef int i = 0
+        cdef int j = 0
+        cdef str k
+
+        attributes = columns['attributes']
+        properties = columns['properties']
+        present    = columns['present']
+        species    = list(columns['species'])
+        wind       = columns['wind_ejecta_abundances']
+        sn         = columns['sn_ejecta_masses']
+
+        cdef int N = np.size(attributes['M'])
+        cdef list stars = [None] * N
+
+        # decode string columns once rather than per star
+        decoded = {}
+        for k, v in properties.items():
+            if v.dtype.kind == 'S':
+                decoded[k] = [s.decode() for s in v]
+            elif v.dtype.kind == 'b':
+                decoded[k] = v.tolist()
+            else:
+                decoded[k] = v
+
+        for i in range(N):
+            x = Star.__new__(Star)
+            x.M       = attributes['M'][i]
+            x.Z       = attributes['Z'][i]
+            x.age     = attributes['age'][i]
+            x.t_now   = attributes['t_now'][i]
+            x.M_o     = attributes['M_o'][i]
+            x.tform   = attributes['tform'][i]
+            x.Mdot_ej = attributes['Mdot_ej'][i]
+            x.id      = attributes['id'][i]
+
+            x.wind_ejecta_abundances = {}
+            x.sn_ejecta_masses       = {}
+            for j, k in enumerate(species):
+                x.wind_ejecta_abundances[k] = wind[i,j]
+                x.sn_ejecta_masses[k]       = sn[i,j]
+
+            x.properties = {}
+            for k, v in decoded.items():
+                if k in present and not present[k][i]:
+                    continue
+                x.properties[k] = v[i]
+
+            stars[i] = x
+
+        if new._stars_optimized:
+            if N > len(new._stars):
+                _my_print("More stars than config.zone.maximum_stars")
+                raise ValueError
+            new._stars[:N] = stars
+        else:
+            new._stars = stars
+
+        new._N_stars = N
+        new._are_there_new_stars = N > 0
+        new.recompute_totals()
+
+        return new
+
     cpdef np.ndarray Z(self):
         """
         List comprehension to return all metallicities as numpy array
@@ -948,6 +1568,64 @@ cdef class StarList:
         #cdef Star x
         return np.asarray([x.M_o for x in self.stars_iterable()])
 
+    def summary_sums(self, bin_edges = None):
+        """
+        Sums over all stars needed for the summary output, gathered in a
+        single pass over the list (see _summary_sum_names): mass, birth
+        mass, metallicity, ejection rate, radiation, bolometric and
+        mechanical luminosity, with the number of stars under 'N'. With
+        bin_edges, a list of birth masses, the values in
+        _summary_binned_names and the number of stars are also summed
+        over the 'star' type stars in each bin (edges[i] <= M_o <
+        edges[i+1]), returned as arrays under 'bins'.
+        """
+
+        cdef list stars = self.stars()
+        cdef int N = len(stars)
+        cdef int i = 0
+        cdef int nbins = 0
+        cdef Star x
+        cdef dict p
+
+        cdef np.ndarray[np.float64_t, ndim=2] values = np.zeros((len(_summary_sum_names), N))
+        cdef np.ndarray[np.uint8_t, ndim=1, cast=True] is_star = np.zeros(N, dtype = bool)
+
+        for i in range(N):
+            x = stars[i]
+            p = x.properties
+
+            values[0,i]  = x.M
+            values[1,i]  = x.M_o
+            values[2,i]  = x.Z
+            values[3,i]  = x.Mdot_ej
+            values[4,i]  = p['L_FUV']
+            values[5,i]  = p['L_LW']
+            values[6,i]  = p['Q0']
+            values[7,i]  = p['Q1']
+            values[8,i]  = values[6,i] * p['E0']
+            values[9,i]  = values[7,i] * p['E1']
+            values[10,i] = p['luminosity']
+            values[11,i] = x.mechanical_luminosity()
+            is_star[i]   = p['type'] == 'star'
+
+        sums = dict(zip(_summary_sum_names, np.sum(values, axis = 1)))
+        sums['N'] = N
+
+        if not (bin_edges is None):
+            edges = np.asarray(bin_edges, dtype = np.float64)
+            nbins = np.size(edges) - 1
+
+            # stars outside of the bins go in an extra bin, dropped below
+            bins = np.searchsorted(edges, values[1], side = 'right') - 1
+            bins[(bins < 0) | (bins >= nbins) | (is_star == 0)] = nbins
+
+            sums['bins'] = {'count' : np.bincount(bins, minlength = nbins + 1)[:nbins]}
+            for name in _summary_binned_names:
+                sums['bins'][name] = np.bincount(bins, weights = values[_summary_sum_names.index(name)],
+                                                 minlength = nbins + 1)[:nbins]
+
+        return sums
+
 
 cdef void _my_print(str string):
     print('[Star]: ' + string)
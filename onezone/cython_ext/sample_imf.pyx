@@ -7,6 +7,9 @@ cimport numpy as np
 
 MAX_STARS = 100000
 
+# number of random numbers drawn at once from a Generator
+cdef int RANDOM_BLOCK = 1024
+
 cdef int find_bin(double[:] array, double x, int l, int r, int total):
 
     cdef int w   = r - l
@@ -35,7 +38,12 @@ cpdef double[:] sample_imf(double[:] table, double M,
                            int N,
                            double IMF_dm,
                            double IMF_start, double IMF_end,
-                           int table_points):
+                           int table_points, object rng = None):
+    """
+    Sample stars from the tabulated IMF until a total mass M is reached.
+    Random numbers come from rng (a numpy Generator), drawn in blocks,
+    or from the global numpy random state if rng is None.
+    """
 
     cdef double[:] stars = np.zeros(int(M/IMF_start))
     cdef int i = -1
@@ -44,9 +52,21 @@ cpdef double[:] sample_imf(double[:] table, double M,
     cdef int bin = 0
     cdef double m_o = np.log10(IMF_start)
 
+    cdef double[:] rnums
+    cdef int j = RANDOM_BLOCK
+
     while total_mass < M:
         i = i + 1
-        rnum = np.random.rand()
+
+        if rng is None:
+            rnum = np.random.rand()
+        else:
+            if j == RANDOM_BLOCK:
+                rnums = rng.random(RANDOM_BLOCK)
+                j     = 0
+            rnum = rnums[j]
+            j    = j + 1
+
         bin  = find_bin(table, rnum, 0, table_points, table_points)
         stars[i]      = 10.0**(bin * IMF_dm + m_o)
         total_mass    += stars[i]
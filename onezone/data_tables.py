@@ -21,6 +21,28 @@ for x in _possible_dirs:
     if (_os.path.exists(x)):
         install_dir = x
 
+#
+# Parsed tables handed in from elsewhere (e.g. broadcast over MPI), keyed
+# by DataTable.table_key(). A table with a preloaded entry takes its data
+# from here in read_data instead of reading it from disk again.
+#
+_preloaded_tables = {}
+
+def preload_tables(table_states):
+    """
+    Register parsed table data (as returned by table_states) to be used
+    in place of reading the data files
+    """
+    _preloaded_tables.update(table_states)
+    return
+
+def table_states(tables):
+    """
+    Return the parsed data of each table in tables, keyed by table_key,
+    suitable for sending to another process and passing to preload_tables
+    """
+    return dict( (t.table_key(), dict(t.__dict__)) for t in tables)
+
 class DataTable:
 
     def __init__(self, name):
@@ -38,6 +60,22 @@ class DataTable:
     def read_data(self):
         pass
 
+    def table_key(self):
+        return self.__class__.__name__
+
+    def _load_preloaded(self):
+        """
+        Take data from a preloaded table if one is registered. Returns
+        True if so.
+        """
+
+        if not (self.table_key() in _preloaded_tables):
+            return False
+
+        self.__dict__.update(_preloaded_tables[self.table_key()])
+
+        return True
+
     def interpolate(self, vals, ynames, *args, **kwargs):
         """
         Vals is either dict or an ordered list where order
@@ -257,6 +295,9 @@ class StellarEvolutionData(DataTable):
 
     def read_data(self, data_dir = None):
 
+        if data_dir == None and self._load_preloaded():
+            return None
+
         if data_dir == None:
             if self.data_dir is None:
                 self.data_dir = install_dir + 'Data/'
@@ -324,6 +365,9 @@ class RadiationData(DataTable):
     def read_data(self, data_dir = None):
         # if data file is not provided, use internal data
 
+        if data_dir == None and self._load_preloaded():
+            return None
+
         if data_dir == None:
             self.data_dir = install_dir + 'Data/'
 
@@ -482,6 +526,9 @@ class StellarYieldsTable(DataTable):
         if yield_type is None:
             yield_type = self.yield_type
 
+        if yield_type == self.yield_type and self._load_preloaded():
+            return None
+
         if self.data_dir is None:
             if data_dir == None:
                 self.data_dir = install_dir + 'Data/'
@@ -521,11 +568,14 @@ class StellarYieldsTable(DataTable):
             self.y[element]   = data[element].reshape(tuple(self.nbins.values()))
 
 
-        self._available_yields = self.y.keys()
+        self._available_yields = list(self.y.keys())
 
         return None
 
 
+    def table_key(self):
+        return self.__class__.__name__ + '_' + str(self.yield_type)
+
     def interpolate(self, vals, ynames, silence = True, flag = 'offgrid'):
         """ interpolate
 
@@ -0,0 +1,574 @@
+"""
+
+    Author : A. Emerick
+
+    Purpose: Run ensembles of onezone models (parameter grids or lists)
+             on a process pool or over MPI, with a manifest so interrupted
+             ensembles can be resumed.
+
+"""
+
+__author__ = "aemerick <emerick@astro.columbia.edu>"
+
+# external
+import numpy as np
+import multiprocessing
+import itertools
+import traceback
+import json
+import time
+import os
+import h5py
+
+# internal
+from . import data_tables as DT
+
+#
+# names of the seed policies understood by Ensemble
+#
+_seed_policies = ['index', 'fixed', 'spawn']
+
+#
+# Set in each worker process by _worker_init
+#
+_worker_base_config = None
+
+class Ensemble:
+    """
+    Ensemble Class
+
+    A set of onezone runs that share a base RunConfig and differ in a
+    few parameters. Members are given either as a grid (dictionary of
+    parameter name -> list of values, all combinations are run) or as
+    a list of dictionaries (one per member). Parameter names are zone
+    parameters, or 'stars.name', 'io.name', 'units.name' for others:
+
+        >>> ens = Ensemble(config.default_run_config(),
+        ...                {'mass_loading_factor' : [1.0, 5.0, 10.0],
+        ...                 'stars.DTD_slope'     : [1.0, 1.1]},
+        ...                n_realizations = 4, output_dir = 'sweep')
+        >>> results = ens.run(n_workers = 8)
+
+    Each member's outputs are named with run_basename%(index) in
+    output_dir, and a JSON manifest recording the parameters, seed,
+    status, and final state of every finished member is kept there.
+    Running again with the same output_dir skips members already
+    marked done.
+
+    With aggregate_summaries, members keep their summary output in
+    memory (no per-member files are written at all) and the parent
+    process writes every member's summary into a single HDF5 file,
+    summary_name in output_dir, one group per member. This is always
+    done with run_mpi, which distributes members over MPI ranks.
+
+    Seeds are chosen by seed_policy:
+        'index' : base_seed + member index (default)
+        'fixed' : base_seed for every member
+        'spawn' : independent seeds from np.random.SeedSequence(base_seed)
+        list    : explicit seed for each member
+        callable: seed_policy(index, parameters) -> seed
+    """
+
+    def __init__(self, base_config, parameters, n_realizations = 1,
+                       seed_policy = 'index', base_seed = 0,
+                       output_dir = '.', run_basename = 'run%0004i',
+                       manifest_name = 'ensemble_manifest.json',
+                       write_abundances = False, aggregate_summaries = False,
+                       summary_name = 'ensemble_summary.h5'):
+
+        # copy so members see the parameters as they are now, whatever
+        # the start method of the worker processes
+        self.base_config      = base_config.copy()
+        self.output_dir       = output_dir
+        self.run_basename     = run_basename
+        self.manifest_name    = manifest_name
+        self.write_abundances = write_abundances
+        self.aggregate_summaries = aggregate_summaries
+        self.summary_name     = summary_name
+
+        self.members          = _expand_parameters(parameters, n_realizations)
+        self.seeds            = _member_seeds(self.members, seed_policy, base_seed)
+
+        self.results          = {}
+        self.failures         = {}
+
+        return
+
+    @property
+    def N_members(self):
+        return len(self.members)
+
+    @property
+    def manifest_filename(self):
+        return os.path.join(self.output_dir, self.manifest_name)
+
+    @property
+    def summary_filename(self):
+        return os.path.join(self.output_dir, self.summary_name)
+
+    def tasks(self):
+        """
+        List of the task (what a worker needs to run it) for every member
+        """
+
+        return [ {'index'            : i,
+                  'parameters'       : self.members[i],
+                  'seed'             : self.seeds[i],
+                  'prefix'           : os.path.join(self.output_dir, self.run_basename%(i)),
+                  'write_abundances' : self.write_abundances,
+                  'aggregate'        : self.aggregate_summaries} for i in range(self.N_members)]
+
+    def pending_tasks(self):
+        """
+        Tasks for members not yet marked done in the manifest
+        """
+
+        self.load_manifest()
+
+        return [task for task in self.tasks() if not (task['index'] in self.results)]
+
+    def load_manifest(self):
+        """
+        Read results of finished members from the manifest, if present.
+        Members whose parameters or seed differ from this ensemble are
+        ignored (and will be rerun).
+        """
+
+        self.results = {}
+
+        if not os.path.isfile(self.manifest_filename):
+            return
+
+        with open(self.manifest_filename, 'r') as f:
+            manifest = json.load(f)
+
+        for key, record in manifest['members'].items():
+            i = int(key)
+
+            if i >= self.N_members or record['status'] != 'done':
+                continue
+
+            if record['parameters'] != _jsonable(self.members[i]) or\
+               record['seed'] != _jsonable(self.seeds[i]):
+                continue
+
+            self.results[i] = record
+
+        return
+
+    def write_manifest(self):
+        """
+        Write the manifest (atomically, so an interrupted write never
+        leaves a broken file)
+        """
+
+        manifest = {'run_basename' : self.run_basename,
+                    'N_members'    : self.N_members,
+                    'N_done'       : len(self.results),
+                    'N_failed'     : len(self.failures),
+                    'members'      : {}}
+
+        for i, record in itertools.chain(self.results.items(), self.failures.items()):
+            manifest['members'][str(i)] = record
+
+        tmp_name = self.manifest_filename + '.tmp'
+        with open(tmp_name, 'w') as f:
+            json.dump(manifest, f, indent = 1, sort_keys = True)
+        os.replace(tmp_name, self.manifest_filename)
+
+        return
+
+    def _start(self):
+        """
+        Set up output directory and return the pending tasks
+        """
+
+        if not os.path.isdir(self.output_dir):
+            os.makedirs(self.output_dir)
+
+        tasks = self.pending_tasks()
+        self.failures = {}
+
+        _my_print("Running %i of %i members (%i already done)"%(len(tasks), self.N_members,
+                                                                  self.N_members - len(tasks)))
+
+        return tasks
+
+    def run(self, n_workers = None, chunksize = None):
+        """
+        Run all pending members on a pool of n_workers processes
+        (default: one per core). Tasks are handed out in chunks of
+        chunksize members (default: enough for about four chunks per
+        worker), finishing order is not fixed. Returns the dictionary
+        of results for finished members; members that raised are
+        collected in self.failures.
+        """
+
+        tasks = self._start()
+        if len(tasks) == 0:
+            return self.results
+
+        if n_workers is None:
+            n_workers = multiprocessing.cpu_count()
+        n_workers = min(n_workers, len(tasks))
+
+        if chunksize is None:
+            chunksize = max(1, len(tasks) // (4 * n_workers))
+
+        if n_workers == 1:
+            _worker_init(self.base_config)
+            for task in tasks:
+                self._record([_run_member(task)])
+        else:
+            with multiprocessing.Pool(processes = n_workers, initializer = _worker_init,
+                                      initargs = (self.base_config,)) as pool:
+                for record in pool.imap_unordered(_run_member, tasks, chunksize = chunksize):
+                    self._record([record])
+
+        _my_print("Finished with %i members done and %i failed"%(len(self.results), len(self.failures)))
+
+        return self.results
+
+    def run_mpi(self, comm = None, chunksize = 1):
+        """
+        Run all pending members over MPI (requires mpi4py), e.g.
+
+            mpirun -n 64 python my_ensemble.py
+
+        with every rank calling run_mpi. Rank 0 hands out chunks of
+        chunksize members to the other ranks as they become free and
+        writes the manifest and the single aggregated summary file;
+        members write no files of their own. The data tables are read
+        from disk by one rank per node and broadcast to the others, so
+        scripts should not import onezone.zone (or the star modules)
+        themselves before calling this. Returns the results on rank 0,
+        None elsewhere.
+        """
+
+        try:
+            from mpi4py import MPI
+        except ImportError:
+            _my_print("mpi4py is required to run an ensemble with MPI")
+            raise
+
+        if comm is None:
+            comm = MPI.COMM_WORLD
+
+        _mpi_share_tables(comm, MPI)
+
+        self.aggregate_summaries = True
+
+        if comm.Get_size() == 1:
+            _my_print("Only one MPI rank. Running members in serial")
+            return self.run(n_workers = 1)
+
+        if comm.Get_rank() != 0:
+            _mpi_worker(comm, self.base_config)
+            return None
+
+        tasks = self._start()
+        chunks = [tasks[i:i+chunksize] for i in range(0, len(tasks), chunksize)]
+
+        n_workers = comm.Get_size() - 1
+        status    = MPI.Status()
+
+        while n_workers > 0:
+            records = comm.recv(source = MPI.ANY_SOURCE, tag = _MPI_RESULT_TAG, status = status)
+
+            if len(records) > 0:
+                self._record(records)
+
+            if len(chunks) > 0:
+                comm.send(chunks.pop(0), dest = status.Get_source(), tag = _MPI_TASK_TAG)
+            else:
+                comm.send(None, dest = status.Get_source(), tag = _MPI_TASK_TAG)
+                n_workers -= 1
+
+        _my_print("Finished with %i members done and %i failed"%(len(self.results), len(self.failures)))
+
+        return self.results
+
+    def _record(self, records):
+        """
+        Store the results of finished members, write their summaries to
+        the aggregated summary file (if any), and update the manifest
+        """
+
+        summaries = []
+
+        for record in records:
+            if 'summary' in record:
+                summaries.append( (record, record.pop('summary')) )
+
+            if record['status'] == 'done':
+                self.results[record['index']] = record
+            else:
+                self.failures[record['index']] = record
+                _my_print("Member %i failed: %s"%(record['index'], record['error']))
+
+        if len(summaries) > 0:
+            self._write_summaries(summaries)
+
+        self.write_manifest()
+
+        return
+
+    def _write_summaries(self, summaries):
+        """
+        Write member summary tables into the aggregated HDF5 file, one
+        group per member, replacing any earlier group for that member
+        """
+
+        with h5py.File(self.summary_filename, 'a') as hf:
+            for record, (names, data) in summaries:
+                grpname = self.run_basename%(record['index'])
+
+                if grpname in hf:
+                    del hf[grpname]
+
+                grp = hf.create_group(grpname)
+                grp.attrs['parameters'] = json.dumps(record['parameters'], sort_keys = True)
+                grp.attrs['seed']       = json.dumps(record['seed'])
+
+                for j, name in enumerate(names):
+                    grp.create_dataset(name, data = data[:,j])
+
+        return
+
+def _expand_parameters(parameters, n_realizations = 1):
+    """
+    Turn a parameter grid (dict of lists) or list of dicts into a list
+    of per-member parameter dictionaries, each repeated n_realizations
+    times
+    """
+
+    if isinstance(parameters, dict):
+        names   = list(parameters.keys())
+        members = [dict(zip(names, values)) for values in
+                               itertools.product(*[parameters[n] for n in names])]
+    else:
+        members = [dict(p) for p in parameters]
+
+    return [dict(p) for p in members for j in range(n_realizations)]
+
+def _member_seeds(members, seed_policy, base_seed):
+    """
+    Seed for each member following the given policy
+    """
+
+    N = len(members)
+
+    if callable(seed_policy):
+        seeds = [seed_policy(i, members[i]) for i in range(N)]
+
+    elif isinstance(seed_policy, str):
+        if seed_policy == 'index':
+            seeds = [base_seed + i for i in range(N)]
+        elif seed_policy == 'fixed':
+            seeds = [base_seed] * N
+        elif seed_policy == 'spawn':
+            seeds = [int(s.generate_state(1)[0]) for s in
+                            np.random.SeedSequence(base_seed).spawn(N)]
+        else:
+            _my_print("Seed policy must be one of " + str(_seed_policies) +\
+                      ", a list of seeds, or a function")
+            raise ValueError
+
+    else:
+        seeds = list(seed_policy)
+        if len(seeds) != N:
+            _my_print("Need one seed for each of the %i members"%(N))
+            raise ValueError
+
+    return seeds
+
+def _set_parameter(run_config, name, value):
+    """
+    Set a parameter by name on a RunConfig. Plain names are zone
+    parameters, otherwise 'group.name'.
+    """
+
+    group = 'zone'
+    if '.' in name:
+        group, name = name.split('.', 1)
+
+    params = getattr(run_config, group)
+
+    if not hasattr(params, name):
+        _my_print("Unknown parameter " + group + "." + name)
+        raise ValueError
+
+    setattr(params, name, value)
+
+    return
+
+def member_config(base_config, parameters, prefix, write_abundances = False,
+                  in_memory = False):
+    """
+    RunConfig for a single ensemble member: a copy of base_config with
+    parameters set and output names starting with prefix. With in_memory
+    no output files are written and the summary is kept on the Zone.
+    """
+
+    rc = base_config.copy()
+
+    for name, value in parameters.items():
+        _set_parameter(rc, name, value)
+
+    if in_memory:
+        rc.io.summary_output_filename = None
+        rc.io.dump_output_basename    = None
+        rc.io.pickle_output_basename  = None
+        rc.io.checkpoint_basename     = None
+        rc.io.event_output_filename   = None
+        rc.io.memory_output_filename  = None
+        rc.io.summary_in_memory       = True
+        return rc
+
+    # outputs turned off (None) in base_config stay off
+    for name, suffix in [('summary_output_filename', '_summary_output.h5'),
+                         ('dump_output_basename',    '_dump'),
+                         ('pickle_output_basename',  '_pickle'),
+                         ('checkpoint_basename',     '_checkpoint'),
+                         ('event_output_filename',   '_events.h5'),
+                         ('memory_output_filename',  '_memory.h5')]:
+        if not getattr(rc.io, name) is None:
+            setattr(rc.io, name, prefix + suffix)
+
+    if write_abundances:
+        rc.io.abundance_output_filename = prefix + '_abundances.h5'
+
+    rc.global_values.profile_filename = prefix + '_performance.jsonl'
+    rc.global_values.trace_filename   = prefix + '_trace.json'
+
+    return rc
+
+def _worker_init(base_config):
+    """
+    Load the data tables (done on import of the star module) once per
+    worker and keep the base configuration around for its members
+    """
+
+    global _worker_base_config
+
+    from .cython_ext import cython_star
+
+    _worker_base_config = base_config
+
+    return
+
+def _run_member(task):
+    """
+    Run a single ensemble member, returning a record of the result.
+    Errors are caught and returned, not raised, so one failed member
+    does not take down the ensemble.
+    """
+
+    from . import zone as zone
+
+    record = {'index'      : task['index'],
+              'parameters' : _jsonable(task['parameters']),
+              'seed'       : _jsonable(task['seed']),
+              'prefix'     : task['prefix']}
+
+    t_start = time.time()
+
+    try:
+        rc = member_config(_worker_base_config, task['parameters'], task['prefix'],
+                           task['write_abundances'], in_memory = task['aggregate'])
+
+        rc.zone.random_seed = task['seed']
+
+        sim = zone.Zone(run_config = rc)
+        sim.set_initial_abundances(rc.zone.species_to_track)
+        sim.evolve()
+
+        record['status'] = 'done'
+        record['final']  = {'t'      : float(sim.t),
+                            'cycles' : int(sim._cycle_number),
+                            'M_gas'  : float(sim.M_gas),
+                            'M_star' : float(sim.M_stars),
+                            'Z'      : float(sim.Z),
+                            'N_SNII' : int(sim.N_SNII),
+                            'N_SNIa' : int(sim.N_SNIa)}
+
+        if task['aggregate']:
+            record['summary'] = sim.summary_table()
+
+    except Exception as e:
+        record['status']    = 'failed'
+        record['error']     = repr(e)
+        record['traceback'] = traceback.format_exc()
+
+    record['wall_time'] = time.time() - t_start
+
+    return record
+
+#
+# message tags for the MPI scheduler
+#
+_MPI_TASK_TAG   = 1
+_MPI_RESULT_TAG = 2
+
+def _mpi_share_tables(comm, MPI):
+    """
+    Read the data tables on one rank per node and broadcast the parsed
+    tables to the other ranks on that node
+    """
+
+    node_comm = comm.Split_type(MPI.COMM_TYPE_SHARED, key = comm.Get_rank())
+
+    states = None
+    if node_comm.Get_rank() == 0:
+        from .cython_ext import cython_star as star
+        states = DT.table_states([star.SE_TABLE, star.RAD_TABLE, star.SN_YIELD_TABLE,
+                                  star.WIND_YIELD_TABLE, star.MASSIVE_STAR_YIELD_TABLE,
+                                  star.POPIII_YIELD_TABLE])
+
+    states = node_comm.bcast(states, root = 0)
+
+    if node_comm.Get_rank() != 0:
+        DT.preload_tables(states)
+
+    node_comm.Free()
+
+    return
+
+def _mpi_worker(comm, base_config):
+    """
+    Worker rank: ask rank 0 for tasks until told to stop, sending back
+    the results of each chunk
+    """
+
+    _worker_init(base_config)
+
+    records = []
+    while True:
+        comm.send(records, dest = 0, tag = _MPI_RESULT_TAG)
+
+        chunk = comm.recv(source = 0, tag = _MPI_TASK_TAG)
+        if chunk is None:
+            break
+
+        records = [_run_member(task) for task in chunk]
+
+    return
+
+def _jsonable(value):
+    """
+    Convert numpy scalars / arrays in value into plain python for JSON
+    """
+
+    if isinstance(value, dict):
+        return {str(k) : _jsonable(v) for k, v in value.items()}
+    elif isinstance(value, (list, tuple, np.ndarray)):
+        return [_jsonable(v) for v in value]
+    elif isinstance(value, np.generic):
+        return value.item()
+    elif not isinstance(value, (int, float, str, bool, type(None))):
+        return repr(value)
+
+    return value
+
+def _my_print(string):
+    print("[Ensemble]: " + string)
@@ -0,0 +1,323 @@
+"""
+
+    Author : A. Emerick
+
+    Purpose: Statistics of a summary quantity over many runs (e.g. the
+             members of an Ensemble) as a function of time, without
+             holding all runs in memory. Runs are read and resampled
+             onto a common time grid in worker processes; the parent
+             keeps only running moments and quantile estimates per grid
+             point:
+
+                 >>> files = glob.glob('sweep/run????_summary_output.h5')
+                 >>> stats = aggregate_summaries(files, 'M_gas',
+                 ...                             sample_times = np.arange(0.0, 500.0, 5.0))
+                 >>> stats['median'], stats['mean'], stats['std']
+
+"""
+
+__author__ = "aemerick <emerick@astro.columbia.edu>"
+
+# external
+import numpy as np
+import multiprocessing
+import hashlib
+import json
+import os
+
+# internal
+from .io import SummaryTable
+
+#
+# quantiles estimated by default, and the names they are returned under
+#
+_default_quantiles = {'q1' : 0.25, 'median' : 0.5, 'q3' : 0.75}
+
+class RunningStatistics():
+    """
+    Count, mean, variance, min, and max of arrays of values added one
+    at a time (Welford's method), per element. Two sets of statistics
+    can be combined with merge.
+    """
+
+    def __init__(self, size):
+
+        self.count = 0
+        self.mean  = np.zeros(size)
+        self.M2    = np.zeros(size)
+        self.min   = np.full(size,  np.inf)
+        self.max   = np.full(size, -np.inf)
+
+        return
+
+    def add(self, values):
+
+        self.count += 1
+
+        delta      = values - self.mean
+        self.mean += delta / self.count
+        self.M2   += delta * (values - self.mean)
+
+        self.min   = np.minimum(self.min, values)
+        self.max   = np.maximum(self.max, values)
+
+        return
+
+    def merge(self, other):
+
+        count = self.count + other.count
+        if count == 0:
+            return
+
+        delta      = other.mean - self.mean
+        self.mean  = self.mean + delta * (other.count / count)
+        self.M2    = self.M2 + other.M2 + delta**2 * (self.count * other.count / count)
+        self.count = count
+
+        self.min   = np.minimum(self.min, other.min)
+        self.max   = np.maximum(self.max, other.max)
+
+        return
+
+    @property
+    def variance(self):
+        if self.count < 2:
+            return np.zeros(np.size(self.mean))
+        return self.M2 / (self.count - 1)
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+class P2Quantile():
+    """
+    Estimate of quantile p of arrays of values added one at a time,
+    per element, with the P^2 algorithm (Jain & Chlamtac 1985): five
+    markers per element are kept and moved with piecewise parabolic
+    interpolation, so memory does not grow with the number of values.
+    Exact while fewer than five values have been added.
+    """
+
+    def __init__(self, p, size):
+
+        self.p     = p
+        self.count = 0
+
+        self.q     = np.zeros((5, size))                           # marker heights
+        self.n     = np.tile(np.arange(5.0)[:,None], (1, size))    # marker positions
+        self.n_des = np.tile(np.array([0.0, 2.0*p, 4.0*p, 2.0 + 2.0*p, 4.0])[:,None], (1, size))
+        self.dn    = np.array([0.0, 0.5*p, p, 0.5*(1.0 + p), 1.0])[:,None]
+
+        return
+
+    def add(self, x):
+
+        if self.count < 5:
+            self.q[self.count] = x
+            self.count += 1
+            if self.count == 5:
+                self.q.sort(axis = 0)
+            return
+
+        self.count += 1
+        q, n = self.q, self.n
+
+        #
+        # cell k that x falls in, stretching the extreme markers if needed
+        #
+        q[0] = np.minimum(q[0], x)
+        q[4] = np.maximum(q[4], x)
+        k    = np.clip(np.sum(x[None,:] >= q[1:4], axis = 0), 0, 3)
+
+        n += (np.arange(5)[:,None] > k[None,:])
+        self.n_des += self.dn
+
+        #
+        # adjust the three middle markers
+        #
+        for i in [1, 2, 3]:
+            d    = self.n_des[i] - n[i]
+            move = ((d >= 1.0) & (n[i+1] - n[i] > 1.0)) | ((d <= -1.0) & (n[i-1] - n[i] < -1.0))
+
+            if not np.any(move):
+                continue
+
+            s = np.sign(d)
+
+            qp = q[i] + s / (n[i+1] - n[i-1]) * ((n[i] - n[i-1] + s) * (q[i+1] - q[i]) / (n[i+1] - n[i]) +\
+                                                 (n[i+1] - n[i] - s) * (q[i] - q[i-1]) / (n[i] - n[i-1]))
+
+            j  = np.where(s > 0, i + 1, i - 1)
+            qj = np.choose(j - (i - 1), [q[i-1], q[i], q[i+1]])
+            nj = np.choose(j - (i - 1), [n[i-1], n[i], n[i+1]])
+            ql = q[i] + s * (qj - q[i]) / (nj - n[i])
+
+            parabolic = (q[i-1] < qp) & (qp < q[i+1])
+
+            q[i] = np.where(move, np.where(parabolic, qp, ql), q[i])
+            n[i] = np.where(move, n[i] + s, n[i])
+
+        return
+
+    @property
+    def value(self):
+
+        if self.count == 0:
+            return np.full(np.shape(self.q)[1], np.nan)
+        elif self.count < 5:
+            return np.percentile(self.q[:self.count], 100.0 * self.p, axis = 0)
+
+        return 1.0 * self.q[2]
+
+def _resample_run(task):
+    """
+    Values of one run's summary on the sample times. The columns are
+    summed; with select, only rows where that column is positive are
+    used and time is measured from the first of them. The result is
+    optionally integrated in time and divided by normalize (a number
+    or a column name).
+    """
+
+    filename, columns, sample_times, select, integrate, normalize = task
+
+    table = SummaryTable(filename)
+
+    names = ['t'] + list(columns)
+    if isinstance(normalize, str):
+        names = names + [normalize]
+    if not (select is None):
+        names = names + [select]
+
+    data = table.select(list(dict.fromkeys(names)))
+    table.close()
+
+    rows = slice(None) if select is None else data[select] > 0
+
+    x = data['t'][rows]
+    if not (select is None):
+        x = x - np.min(x)
+
+    y      = np.sum([data[c][rows] for c in columns], axis = 0)
+    values = np.interp(sample_times, x, y)
+
+    if integrate:
+        values[1:] = np.cumsum(0.5 * (values[1:] + values[:-1]) * np.diff(sample_times))
+        values[0]  = 0.0
+
+    if isinstance(normalize, str):
+        values = values / np.interp(sample_times, x, data[normalize][rows])
+    elif not (normalize is None):
+        values = values * normalize
+
+    return values
+
+def _cache_key(files, options):
+    """
+    Hash of the input files, their modification times and sizes, and
+    the aggregation options
+    """
+
+    h = hashlib.sha1()
+    h.update(json.dumps(options, sort_keys = True).encode())
+
+    for f in files:
+        st = os.stat(f)
+        h.update(("%s %i %i\n"%(os.path.abspath(f), st.st_mtime_ns, st.st_size)).encode())
+
+    return h.hexdigest()
+
+def aggregate_summaries(files, columns, sample_times = None, select = None,
+                        integrate = False, normalize = None,
+                        quantiles = None, n_workers = None, chunksize = None,
+                        cache_dir = None):
+    """
+    Mean, standard deviation, min, max and quantiles (P^2 estimates)
+    over the runs in files of a summary column (or the sum of a list of
+    columns), resampled onto sample_times (default 0 - 150 Myr every
+    1 Myr). See _resample_run for select, integrate and normalize.
+    quantiles is a dictionary name -> p (default q1, median and q3).
+
+    Runs are read on n_workers processes (default one per core; 1 reads
+    them in this process) and only the resampled values of the runs in
+    flight are held in memory. With cache_dir, the result is saved
+    there and reused until any input file changes.
+
+    Returns a dictionary of arrays with the time grid under 't' and the
+    number of runs under 'count'.
+    """
+
+    if isinstance(columns, str):
+        columns = [columns]
+
+    if sample_times is None:
+        sample_times = np.arange(0.0, 150.0, 1.0)
+    sample_times = np.asarray(sample_times, dtype = np.float64)
+
+    if quantiles is None:
+        quantiles = _default_quantiles
+
+    files = sorted(files)
+    if len(files) == 0:
+        _my_print("No summary files to aggregate")
+        raise ValueError
+
+    cache_name = None
+    if not (cache_dir is None):
+        options = {'columns' : list(columns), 'sample_times' : sample_times.tolist(),
+                   'select' : select, 'integrate' : integrate, 'normalize' : normalize,
+                   'quantiles' : quantiles}
+        cache_name = os.path.join(cache_dir, 'ensemble_statistics_' +\
+                                             _cache_key(files, options) + '.npz')
+
+        if os.path.isfile(cache_name):
+            with np.load(cache_name) as cached:
+                return {k : cached[k] for k in cached.files}
+
+    npoints = np.size(sample_times)
+    moments = RunningStatistics(npoints)
+    sketch  = {name : P2Quantile(p, npoints) for name, p in quantiles.items()}
+
+    tasks = [(f, list(columns), sample_times, select, integrate, normalize) for f in files]
+
+    if n_workers is None:
+        n_workers = multiprocessing.cpu_count()
+    n_workers = max(1, min(n_workers, len(tasks)))
+
+    if chunksize is None:
+        chunksize = max(1, len(tasks) // (4 * n_workers))
+
+    def _add(values):
+        moments.add(values)
+        for s in sketch.values():
+            s.add(values)
+        return
+
+    if n_workers == 1:
+        for task in tasks:
+            _add(_resample_run(task))
+    else:
+        with multiprocessing.Pool(processes = n_workers) as pool:
+            for values in pool.imap(_resample_run, tasks, chunksize = chunksize):
+                _add(values)
+
+    stats = {'t'     : sample_times,
+             'count' : np.array(moments.count),
+             'mean'  : moments.mean,
+             'std'   : moments.std,
+             'min'   : moments.min,
+             'max'   : moments.max}
+
+    for name, s in sketch.items():
+        stats[name] = s.value
+
+    if not (cache_name is None):
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        tmp_name = cache_name[:-4] + '.tmp.npz'
+        np.savez(tmp_name, **stats)
+        os.replace(tmp_name, cache_name)
+
+    return stats
+
+def _my_print(string):
+    print("[EnsembleStatistics]: " + string)
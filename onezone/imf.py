@@ -16,11 +16,12 @@ class IMF(object):
         raise NotImplementedError
 
     def sample(self, N = None, M = None, npoints = 1000,
-                     regenerate_table = False):
+                     regenerate_table = False, rng = None):
         """
         Sample the given imf using a cumulative distribution
         sampled at npoints. Sample until N stars are obtained
-        or M mass is reached. 
+        or M mass is reached. Random numbers are drawn from rng
+        (numpy Generator) if given, otherwise from np.random.
         """
 
         # if needed, regenerated tabulated imf
@@ -42,7 +43,10 @@ class IMF(object):
             return i
 
         if (not (N is None)) and M is None:
-            random_numbers = np.random.rand(N)
+            if rng is None:
+                random_numbers = np.random.rand(N)
+            else:
+                random_numbers = rng.random(N)
             stars = np.zeros(N)
 
             for i in np.arange(N):
@@ -71,7 +75,7 @@ class IMF(object):
            #config.global_values.profiler.start_timer('c_sample_imf',True)
            stars = np.asarray(c_sample_imf.sample_imf(self._tabulated_imf, M, 0,
                                      self._tabulated_dm, self._M_min, self._M_max,
-                                     np.size(self._tabulated_imf)))
+                                     np.size(self._tabulated_imf), rng))
            stars = stars[ stars>0 ]
            #config.global_values.profiler.end_timer('c_sample_imf')
            i     = np.size(stars)
@@ -0,0 +1,461 @@
+"""
+
+    Author : A. Emerick
+
+    Purpose: Read the outputs of a run (summaries, dumps, and abundance
+             output) lazily. Files are opened when first asked for and
+             only the requested columns and rows are read, so opening
+             a run with many snapshots is cheap:
+
+                 >>> run = Run('.')
+                 >>> t, M_gas = run.summary.select(['t', 'M_gas'], t_max = 500.0).values()
+                 >>> len(run.snapshots)
+                 >>> mass = run.snapshots[-1]['mass']
+                 >>> Fe   = run.abundances['Fe']
+
+             This module does not import the rest of onezone (in
+             particular not the stellar data tables) so it is quick to
+             load for analysis.
+
+"""
+
+__author__ = "aemerick <emerick@astro.columbia.edu>"
+
+# external
+import numpy as np
+import os, glob, h5py
+
+# internal
+from .config import abundance_table
+
+#
+# summary files with these extensions are HDF5 (see zone._hdf5_extensions)
+#
+_hdf5_extensions = ['.h5', '.hdf5']
+
+class SummaryTable():
+    """
+    Summary output (see Zone.write_summary_output) as named columns.
+    HDF5 summaries are read from the file one column at a time when
+    asked for. ASCII summaries are read in full on first use; use
+    convert_summary to turn them into HDF5 files.
+    """
+
+    def __init__(self, filename):
+
+        self.filename = filename
+        self.is_hdf5  = os.path.splitext(filename)[1] in _hdf5_extensions
+
+        if self.is_hdf5:
+            self.h5f     = h5py.File(filename, 'r')
+            self._data   = self.h5f['summary']
+            self.names   = [n.decode() for n in self.h5f.attrs['names']]
+        else:
+            self.h5f     = None
+            self._data   = None
+            with open(filename, 'r') as f:
+                self.names = f.readline().split()
+
+        self._columns = dict(zip(self.names, range(len(self.names))))
+        self._time    = None
+
+        return
+
+    def _load(self):
+        if self._data is None:
+            self._data = np.atleast_2d(np.loadtxt(self.filename, skiprows = 1))
+        return self._data
+
+    def __len__(self):
+        return np.shape(self._load())[0]
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    def __getitem__(self, name):
+        return self.column(name)
+
+    def column(self, name, rows = slice(None)):
+        """
+        One column as an array, optionally only the given rows (a slice)
+        """
+
+        if not (name in self._columns):
+            print("Summary output has no column " + str(name))
+            raise KeyError(name)
+
+        return self._load()[rows, self._columns[name]]
+
+    @property
+    def time(self):
+        if self._time is None:
+            self._time = self.column('t')
+        return self._time
+
+    def rows(self, t_min = None, t_max = None):
+        """
+        Slice of the rows with t_min <= t <= t_max
+        """
+
+        start = 0         if t_min is None else np.searchsorted(self.time, t_min, side = 'left')
+        end   = len(self) if t_max is None else np.searchsorted(self.time, t_max, side = 'right')
+
+        return slice(int(start), int(end))
+
+    def select(self, names = None, t_min = None, t_max = None):
+        """
+        Dictionary of the named columns (default all), restricted to
+        the rows with t_min <= t <= t_max
+        """
+
+        if names is None:
+            names = self.names
+
+        rows = self.rows(t_min, t_max)
+
+        return {name : self.column(name, rows) for name in names}
+
+    def as_records(self, names = None, t_min = None, t_max = None):
+        """
+        Named columns as a structured array, as np.genfromtxt(names = True)
+        gives for ASCII summaries
+        """
+
+        data = self.select(names, t_min, t_max)
+        return np.core.records.fromarrays(list(data.values()), names = list(data.keys()))
+
+    def close(self):
+        if not (self.h5f is None):
+            self.h5f.close()
+        return
+
+def convert_summary(filename, outname = None, chunk_rows = 1024):
+    """
+    Convert an ASCII summary file to the HDF5 summary format written by
+    Zone.write_summary_output. The output name defaults to filename
+    with its extension replaced by '.h5'. Returns the output name.
+    """
+
+    if outname is None:
+        outname = os.path.splitext(filename)[0] + '.h5'
+
+    if os.path.splitext(outname)[1] not in _hdf5_extensions:
+        print("Converted summary must have one of the extensions " + str(_hdf5_extensions))
+        raise ValueError
+
+    with open(filename, 'r') as f:
+        names = f.readline().split()
+
+    data = np.loadtxt(filename, skiprows = 1, ndmin = 2)
+
+    with h5py.File(outname, 'w') as hf:
+        hf.attrs['names'] = np.array(names, dtype = 'S')
+        hf.create_dataset('summary', data = data, maxshape = (None, len(names)),
+                          chunks = (max(min(np.shape(data)[0], chunk_rows), 1), len(names)))
+
+    return outname
+
+class Snapshot():
+    """
+    One dump of a run. Star columns are read from the file when asked
+    for; snapshot['mass'] reads only the masses. Delta snapshots
+    (io.dump_delta) are rebuilt from the changes up to this snapshot.
+    """
+
+    def __init__(self, snapshots, i):
+        self._snapshots = snapshots
+        self.number     = int(snapshots.numbers[i])
+        self._i         = i
+        return
+
+    @property
+    def time(self):
+        return self._snapshots.times[self._i]
+
+    @property
+    def zone(self):
+        """
+        Zone values at this snapshot as a dictionary
+        """
+        return dict(self._snapshots._group(self._i)['zone'].attrs.items())
+
+    @property
+    def names(self):
+        return self._snapshots._star_names(self._i)
+
+    def __getitem__(self, name):
+        return self._snapshots._star_column(self._i, name)
+
+    def as_dict(self):
+        return {name : self[name] for name in self.names}
+
+class SnapshotSet():
+    """
+    The dumps of a run, either one file per dump (<basename>_XXXX.h5)
+    or a single file (io.dump_single_file), indexed in output order.
+    Nothing is read from the dump files until a snapshot is used,
+    apart from the index of the single file.
+    """
+
+    def __init__(self, basename):
+
+        self.basename = basename
+
+        if os.path.isfile(basename + '.h5') and h5py.is_hdf5(basename + '.h5'):
+            self.single_file = True
+            self.h5f         = h5py.File(basename + '.h5', 'r')
+            index            = self.h5f['index'][()]
+            self.numbers     = index['output_number']
+            self.cycles      = index['cycle']
+            self.N_stars     = index['N_stars']
+            self._times      = index['time']
+            self.files       = None
+            self.delta       = 'stars_static' in self.h5f
+        else:
+            self.single_file = False
+            self.h5f         = None
+            self.files       = sorted(glob.glob(basename + '_[0-9][0-9][0-9][0-9].h5'))
+            self.numbers     = np.array([int(f[-7:-3]) for f in self.files], dtype = np.int64)
+            self._times      = None
+            self.delta       = False
+
+        self._open = {}
+        return
+
+    def __len__(self):
+        return np.size(self.numbers)
+
+    def __getitem__(self, i):
+
+        if i < 0:
+            i = i + len(self)
+
+        if i < 0 or i >= len(self):
+            raise IndexError(i)
+
+        return Snapshot(self, i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield Snapshot(self, i)
+
+    @property
+    def times(self):
+        """
+        Snapshot times. For per-file dumps this opens each file once.
+        """
+
+        if self._times is None:
+            self._times = np.array([self._file(i).attrs['current_time'] for i in range(len(self))])
+
+        return self._times
+
+    def select(self, t_min = None, t_max = None):
+        """
+        Snapshots with t_min <= time <= t_max
+        """
+
+        times  = self.times
+        select = np.ones(np.size(times), dtype = bool)
+        if not (t_min is None):
+            select = select * (times >= t_min)
+        if not (t_max is None):
+            select = select * (times <= t_max)
+
+        return [Snapshot(self, i) for i in np.where(select)[0]]
+
+    def _file(self, i):
+
+        if self.single_file:
+            return self.h5f
+
+        if not (i in self._open):
+            self._open[i] = h5py.File(self.files[i], 'r')
+
+        return self._open[i]
+
+    def _group(self, i):
+
+        if self.single_file:
+            return self.h5f['snapshots']["%0004i"%(self.numbers[i])]
+
+        return self._file(i)
+
+    def _star_names(self, i):
+
+        if not self.single_file:
+            return list(self._file(i)['star'].keys())
+
+        if self.delta:
+            return list(self.h5f['stars_static'].dtype.names) + ['mass', 'type', 'age']
+
+        return list(self._group(i)['stars'].dtype.names)
+
+    def _star_column(self, i, name):
+
+        if not self.single_file:
+            star_grp = self._file(i)['star']
+            if star_grp.attrs['number_of_stars'] == 0:
+                return np.zeros(0, dtype = star_grp[name].dtype)
+            return star_grp[name][()]
+
+        if not self.delta:
+            return self._group(i)['stars'].fields(name)[()]
+
+        N_stars = self.N_stars[i]
+        static  = self.h5f['stars_static']
+
+        if name in static.dtype.names:
+            return static.fields(name)[:N_stars]
+
+        if name == 'age':
+            return self.times[i] - static.fields('tform')[:N_stars]
+
+        if not (name in ['mass', 'type']):
+            print("Snapshots have no star column " + str(name))
+            raise KeyError(name)
+
+        values = np.zeros(N_stars, dtype = 'S32' if name == 'type' else np.float64)
+        for j in range(i + 1):
+            changes = self._group(j)['changes']
+            values[changes.fields('index')[()]] = changes.fields(name)[()]
+
+        return values
+
+    def close(self):
+
+        if not (self.h5f is None):
+            self.h5f.close()
+
+        for hf in self._open.values():
+            hf.close()
+        self._open = {}
+
+        return
+
+def read_snapshot(filename, number):
+    """
+    Star data from snapshot number of a single file dump (io.dump_single_file),
+    as a dictionary of arrays (mass, birth_mass, metallicity, age, type, and
+    for delta snapshots also id and tform), plus the zone values under 'zone'
+    and the time under 'time'. Delta snapshots (io.dump_delta) are rebuilt
+    from the changes in all earlier snapshots; there age is computed from
+    the snapshot time and the star formation times.
+    """
+
+    snapshots = SnapshotSet(os.path.splitext(filename)[0])
+
+    i = np.where(snapshots.numbers == number)[0]
+    if np.size(i) == 0:
+        snapshots.close()
+        print("No snapshot %i in "%(number) + filename)
+        raise ValueError
+
+    snapshot = snapshots[int(i[0])]
+
+    data = snapshot.as_dict()
+    data['time'] = snapshot.time
+    data['zone'] = snapshot.zone
+
+    snapshots.close()
+
+    return data
+
+def read_events(filename, names = None):
+    """
+    Stellar events written by the event log (io.event_output_filename),
+    as a structured array with the named columns (default all): t, id,
+    M_o, Z, event (index in config.event_log.types), and the SN ejecta
+    mass of each species
+    """
+
+    with h5py.File(filename, 'r') as hf:
+        dataset = hf['events']
+        columns = [n.decode() if isinstance(n, bytes) else str(n) for n in dataset.attrs['names']]
+
+        if names is None:
+            names = columns
+
+        data = [dataset[:, columns.index(name)] for name in names]
+
+    return np.core.records.fromarrays(data, names = list(names))
+
+class Run():
+    """
+    All outputs of a run in directory path, found from the output names
+    the run was configured with (see config.io). Each output is opened
+    the first time it is used.
+    """
+
+    def __init__(self, path = '.', summary = 'summary_output.h5',
+                       dump = 'dump', abundances = 'abundances.h5',
+                       events = 'events.h5'):
+
+        self.path = path
+
+        self._summary_name    = self._find_summary(summary)
+        self._dump_name       = os.path.join(path, dump)
+        self._abundances_name = os.path.join(path, abundances)
+        self._events_name     = os.path.join(path, events)
+
+        self._summary    = None
+        self._snapshots  = None
+        self._abundances = None
+
+        return
+
+    def _find_summary(self, name):
+        #
+        # fall back on the ASCII summary of older runs
+        #
+        filename = os.path.join(self.path, name)
+        if not os.path.isfile(filename):
+            for ext in ['.txt', '.dat', ''] + _hdf5_extensions:
+                other = os.path.splitext(filename)[0] + ext
+                if os.path.isfile(other):
+                    return other
+
+        return filename
+
+    @property
+    def summary(self):
+        if self._summary is None:
+            self._summary = SummaryTable(self._summary_name)
+        return self._summary
+
+    @property
+    def snapshots(self):
+        if self._snapshots is None:
+            self._snapshots = SnapshotSet(self._dump_name)
+        return self._snapshots
+
+    @property
+    def abundances(self):
+        if self._abundances is None:
+            self._abundances = abundance_table(self._abundances_name)
+        return self._abundances
+
+    def events(self, names = None):
+        """
+        Stellar events of the run (see read_events)
+        """
+        return read_events(self._events_name, names)
+
+    def close(self):
+
+        for output in [self._summary, self._snapshots, self._abundances]:
+            if not (output is None):
+                output.close()
+
+        self._summary    = None
+        self._snapshots  = None
+        self._abundances = None
+
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
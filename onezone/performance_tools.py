@@ -1,111 +1,695 @@
+"""
+
+    Author : A. Emerick
+
+    Purpose: Hierarchical profiler for runs. Timers nest, so each
+             scope is timed within whatever scope was open when it
+             started, and its wall and CPU time, call count, and self
+             time (time not spent in nested scopes) are kept:
+
+                 >>> prof = Profiler()
+                 >>> prof.start_timer('evolve_stars')
+                 >>> ...
+                 >>> prof.end_timer('evolve_stars')
+
+                 >>> with prof.scope('make_stars'):
+                 ...     ...
+
+                 >>> @prof.profile()
+                 ... def compute():
+                 ...     ...
+
+             When profiling is off, start_timer and end_timer are
+             replaced by functions that do nothing. Totals are appended
+             to a JSON lines file (one record per write) every
+             write_interval cycles, see end_cycle.
+
+             With trace_size > 0 the profiler also keeps the last
+             trace_size begin / end events of its timers, tagged with
+             the cycle, number of stars, and simulation time, which
+             write_trace exports as Chrome trace event JSON for
+             chrome://tracing or https://ui.perfetto.dev
+
+             SamplingProfiler instead samples the Python stack on a
+             CPU time interval timer, so code nobody put a timer
+             around shows up too. Its folded stacks can be turned into
+             a flame graph with flamegraph.pl or speedscope.
+
+             rss, object_size, and sample_size measure memory use
+             (see Zone._check_memory).
+
+"""
+
+__author__ = "aemerick <emerick@astro.columbia.edu>"
+
+# external
 import numpy as np
-import time
+import functools
+import json
 import os
+import signal
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def _no_op(*args, **kwargs):
+    return
+
+class _NullScope():
+    """
+    Context manager that does nothing, for scopes when profiling is off
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+_null_scope = _NullScope()
+
+class _Scope():
+    """
+    Totals of one timer at one place in the timer tree
+    """
+
+    __slots__ = ['name', 'parent', 'children', 'count',
+                 'wall', 'cpu', 'child_wall', 'child_cpu']
+
+    def __init__(self, name, parent = None):
+        self.name     = name
+        self.parent   = parent
+        self.children = {}
+
+        self.count      = 0
+        self.wall       = 0.0
+        self.cpu        = 0.0
+        self.child_wall = 0.0
+        self.child_cpu  = 0.0
+
+        return
+
+    @property
+    def path(self):
+        if self.parent is None or self.parent.parent is None:
+            return self.name
+        return self.parent.path + '/' + self.name
+
+    def __iter__(self):
+        # depth first, children in order of first use
+        for child in self.children.values():
+            yield child
+            for scope in child:
+                yield scope
+
+class _TimedScope():
+
+    __slots__ = ['profiler', 'name']
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name     = name
+        return
+
+    def __enter__(self):
+        self.profiler.start_timer(self.name)
+        return self
+
+    def __exit__(self, *args):
+        self.profiler.end_timer(self.name)
+        return False
+
+class TraceRecorder():
+    """
+    Begin and end events of timers in a preallocated ring buffer of
+    size events; once it is full the oldest events are overwritten.
+    Each event has its time (microseconds), timer, phase (0 begin,
+    1 end), and the cycle, number of stars, and simulation time last
+    given to set_context.
+    """
+
+    def __init__(self, size = 65536):
+
+        self.timers = []     # timer names, events store the index
+        self._index = {}
+
+        self.rows     = np.zeros( (max(size, 1), 6) )
+        self.count    = 0     # events in the buffer
+        self.start    = 0     # oldest event in the buffer
+        self.N_events = 0     # all events added
+
+        self.cycle    = 0
+        self.N_stars  = 0
+        self.t        = 0.0
+
+        return
+
+    def set_context(self, cycle, N_stars, t):
+        self.cycle   = cycle
+        self.N_stars = N_stars
+        self.t       = t
+        return
+
+    def add(self, timername, phase, timestamp):
+
+        i = self._index.get(timername)
+        if i is None:
+            i = len(self.timers)
+            self._index[timername] = i
+            self.timers.append(timername)
+
+        size = np.shape(self.rows)[0]
+        if self.count == size:
+            self.start  = (self.start + 1) % size
+            self.count -= 1
+
+        row = self.rows[(self.start + self.count) % size]
+        row[0] = timestamp * 1.0E6
+        row[1] = i
+        row[2] = phase
+        row[3] = self.cycle
+        row[4] = self.N_stars
+        row[5] = self.t
+
+        self.count    += 1
+        self.N_events += 1
+
+        return
+
+    def recent(self):
+        """
+        The events still in the buffer, oldest first
+        """
+        order = (self.start + np.arange(self.count)) % np.shape(self.rows)[0]
+        return self.rows[order]
+
+    def trace_events(self, pid = 0, tid = 0):
+        """
+        Buffered events as a list of Chrome trace events. End events
+        whose begin event has been overwritten are left out.
+        """
+
+        events = []
+        open_timers = []
+
+        for row in self.recent():
+            name = self.timers[int(row[1])]
+
+            if row[2] == 0:
+                open_timers.append(name)
+            elif name in open_timers:
+                del open_timers[len(open_timers) - 1 - open_timers[::-1].index(name)]
+            else:
+                continue
+
+            events.append({'name' : name, 'cat' : 'onezone',
+                           'ph'   : 'B' if row[2] == 0 else 'E',
+                           'ts'   : row[0], 'pid' : pid, 'tid' : tid,
+                           'args' : {'cycle' : int(row[3]), 'N_stars' : int(row[4]),
+                                     't' : row[5]}})
+
+        return events
+
+    def write(self, filename, pid = 0, tid = 0):
+        """
+        Write the buffered events to filename as Chrome trace JSON
+        """
+
+        trace = {'traceEvents'     : self.trace_events(pid, tid),
+                 'displayTimeUnit' : 'ms',
+                 'otherData'       : {'events_recorded' : int(self.N_events),
+                                      'events_kept'     : int(self.count)}}
+
+        with open(filename, 'w') as f:
+            json.dump(trace, f)
+
+        return
+
+class Profiler():
+    """
+    Nested wall and CPU time of named scopes. Scopes are opened with
+    start_timer and closed with end_timer (or with scope / profile),
+    and must be closed in the reverse order they were opened; closing
+    a scope also closes any scopes still open inside it (e.g. when an
+    exception skipped their end_timer).
+
+    Totals are appended to filename by write_performance, or every
+    write_interval cycles by end_cycle (0 writes only when asked).
+
+    With trace_size > 0 begin / end events are also recorded (see
+    TraceRecorder) and written to trace_filename by write_trace.
+    """
 
+    def __init__(self, allow_profiling = True, filename = 'performance.jsonl',
+                       write_interval = 100, trace_size = 0,
+                       trace_filename = 'trace.json'):
 
-class PerformanceTimer:
+        self.filename       = filename
+        self.write_interval = write_interval
+        self.trace_filename = trace_filename
+
+        self._root       = _Scope('root')
+        self._stack      = [(self._root, 0.0, 0.0)]
+        self._last_write = None
+
+        self.tracer      = TraceRecorder(trace_size) if trace_size > 0 else None
+        self._t0         = time.perf_counter()
 
-    def __init__(self, allow_profiling = True):
-        self.performance = {}
-        self.num_calls   = {}
-        self._start_time = {}
         self.allow_profiling = allow_profiling
+        self._bind()
+
+        return
 
-        self.ignore_in_sum = {}
+    def _bind(self):
+        if self.allow_profiling:
+            self.start_timer = self._start_timer
+            self.end_timer   = self._end_timer
+        else:
+            self.start_timer = _no_op
+            self.end_timer   = _no_op
+        return
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['start_timer']
+        del state['end_timer']
+        return state
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._bind()
         return
 
     def timing_on(self):
         self.allow_profiling = True
+        self._bind()
         return
 
     def timing_off(self):
         self.allow_profiling = False
+        self._bind()
         return
 
     def get_timers(self):
-        return self.performance.keys()
+        """
+        Paths of all timers used so far ('outer/inner')
+        """
+        return [scope.path for scope in self._root]
+
+    def _start_timer(self, timername, subprocess = False):
+        # subprocess is kept for older callers; nested timers are now
+        # always accounted for within the scope they were started in
+        parent = self._stack[-1][0]
+        scope  = parent.children.get(timername)
+        if scope is None:
+            scope = _Scope(timername, parent)
+            parent.children[timername] = scope
+
+        wall = time.perf_counter()
+        self._stack.append((scope, wall, time.process_time()))
+
+        if not (self.tracer is None):
+            self.tracer.add(timername, 0, wall - self._t0)
 
-    def start_timer(self, timername, subprocess=False):
-        if not self.allow_profiling:
-            return
+        return
+
+    def _end_timer(self, timername):
+        wall = time.perf_counter()
+        cpu  = time.process_time()
 
-        if timername in self._start_time.keys():
-            if self._start_time[timername] > 0:
-                print("Error. Timer already started: ", self._start_time[timername], timername)
+        stack = self._stack
+
+        if stack[-1][0].name != timername:
+            if not any(frame[0].name == timername for frame in stack[1:]):
+                print("Trying to end a performance timer that was not started ", timername)
                 raise RuntimeError
 
-        self.ignore_in_sum[timername] = subprocess
+        while True:
+            scope, wall_start, cpu_start = stack.pop()
+
+            scope.count += 1
+            scope.wall  += wall - wall_start
+            scope.cpu   += cpu  - cpu_start
+            scope.parent.child_wall += wall - wall_start
+            scope.parent.child_cpu  += cpu  - cpu_start
 
-        self._start_time[timername] = time.process_time()
+            if not (self.tracer is None):
+                self.tracer.add(scope.name, 1, wall - self._t0)
 
-        if not timername in self.performance.keys():
-            self.performance[timername] = 0.0
-            self.num_calls[timername]   = 0
+            if scope.name == timername:
+                break
 
         return
 
-    def end_timer(self, timername):
+    def scope(self, timername):
+        """
+        Context manager timing the block it encloses
+        """
+
         if not self.allow_profiling:
-            return
+            return _null_scope
+
+        return _TimedScope(self, timername)
+
+    def profile(self, timername = None):
+        """
+        Decorator timing every call of a function, under the function
+        name unless timername is given
+        """
+
+        def decorator(function):
+            name = function.__name__ if timername is None else timername
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                self.start_timer(name)
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.end_timer(name)
+
+            return wrapper
+
+        return decorator
+
+    def records(self):
+        """
+        Totals of each timer as a list of dictionaries: path, count,
+        wall, cpu, self_wall, self_cpu, and frac (of the wall time of
+        the enclosing scope). Timers still open count up to now.
+        """
+
+        wall = time.perf_counter()
+        cpu  = time.process_time()
+
+        #
+        # time so far of the open timers
+        #
+        running = {}
+        for scope, wall_start, cpu_start in self._stack[1:]:
+            running[id(scope)] = (wall - wall_start, cpu - cpu_start)
+
+        def _totals(scope):
+            w, c = running.get(id(scope), (0.0, 0.0))
+            return scope.wall + w, scope.cpu + c
+
+        records = []
+        for scope in self._root:
+            w, c  = _totals(scope)
+            child = [_totals(s) for s in scope.children.values()]
+            cw    = np.sum([x[0] for x in child]) if len(child) > 0 else 0.0
+            cc    = np.sum([x[1] for x in child]) if len(child) > 0 else 0.0
+
+            parent_wall = w if scope.parent is self._root else _totals(scope.parent)[0]
+
+            records.append({'path'      : scope.path,
+                            'count'     : scope.count,
+                            'wall'      : w,
+                            'cpu'       : c,
+                            'self_wall' : w - cw,
+                            'self_cpu'  : c - cc,
+                            'frac'      : w / parent_wall if parent_wall > 0 else 0.0})
+
+        return records
+
+    def print_performance(self):
 
-        if not timername in self._start_time.keys():
-            print("Trying to end a performance timer does not exist ", timername)
-            raise RuntimeError
+        if not self.allow_profiling:
+            return
 
-        self.performance[timername] += (time.process_time() - self._start_time[timername])
-        self.num_calls[timername]   += 1
-        self._start_time[timername] = 0.0
+        print("%-40s %8s %12s %12s %12s %8s"%('name', 'count', 'wall', 'cpu', 'self_wall', 'frac'))
+        for r in self.records():
+            depth = r['path'].count('/')
+            name  = '  ' * depth + r['path'].split('/')[-1]
+            print("%-40s %8i %12.5E %12.5E %12.5E %8.4f"%(name, r['count'], r['wall'],
+                                                          r['cpu'], r['self_wall'], r['frac']))
 
         return
 
-    def print_performance(self):
+    def write_performance(self, outstr = None, outname = None, **info):
+        """
+        Append the current totals to outname (default filename) as one
+        JSON record, with outstr under 'label' and any keyword values
+        (e.g. cycle and time) as fields of the record
+        """
 
         if not self.allow_profiling:
             return
 
-        total_time = np.sum([ self.performance[k] for k in self.performance.keys() if (not self.ignore_in_sum[k])])
+        if outname is None:
+            outname = self.filename
 
-        for k in self.performance.keys():
-            n = self.num_calls[k]
-            t = self.performance[k]
-            if self.ignore_in_sum[k]:
-                frac = 0.0
-            else:
-                frac = t / total_time
-            e
-            print("%20s  %00005i  %5.5E   %5.5E"%(k,n,t,frac))
+        record = dict(info)
+        if not (outstr is None):
+            record['label'] = outstr.strip()
+        record['timers'] = self.records()
+
+        with open(outname, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+        return
 
+    def set_context(self, cycle, t = 0.0, N_stars = 0):
+        """
+        Cycle, simulation time, and number of stars given to the trace
+        events that follow
+        """
+        if not (self.tracer is None):
+            self.tracer.set_context(cycle, N_stars, t)
         return
 
-    def write_performance(self, outstr = None, outname = 'performance.out'):
+    def write_trace(self, outname = None):
+        """
+        Write the recorded trace events to outname (default trace_filename)
+        """
+
+        if not self.allow_profiling or self.tracer is None:
+            return
+
+        if outname is None:
+            outname = self.trace_filename
+
+        self.tracer.write(outname)
+
+        return
+
+    def end_cycle(self, cycle, t = None, N_stars = 0):
+        """
+        Called once per cycle; writes the totals every write_interval cycles
+        """
+
         if not self.allow_profiling:
             return
 
-        write_header=False
-        if not os.path.isfile(outname):
-            write_header = True
+        if not (self.tracer is None):
+            self.tracer.set_context(cycle, N_stars, 0.0 if t is None else t)
 
-        f = open(outname, 'a')
+        if self.write_interval <= 0:
+            return
 
-        if write_header:
-            f.write("name     count     time    frac\n")
+        if self._last_write is None:
+            self._last_write = cycle
+        elif cycle - self._last_write >= self.write_interval:
+            self.write_performance(cycle = int(cycle), time = t)
+            self._last_write = cycle
 
-        if not (outstr is None):
-            f.write(outstr)
+        return
 
-        total_time = np.sum([ self.performance[k] for k in self.performance.keys() if (not self.ignore_in_sum[k])])
+class SamplingProfiler():
+    """
+    Statistical profiler: every interval seconds of CPU time (SIGPROF
+    from setitimer) the Python stack of the main thread is recorded,
+    and the number of samples of each distinct stack is kept. Cython
+    functions have no Python frames, so their time is counted in the
+    Python function that called them.
 
-        for k in self.performance.keys():
-            n = self.num_calls[k]
-            t = self.performance[k]
-            if self.ignore_in_sum[k]:
-                frac = 0.0
-            else:
-                frac = t / total_time
+    Only the main thread can receive the signal; elsewhere, or where
+    setitimer is not available, start does nothing and says so.
+    """
+
+    def __init__(self, interval = 0.01):
+
+        self.interval  = interval
+        self.counts    = {}        # stack (leaf first) -> samples
+        self.N_samples = 0
+        self.running   = False
+
+        self._labels        = {}   # code object -> frame label
+        self._handler_time  = 0.0  # time spent taking samples
+        self._sampled_time  = 0.0  # time sampling was on
+        self._started       = None
+        self._old_handler   = None
+
+        return
+
+    def _sample(self, signum, frame):
+        t0 = time.perf_counter()
 
-            f.write("%20s  %00005i  %5.5E   %5.5E\n"%(k,n,t,frac))
+        labels = self._labels
+        stack  = []
+        while not (frame is None):
+            code  = frame.f_code
+            label = labels.get(code)
+            if label is None:
+                label = "%s (%s:%i)"%(code.co_name, os.path.basename(code.co_filename),
+                                      code.co_firstlineno)
+                labels[code] = label
+            stack.append(label)
+            frame = frame.f_back
 
-        f.close()
+        stack = tuple(stack)
+        self.counts[stack] = self.counts.get(stack, 0) + 1
+        self.N_samples    += 1
+
+        self._handler_time += time.perf_counter() - t0
 
         return
+
+    def start(self):
+
+        if self.running:
+            return
+
+        if not hasattr(signal, 'setitimer') or\
+           threading.current_thread() is not threading.main_thread():
+            print("Sampling profiler needs setitimer and the main thread. Not sampling")
+            return
+
+        self._old_handler = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+        self._started = time.perf_counter()
+        self.running  = True
+
+        return
+
+    def stop(self):
+
+        if not self.running:
+            return
+
+        signal.setitimer(signal.ITIMER_PROF, 0.0, 0.0)
+        signal.signal(signal.SIGPROF, self._old_handler)
+
+        self._sampled_time += time.perf_counter() - self._started
+        self.running = False
+
+        return
+
+    @property
+    def overhead(self):
+        """
+        Fraction of the sampled time spent taking samples
+        """
+        if self._sampled_time <= 0:
+            return 0.0
+        return self._handler_time / self._sampled_time
+
+    def folded(self):
+        """
+        Samples as folded stack lines ('root;...;leaf count'), most
+        sampled first
+        """
+        return ["%s %i"%(';'.join(stack[::-1]), n) for stack, n in
+                    sorted(self.counts.items(), key = lambda x : -x[1])]
+
+    def write(self, filename):
+        """
+        Write the folded stacks to filename, the input format of
+        flamegraph.pl and speedscope
+        """
+
+        with open(filename, 'w') as f:
+            for line in self.folded():
+                f.write(line + '\n')
+
+        return
+
+def rss():
+    """
+    Resident memory of this process and its peak so far, in bytes
+    (zero where they can not be found)
+    """
+
+    current = 0
+    peak    = 0
+
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            current = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+
+    if not (resource is None):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform != 'darwin':
+            peak = peak * 1024     # kB, except on macOS
+
+    return current, max(current, peak)
+
+def object_size(obj, _seen = None):
+    """
+    Approximate bytes used by obj and the containers (dict, list,
+    tuple, set) and arrays it holds, counting shared objects once
+    """
+
+    if _seen is None:
+        _seen = set()
+
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    if isinstance(obj, np.ndarray):
+        return sys.getsizeof(obj)    # includes the data if obj owns it
+
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += object_size(k, _seen) + object_size(v, _seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for v in obj:
+            size += object_size(v, _seen)
+
+    return size
+
+def sample_size(objects, attributes = (), n_sample = 16):
+    """
+    Average bytes per object of n_sample objects spread evenly through
+    the list objects: the object itself plus the named attributes
+    """
+
+    n = len(objects)
+    if n == 0:
+        return 0.0
+
+    total = 0
+    index = np.unique(np.linspace(0, n - 1, min(n, n_sample)).astype(int))
+    for i in index:
+        x      = objects[i]
+        total += sys.getsizeof(x)
+        for a in attributes:
+            total += object_size(getattr(x, a))
+
+    return total / np.size(index)
+
+#
+# older name of the profiler
+#
+PerformanceTimer = Profiler
+
+def read_performance(filename):
+    """
+    Records written by Profiler.write_performance, as a list of
+    dictionaries in the order they were written
+    """
+
+    with open(filename, 'r') as f:
+        return [json.loads(line) for line in f if len(line.strip()) > 0]
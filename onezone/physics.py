@@ -95,7 +95,7 @@ def SNIa_yields( elements , return_dict = False):
 
 
 def SNIa_probability(t, t_form, lifetime, DTD_slope = 1.0, NSNIa = 0.043,
-                        z = 0.0):
+                        z = 0.0, hubble_time = None):
     """
     Delay time distribution model to calculate dP/dt for a given
     white dwarf to explode as a Type Ia supernova as a function of 
@@ -104,35 +104,45 @@ def SNIa_probability(t, t_form, lifetime, DTD_slope = 1.0, NSNIa = 0.043,
     of WD's that explode as a Type Ia supernova within a hubble time. This
     number is observationally informed, but depends on one's choice of IMF
     and the mass range of MS stars that can form Type Ia white dwarf
-    projenitors
+    projenitors. hubble_time (code units) defaults to that at z
+    from config.units.
     """
 
+    if hubble_time is None:
+        hubble_time = config.units.hubble_time(z)
+
     dPdt = NSNIa
 
     if (DTD_slope == 1.0):
-        dPdt /= np.log( (config.units.hubble_time(z) + t_form) / (t_form + lifetime ))
+        dPdt /= np.log( (hubble_time + t_form) / (t_form + lifetime ))
     else:
         dPdt *= (- DTD_slope + 1.0)
-        dPdt /= ( (config.units.hubble_time(z) + t_form)**(-DTD_slope + 1.0) -\
+        dPdt /= ( (hubble_time + t_form)**(-DTD_slope + 1.0) -\
                   (t_form + lifetime)**(-DTD_slope+1.0))
     
     dPdt *= (t)**(-DTD_slope)
 
     return dPdt
 
-def WD_lifetime(t, t_form, lifetime, DTD_slope = 1.0, NSNIa = 0.043, z = 0):
+def WD_lifetime(t, t_form, lifetime, DTD_slope = 1.0, NSNIa = 0.043, z = 0,
+                hubble_time = None, rng = None):
     """
     Delay time distribution model to c.alculate the exact time at which a given WD
     will explode as a Type Ia supernova. Time is given as its lifetime,
     t_explosion = lifetime + t_form, which will essentially be the lifetime of the
     progenitor MS star (an input) plus the time it will spend as a WD. t_explosion
     equals infinity if the star never explodes (as will happen ~90-95% of the time).
+    hubble_time (code units) defaults to that at z from config.units.
+    The random draw uses rng (numpy Generator) if given, else np.random.
     """
 
+    if hubble_time is None:
+        hubble_time = config.units.hubble_time(z)
+
     # set tabulated properties:
     npoints  = 1000
     min_time = np.log10(lifetime / 10.0)
-    max_time = np.log10(config.units.hubble_time(z))
+    max_time = np.log10(hubble_time)
     dt       = (max_time - min_time) / (1.0 * (npoints - 1))
 
     time = 10.0**(min_time + dt * np.arange(npoints))
@@ -140,20 +150,26 @@ def WD_lifetime(t, t_form, lifetime, DTD_slope = 1.0, NSNIa = 0.043, z = 0):
     # tabulate the probability using the SNIa_probability function
     tabulated_probability    = np.zeros(npoints)
     tabulated_probability[0] = SNIa_probability(time[0] + t_form + lifetime,
-                                                t_form, lifetime, DTD_slope, NSNIa, z)
+                                                t_form, lifetime, DTD_slope, NSNIa, z,
+                                                hubble_time)
 
-    tabulated  = SNIa_probability(time + t_form + lifetime, t_form, lifetime, DTD_slope, NSNIa, z)
+    tabulated  = SNIa_probability(time + t_form + lifetime, t_form, lifetime, DTD_slope, NSNIa, z,
+                                  hubble_time)
 
     f_a = tabulated[:-1]
     f_b = tabulated[1:]
     f_ab = SNIa_probability( 0.5*(time[1:] + time[:-1]) + t_form + lifetime,
-                             t_form, lifetime, DTD_slope, NSNIa, z )
+                             t_form, lifetime, DTD_slope, NSNIa, z,
+                             hubble_time)
 
 
     tabulated_probability[1:] = (1.0/6.0) * (time[1:] - time[0:-1])*(f_a + 4.0*f_ab + f_b)
     tabulated_probability     = np.cumsum(tabulated_probability)
 
-    rnum = np.random.random()
+    if rng is None:
+        rnum = np.random.random()
+    else:
+        rnum = rng.random()
 
     if ( rnum < tabulated_probability[0] ):
         # very highly unlikely, explode right away
@@ -162,7 +178,7 @@ def WD_lifetime(t, t_form, lifetime, DTD_slope = 1.0, NSNIa = 0.043, z = 0):
         WD_lifetime = time[0]
     elif (rnum > tabulated_probability[-1]):
         # never explode
-        WD_lifetime = 1000.0 * config.units.hubble_time(z)
+        WD_lifetime = 1000.0 * hubble_time
 
     else:
 
@@ -2,78 +2,40 @@ from galaxy_analysis.plot.plot_styles import *
 import numpy as np
 import matplotlib.pyplot as plt
 import sys, glob
-from scipy.integrate import cumtrapz
 
-def compute_property(fpath, property, integrate = False, normalize = None):
+from onezone.ensemble_statistics import aggregate_summaries
 
-    # load file to get names
-    files = np.sort(glob.glob(fpath + 'run????_summary_output.txt'))
-    f0    = np.genfromtxt(files[0], names = True)
-#    col   = np.where( np.array(f0.dtype.names) == property)[0][0]
+def compute_property(fpath, property, integrate = False, normalize = None,
+                     sample_times = None, n_workers = None, cache = True):
 
-    # resample output - don't assume output has same dt (and dt will change)
-    sample_times = np.arange(0.0, 150.0, 1.0)
-
-    nfiles   = np.size(files)
-    npoints  = np.size(sample_times)
-    all_data = np.zeros( (nfiles, npoints) )
-
-
-    for i in np.arange(nfiles):
-
-        temp = np.genfromtxt(files[i], names = True)
-
-        select = temp['M_star_o'] > 0
+    files = glob.glob(fpath + 'run????_summary_output.h5') +\
+            glob.glob(fpath + 'run????_summary_output.txt')
 
-        x    = temp['t'][select] - np.min(temp['t'][select])
-
-        # renormalize time
-#        x    = x - np.min(x[M_s>0])
-
-        norm = 1.0
-        if not (normalize is None):
-            if normalize == 'M_o':
-                norm = 1.0 / temp['M_star_o'][select]
-            else:
-                norm = normalize
-
-        if 'L_' in property:
-            y = temp['int_mass_' + property.replace('_','')] +\
-                temp['high_mass_' + property.replace('_','')] +\
-                temp['vhigh_mass_' + property.replace('_','')]
-            y = y[select]
-        else:
-            y    = temp[property][select]
-
-        newy = np.interp( sample_times, x, y)
-        if np.size(norm) > 1:
-            norm = np.interp(sample_times, x, norm)
-
-        all_data[i] = newy
-        x           = 1.0 * sample_times
+    # resample output - don't assume output has same dt (and dt will change)
+    if sample_times is None:
+        sample_times = np.arange(0.0, 150.0, 1.0)
 
-        if integrate:
-#            temp_data = np.zeros(npoints)
-#            for j in np.arange(1,npoints):
-#                temp_data[j] = np.trapz( [all_data[i][j-1],all_data[i][j]], [x[j-1], x[j]]) + temp_data[j-1]
-            all_data[i][:-1] = cumtrapz( all_data[i], x = x)
-            all_data[i][-1] = all_data[i][-2]
+    if 'L_' in property:
+        columns = ['int_mass_' + property.replace('_',''),
+                   'high_mass_' + property.replace('_',''),
+                   'vhigh_mass_' + property.replace('_','')]
+    else:
+        columns = [property]
 
-        all_data[i] = all_data[i] * norm
+    if normalize == 'M_o':
+        normalize = 'M_star_o'
 
-    stats = {}
-    stats['median'] = np.median(all_data, axis = 0)
-    stats['q1']     = np.percentile(all_data, 25, axis = 0)
-    stats['q3']     = np.percentile(all_data, 75, axis = 0)
-    stats['min']    = np.min(all_data, axis = 0)
-    stats['max']    = np.max(all_data, axis = 0)
-    stats['t'] = sample_times
+    # time measured from the first star formation
+    stats = aggregate_summaries(files, columns, sample_times, select = 'M_star_o',
+                                integrate = integrate, normalize = normalize,
+                                n_workers = n_workers,
+                                cache_dir = fpath + '.onezone_cache' if cache else None)
 
     return stats
 
 def plot_property(fpath, property, ylabel = None, integrate = False, normalize = None):
 
-    stats = compute_property(fpath, property, ylabel, integrate, normalize)
+    stats = compute_property(fpath, property, integrate, normalize)
 
 
     fig, ax = plt.subplots()
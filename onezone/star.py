@@ -14,12 +14,21 @@ __author__ = "aemerick <emerick@astro.columbia.edu>"
     without any code modifications (i.e. differences should be invisible to the
     user if dealing with star objects independently of the onezone module)
 
+    As in the cython implementation, a Star follows the RunConfig of the
+    StarParameters it is made (or evolved) with, and the default config
+    without one.
+
 """
 
 # need to allow dimension switch in interpolation routines
 # when one of the dims is exactly equal to one of the grid points
 _interpolation_hack = 0.999999999 # do this for now
 
+# relative tolerance used when a timestep ends exactly on a stellar event
+# (death, AGB phase, SNIa) so that round-off does not push it to the next step.
+# Only applied with event timestepping (see _tolerance)
+_event_tolerance = 1.0E-10
+
 # --- external ---
 import numpy as np
 import gc
@@ -47,6 +56,42 @@ WIND_YIELD_TABLE         = DT.StellarYieldsTable('wind')
 MASSIVE_STAR_YIELD_TABLE = DT.StellarYieldsTable('massive_star')
 POPIII_YIELD_TABLE       = DT.StellarYieldsTable("popIII")
 
+def _event_timestep(run_config):
+    return run_config.zone.adaptive_timestep and run_config.zone.event_timestep
+
+def _tolerance(run_config):
+    # steps only end exactly on stellar events with event timestepping
+    if _event_timestep(run_config):
+        return _event_tolerance
+    return 0.0
+
+class StarParameters:
+    """
+    Interface match for the frozen kernel parameters in cython_star.
+    The pure python stars read config directly, so this only tracks
+    the config version.
+    """
+
+    def __init__(self, run_config = None):
+        if run_config is None:
+            run_config = config.default_run_config()
+
+        self.run_config = run_config
+        self.version    = -1
+        self.freeze()
+        return
+
+    def freeze(self):
+        self.version = config.parameter_version()
+        return
+
+    def refreeze_if_changed(self):
+        if self.version == config.parameter_version():
+            return False
+
+        self.freeze()
+        return True
+
 class StarParticle:
 
     def __init__(self, M = None, Z = None, abundances={'m_tot':1.0}, tform=0.0, id = 0, M_o = None,
@@ -109,7 +154,7 @@ class StarParticle:
 
     def evolve(self, t, dt, ej_masses = {}, sn_masses = {},
                             snII_counter = -9999, snIa_counter = -9999,
-                            special_accumulator={}):
+                            special_accumulator={}, params = None, rng = None):
         pass
 
     def _assign_properties(self):
@@ -126,6 +171,13 @@ class Star(StarParticle):
 
     def __init__(self, star_type = 'star', *args, **kwargs):
 
+        # the config this star follows (see evolve)
+        params = kwargs.pop('params', None)
+        if params is None:
+            self.run_config = config.default_run_config()
+        else:
+            self.run_config = params.run_config
+
         StarParticle.__init__(self, *args, **kwargs)
 
         self.properties['type'] = star_type
@@ -140,11 +192,17 @@ class Star(StarParticle):
 
     def evolve(self, t, dt, ej_masses = {}, sn_masses = {},
                             snII_counter = -9999, snIa_counter = -9999,
-                            special_accumulator={}):
+                            special_accumulator={}, params = None, rng = None):
         """
-        Evolve
+        Evolve. With params, the star follows params.run_config from
+        now on
         """
 
+        if not (params is None):
+            self.run_config = params.run_config
+
+        rc = self.run_config
+
         self.age = t - self.tform
 
         #
@@ -156,7 +214,7 @@ class Star(StarParticle):
 
         SN_mass_loss = 0.0
 
-        if (self.age + dt > self.properties['lifetime'] / (config.units.time)):
+        if ((self.age + dt)*(1.0 + _tolerance(rc)) > self.properties['lifetime'] / (rc.units.time)):
 
             if 'new' in self.properties['type']:
                 #
@@ -176,8 +234,8 @@ class Star(StarParticle):
                 snII_counter += 1
 
             elif self.properties['type'] == 'star':
-                if self.M_o > config.stars.SNII_mass_threshold  and\
-                   self.M_o < config.stars.direct_collapse_mass_threshold:
+                if self.M_o > rc.stars.SNII_mass_threshold  and\
+                   self.M_o < rc.stars.direct_collapse_mass_threshold:
                     #
                     # Core collapse supernova - change type and compute yields
                     #
@@ -185,23 +243,24 @@ class Star(StarParticle):
                     self.properties['type'] = 'new_remnant'
                     SN_mass_loss = self.sn_ejecta_masses['m_tot']
                     snII_counter += 1
-                elif self.M_o < config.stars.SNII_mass_threshold:
+                elif self.M_o < rc.stars.SNII_mass_threshold:
                     #
                     # Otherwise, form a white dwarf when dead and label as
                     # candidate for future SNIa
                     #
                     self.properties['type']               = 'new_WD'
 
-                    if self.M_o > config.stars.SNIa_candidate_mass_bounds[0]\
-                           and self.M_o < config.stars.SNIa_candidate_mass_bounds[1]:
+                    if self.M_o > rc.stars.SNIa_candidate_mass_bounds[0]\
+                           and self.M_o < rc.stars.SNIa_candidate_mass_bounds[1]:
 
                         self.properties['SNIa_candidate'] = True
                         self.properties['WD_lifetime']    = phys.WD_lifetime(t,
                                                                              self.tform,
-                                                                             self.properties['lifetime']/config.units.time,
-                                                                             config.stars.DTD_slope,
-                                                                             config.stars.NSNIa,
-                                                                             config.zone.current_redshift) * config.units.time
+                                                                             self.properties['lifetime']/rc.units.time,
+                                                                             rc.stars.DTD_slope,
+                                                                             rc.stars.NSNIa,
+                                                                             rc.zone.current_redshift,
+                                                                             rng = rng) * rc.units.time
 
                     else:
                         self.properties['SNIa_candidate'] = False
@@ -217,7 +276,7 @@ class Star(StarParticle):
 
                 if self.properties['SNIa_candidate']:
 
-                    if self.properties['WD_lifetime'] + self.tform <= t*config.units.time:
+                    if self.properties['WD_lifetime'] + self.tform <= t*rc.units.time*(1.0 + _tolerance(rc)):
 
                         # go Type Ia supernova
                         self.properties['type'] = 'new_SNIa_remnant'
@@ -228,7 +287,7 @@ class Star(StarParticle):
         #
         # Compute total mass lost through supernova and wind
         #
-        M_loss = self.Mdot_ej * (config.units.time) * dt + SN_mass_loss
+        M_loss = self.Mdot_ej * (rc.units.time) * dt + SN_mass_loss
 
         self.M = self.M - M_loss
 
@@ -257,7 +316,7 @@ class Star(StarParticle):
             for key in ej_masses.keys():
                 ej_masses[key] += self.wind_ejecta_abundances[key] * self.Mdot_ej
 
-            if self.M_o > config.zone.track_massive_star_ejecta_mass:
+            if self.M_o > rc.zone.track_massive_star_ejecta_mass:
                 special_accumulator['m_massive'] += self.wind_ejecta_abundances['m_metal'] * self.Mdot_ej
 
         elif self.properties['type'] == 'new_remnant':
@@ -267,7 +326,7 @@ class Star(StarParticle):
                 ej_masses[key] += self.wind_ejecta_abundances[key] * self.Mdot_ej
                 sn_masses[key] += self.sn_ejecta_masses[key]
 
-            if self.M_o > config.zone.track_massive_star_ejecta_mass:
+            if self.M_o > rc.zone.track_massive_star_ejecta_mass:
                 special_accumulator['m_massive'] += self.wind_ejecta_abundances['m_metal']*self.Mdot_ej +\
                                                     self.sn_ejecta_masses['m_metal']
 
@@ -276,7 +335,7 @@ class Star(StarParticle):
             for key in sn_masses.keys():
                 sn_masses[key] += self.sn_ejecta_masses[key]
 
-            if self.M_o > config.zone.track_massive_star_ejecta_mass:
+            if self.M_o > rc.zone.track_massive_star_ejecta_mass:
                 special_accumulator['m_massive'] += self.sn_ejecta_masses['m_metal']
 
 
@@ -290,15 +349,18 @@ class Star(StarParticle):
         code for post-processing, set check_mass = True to ensure that SNIa ejecta
         masses are non-zero ONLY if a candidate has actually exploded.
         """
+
+        rc = self.run_config
+
         # need to rename and combine this and functions below
 
-        if not config.stars.use_snIa:
+        if not rc.stars.use_snIa:
             return
 
-        if ((self.M_o > config.stars.SNIa_candidate_mass_bounds[0] and\
-           self.M_o < config.stars.SNIa_candidate_mass_bounds[1] and (not check_mass)) or\
-          (check_mass and (self.M_o > config.stars.SNIa_candidate_mass_bounds[0] and\
-           self.M_o < config.stars.SNIa_candidate_mass_bounds[1] and self.M == 0.0))) :
+        if ((self.M_o > rc.stars.SNIa_candidate_mass_bounds[0] and\
+           self.M_o < rc.stars.SNIa_candidate_mass_bounds[1] and (not check_mass)) or\
+          (check_mass and (self.M_o > rc.stars.SNIa_candidate_mass_bounds[0] and\
+           self.M_o < rc.stars.SNIa_candidate_mass_bounds[1] and self.M == 0.0))) :
 
             if len(self.wind_ejecta_abundances.keys()) > 0:
                 yields = phys.SNIa_yields(self.wind_ejecta_abundances.keys())
@@ -313,17 +375,19 @@ class Star(StarParticle):
             yields = np.zeros(len( list(self.wind_ejecta_abundances.keys())))
 #            for e in self.wind_ejecta_abundances.keys():
 #                self.sn_ejecta_masses[e] = 0.0
-#            print(self.M_o, config.stars.SNIa_candidate_mass_bounds, self.M)
+#            print(self.M_o, rc.stars.SNIa_candidate_mass_bounds, self.M)
 #            raise NotImplementedError
 
         return yields
 
     def set_popIII_properties(self, ignore_check=False):
 
+        rc = self.run_config
+
         if len(self.wind_ejecta_abundances.keys()) > 0:
 
-            if ( ((self.M_o >= config.stars.PopIIITypeIIMass[0]) and (self.M_o <= config.stars.PopIIITypeIIMass[1])) or\
-                 ((self.M_o >= config.stars.PopIIIPISNMass[0]) and (self.M_o <= config.stars.PopIIIPISNMass[1])) ):
+            if ( ((self.M_o >= rc.stars.PopIIITypeIIMass[0]) and (self.M_o <= rc.stars.PopIIITypeIIMass[1])) or\
+                 ((self.M_o >= rc.stars.PopIIIPISNMass[0]) and (self.M_o <= rc.stars.PopIIIPISNMass[1])) ):
 
                 yields = POPIII_YIELD_TABLE.interpolate([self.M_o], self.wind_ejecta_abundances.keys())
 
@@ -338,8 +402,10 @@ class Star(StarParticle):
 
     def set_SNII_properties(self, ignore_check=False):
 
+        rc = self.run_config
+
         if not ignore_check:
-            if not config.stars.use_snII:
+            if not rc.stars.use_snII:
                 return
 
         if len(self.wind_ejecta_abundances.keys()) > 0:
@@ -352,16 +418,16 @@ class Star(StarParticle):
             else:
                 interp_z = self.Z
 
-            if self.M_o < config.stars.direct_collapse_mass_threshold and\
-               self.M_o > config.stars.SNII_mass_threshold :
+            if self.M_o < rc.stars.direct_collapse_mass_threshold and\
+               self.M_o > rc.stars.SNII_mass_threshold :
 
-                if self.M_o < config.data.yields_mass_limits[1]:
+                if self.M_o < rc.data.yields_mass_limits[1]:
                     yields =  SN_YIELD_TABLE.interpolate([self.M_o, interp_z],
                                                           self.wind_ejecta_abundances.keys())
-                elif config.stars.extrapolate_snII_yields:
-                    yields = np.asarray(SN_YIELD_TABLE.interpolate([config.data.yields_mass_limits[1] * _interpolation_hack, interp_z],
+                elif rc.stars.extrapolate_snII_yields:
+                    yields = np.asarray(SN_YIELD_TABLE.interpolate([rc.data.yields_mass_limits[1] * _interpolation_hack, interp_z],
                                                           self.wind_ejecta_abundances.keys()))
-                    yields = yields * self.M_o / (config.data.yields_mass_limits[1] * _interpolation_hack)
+                    yields = yields * self.M_o / (rc.data.yields_mass_limits[1] * _interpolation_hack)
 
             else:
                 # direct collapse supernova - no SN mass injection
@@ -441,18 +507,24 @@ class Star(StarParticle):
 
     def stellar_wind_parameters(self, age, dt):
 
-        if not self.properties['type'] == 'star' or not config.stars.use_stellar_winds:
+        rc = self.run_config
+
+        if not self.properties['type'] == 'star' or not rc.stars.use_stellar_winds:
             return
 
-        #if (self.M_o <= config.data.yields_mass_limits[1]) and\
-        #   (self.M_o >= config.data.yields_mass_limits[0]):
+        #if (self.M_o <= rc.data.yields_mass_limits[1]) and\
+        #   (self.M_o >= rc.data.yields_mass_limits[0]):
         if True:
             # need to compute wind velocities for all stars
             # check if star's wind is ON
             do_wind = True
 
-            if (self.M_o < config.stars.AGB_wind_phase_mass_threshold) and config.stars.use_AGB_wind_phase:
-                if self.age + dt < self.properties['age_agb'] / config.units.time:
+            if (self.M_o < rc.stars.AGB_wind_phase_mass_threshold) and rc.stars.use_AGB_wind_phase:
+                # wind stays off until the AGB phase, unless (with event
+                # timestepping) the star also dies this step
+                if (self.age + dt)*(1.0 - _tolerance(rc)) < self.properties['age_agb'] / rc.units.time and\
+                   not (_event_timestep(rc) and\
+                        (self.age + dt)*(1.0 + _tolerance(rc)) > self.properties['lifetime'] / rc.units.time):
                     do_wind = False
                     wind_lifetime = 0.0
                 else:
@@ -462,11 +534,11 @@ class Star(StarParticle):
                 wind_lifetime = self.properties['lifetime']
 
 
-            if wind_lifetime < dt * config.units.time:
-                wind_lifetime = dt * config.units.time
+            if wind_lifetime < dt * rc.units.time:
+                wind_lifetime = dt * rc.units.time
 
 
-            if do_wind and self.age * config.units.time < self.properties['lifetime']:
+            if do_wind and self.age * rc.units.time < self.properties['lifetime']:
                 Mdot   = self.properties['M_wind_total'] / wind_lifetime
             else:
                 Mdot   = 0.0
@@ -476,7 +548,7 @@ class Star(StarParticle):
             # total amount, set wind ejected to just the difference
             # this can happen when wind phase is < dt and lines up between timesteps
             #
-            final_mass = self.M - Mdot * dt * config.units.time
+            final_mass = self.M - Mdot * dt * rc.units.time
             correct_final_mass = self.M_o - self.properties['M_wind_total']
 
 
@@ -489,11 +561,11 @@ class Star(StarParticle):
                                       self.properties['Teff'], self.Z)
 
 
-        if (self.M > config.stars.AGB_wind_phase_mass_threshold):
+        if (self.M > rc.stars.AGB_wind_phase_mass_threshold):
             vwind = phys.s99_wind_velocity( self.properties['luminosity'], self.M_o,
                                             self.properties['Teff'], self.Z)
         else:
-            vwind = config.stars.AGB_wind_velocity * 1.0E5 # km/s -> cm/s
+            vwind = rc.stars.AGB_wind_velocity * 1.0E5 # km/s -> cm/s
 
 
         self.properties['Mdot_wind'] = Mdot
@@ -512,7 +584,9 @@ class Star(StarParticle):
             atomic number order
         """
 
-        if( self.M_o < config.data.yields_mass_limits[1] ):
+        rc = self.run_config
+
+        if( self.M_o < rc.data.yields_mass_limits[1] ):
             if self.Z < WIND_YIELD_TABLE.x['metallicity'][0]:
                 interp_z = WIND_YIELD_TABLE.x['metallicity'][0]
             elif self.Z > WIND_YIELD_TABLE.x['metallicity'][-1]:
@@ -523,7 +597,7 @@ class Star(StarParticle):
 
             yields = np.asarray(WIND_YIELD_TABLE.interpolate([self.M_o, self.Z],
                                                               self.wind_ejecta_abundances.keys()))
-        elif (config.stars.use_massive_star_yields):
+        elif (rc.stars.use_massive_star_yields):
             if self.Z < MASSIVE_STAR_YIELD_TABLE.x['metallicity'][0]:
                 interp_z = MASSIVE_STAR_YIELD_TABLE.x['metallicity'][0]
             elif self.Z > MASSIVE_STAR_YIELD_TABLE.x['metallicity'][-1]:
@@ -541,8 +615,8 @@ class Star(StarParticle):
             # For stars off of the grid, scale most massive star
             # to current mass.
             #
-            yields = np.asarray(WIND_YIELD_TABLE.interpolate([config.data.yields_mass_limits[1]*_interpolation_hack, self.Z], self.wind_ejecta_abundances.keys()))
-            yields = yields * self.M_o / (config.data.yields_mass_limits[1] * _interpolation_hack)
+            yields = np.asarray(WIND_YIELD_TABLE.interpolate([rc.data.yields_mass_limits[1]*_interpolation_hack, self.Z], self.wind_ejecta_abundances.keys()))
+            yields = yields * self.M_o / (rc.data.yields_mass_limits[1] * _interpolation_hack)
 
 
         return np.asarray(yields)
@@ -550,6 +624,8 @@ class Star(StarParticle):
 
     def _assign_properties(self):
 
+        rc = self.run_config
+
         # list of properties assigned in this function (remember to update!!)
         p_list = ['luminosity', 'radius',
                   'lifetime'  , 'age_agb', 'L_FUV', 'L_LW', 'agb_phase_length',
@@ -597,16 +673,16 @@ class Star(StarParticle):
             Q0  = rad.compute_blackbody_q0(self.properties['Teff'])
             Q1  = rad.compute_blackbody_q1(self.properties['Teff'])
 
-            if config.stars.normalize_black_body_to_OSTAR:
-                if self.M_o < config.stars.black_body_correction_mass:
+            if rc.stars.normalize_black_body_to_OSTAR:
+                if self.M_o < rc.stars.black_body_correction_mass:
                     corr_ind = 0
                 else:
                     corr_ind = 1
 
-                Q0  *= config.stars.black_body_q0_factors[corr_ind]
-                Q1  *= config.stars.black_body_q1_factors[corr_ind]
-                FUV *= config.stars.black_body_FUV_factors[corr_ind]
-                LW  *= config.stars.black_body_LW_factors[corr_ind]
+                Q0  *= rc.stars.black_body_q0_factors[corr_ind]
+                Q1  *= rc.stars.black_body_q1_factors[corr_ind]
+                FUV *= rc.stars.black_body_FUV_factors[corr_ind]
+                LW  *= rc.stars.black_body_LW_factors[corr_ind]
 
 
         self.properties['Q0']    = Q0 * self.surface_area()
@@ -668,21 +744,13 @@ class Star(StarParticle):
         In actuality this just adds the star to a buffer to limit IO
         """
 
-        if not (config.io._abundance_buffer is None):
+        rc = self.run_config
 
-            config.io._abundance_buffer.flush() # flush if needed
+        if not (rc.io._abundance_output is None):
 
-            i = config.io._abundance_buffer.count
-            config.io._abundance_buffer.buffer[i][0] = self.tform
-            config.io._abundance_buffer.buffer[i][1] = self.id
-            config.io._abundance_buffer.buffer[i][2] = self.M
-            config.io._abundance_buffer.buffer[i][3] = self.Z
-            config.io._abundance_buffer.buffer[i][4] = self.properties['lifetime']
-
-            for ei,e in enumerate(config.zone.species_to_track):
-                config.io._abundance_buffer.buffer[i][ei+5] = abundances[e]
-
-            config.io._abundance_buffer.count += 1
+            rc.io._abundance_output.add_stars(self.tform, self.Z,
+                                              [abundances[e] for e in rc.zone.species_to_track],
+                                              [self.id], [self.M], [self.properties['lifetime']])
 
         return
 
@@ -692,12 +760,15 @@ class StarList:
     on many stars at once.
     """
 
-    def __init__(self, stars = []):
+    def __init__(self, stars = [], run_config = None):
 
+        if run_config is None:
+            run_config = config.default_run_config()
+        self.run_config = run_config
 
         if len(stars) == 0:
-            if config.zone.maximum_stars != None and config.zone.optimize:
-                self._stars           = [None] * config.zone.maximum_stars
+            if run_config.zone.maximum_stars != None and run_config.zone.optimize:
+                self._stars           = [None] * run_config.zone.maximum_stars
                 self._stars_optimized = True
             else:
                 self._stars           = []
@@ -748,9 +819,45 @@ class StarList:
         return self._N_stars
 
 
+    def next_event_time(self, t, params = None):
+        """
+        Return the earliest time (code units) after t at which any star
+        dies, enters its AGB wind phase, or explodes as a Type Ia
+        supernova. Returns -1 if no event is scheduled.
+        """
+
+        rc = self.run_config if params is None else params.run_config
+
+        t_next = -1.0
+
+        for x in self.stars:
+            star_type = x.properties['type']
+
+            if star_type == 'star':
+                t_event = x.tform + x.properties['lifetime'] / rc.units.time
+
+                if rc.stars.use_AGB_wind_phase and\
+                   x.M_o < rc.stars.AGB_wind_phase_mass_threshold:
+                    t_agb = x.tform + x.properties['age_agb'] / rc.units.time
+                    if t_agb > t and t_agb < t_event:
+                        t_event = t_agb
+
+            elif (star_type == 'WD' or star_type == 'new_WD') and\
+                  x.properties['SNIa_candidate']:
+                # mirrors the explosion condition in Star.evolve
+                t_event = (x.properties['WD_lifetime'] + x.tform) / rc.units.time
+
+            else:
+                continue
+
+            if t_event > t and (t_next < 0.0 or t_event < t_next):
+                t_next = t_event
+
+        return t_next
+
     def _values_outdated(self):
 
-        return self._internal_time < config.global_values.time
+        return self._internal_time < self.run_config.global_values.time
 
     def add_new_star(self, new_star):
         """
@@ -759,8 +866,8 @@ class StarList:
         number of stars is provided
         """
 
-        if (not( config.global_values.profiler is None)):
-            config.global_values.profiler.start_timer('add_new_star', True)
+        if (not( self.run_config.global_values.profiler is None)):
+            self.run_config.global_values.profiler.start_timer('add_new_star', True)
 
         if self._stars_optimized:
             #
@@ -772,9 +879,9 @@ class StarList:
             self._append(new_star)
 
         self._N_stars += 1
-        if (not( config.global_values.profiler is None)):
+        if (not( self.run_config.global_values.profiler is None)):
 
-            config.global_values.profiler.end_timer('add_new_star')
+            self.run_config.global_values.profiler.end_timer('add_new_star')
         return
 
 
@@ -788,14 +895,14 @@ class StarList:
 
     def property_asarray(self, name, star_type = 'all', subset_condition = None):
 
-        if (not( config.global_values.profiler is None)):
+        if (not( self.run_config.global_values.profiler is None)):
 
-            config.global_values.profiler.start_timer('property_asarray', True)
+            self.run_config.global_values.profiler.start_timer('property_asarray', True)
 
         if self.N_stars() == 0:
-            if (not( config.global_values.profiler is None)):
+            if (not( self.run_config.global_values.profiler is None)):
 
-                config.global_values.profiler.end_timer('property_asarray')
+                self.run_config.global_values.profiler.end_timer('property_asarray')
             return np.zeros(1)
 
         if not star_type == 'all':
@@ -831,9 +938,9 @@ class StarList:
         #
         # as can happen if there are no stars in subset
         #
-        if (not( config.global_values.profiler is None)):
+        if (not( self.run_config.global_values.profiler is None)):
 
-            config.global_values.profiler.end_timer('property_asarray')
+            self.run_config.global_values.profiler.end_timer('property_asarray')
 
         if len(array) == 0:
             if name == 'type':
@@ -881,11 +988,11 @@ class StarList:
         Returns iterable
         """
 
-        if (not( config.global_values.profiler is None)):
-            config.global_values.profiler.start_timer('get_subset',True)
+        if (not( self.run_config.global_values.profiler is None)):
+            self.run_config.global_values.profiler.start_timer('get_subset',True)
         res = [ x for x in self.stars_iterable if expr(x) ]
-        if (not( config.global_values.profiler is None)):
-            config.global_values.profiler.end_timer('get_subset')
+        if (not( self.run_config.global_values.profiler is None)):
+            self.run_config.global_values.profiler.end_timer('get_subset')
         return res
 
 #        return itertools.ifilterfalse( expr,  self.stars)
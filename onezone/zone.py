@@ -12,7 +12,7 @@ __author__ = "aemerick <emerick@astro.columbia.edu>"
 # external
 import numpy as np
 #from collections import OrderedDict
-import os, h5py
+import os, h5py, json, copy, gc, tracemalloc
 from scipy.interpolate import interp1d
 
 
@@ -35,18 +35,137 @@ from onezone.cython_ext import cython_star as star
 from . import config as config
 from .constants import CONST as const
 from . import performance_tools as perf
+from .io import read_snapshot
+
+#
+# reasons a timestep can be limited by, recorded as an integer code
+# (index in this list) in the summary output when using event timestepping
+#
+_dt_limiters = ['constant', 'max_dt', 'lifetime', 'star_formation',
+                'stellar_event', 'output', 't_final']
+
+#
+# independent random number streams each zone owns, one per subsystem
+#
+_random_streams = ['imf', 'star_formation', 'SNIa']
+
+#
+# Zone attributes that checkpoints store in their own format rather
+# than in the JSON encoded state
+#
+_checkpoint_special = ['config', 'all_stars', '_star_parameters',
+                       'random_streams', '_summary_rows', '_summary_buffer']
+
+#
+# one row per snapshot in the single file dump (io.dump_single_file)
+#
+_dump_index_dtype = np.dtype([('output_number', np.int64), ('time', np.float64),
+                              ('cycle', np.int64), ('N_stars', np.int64)])
+
+#
+# largest drift of the running star totals (see StarList.recompute_totals),
+# relative to everything added to and removed from them, before it is
+# reported. Round-off of the compensated sums is ~1E-15, so anything above
+# this is a bookkeeping error
+#
+_totals_drift_tolerance = 1.0E-10
+
+#
+# relative tolerance on output times, so a timestep that stops on an
+# output time (see _compute_event_dt) writes the output that step
+#
+_output_tolerance = 1.0E-10
+
+#
+# while over io.memory_budget, the 'compact' action is repeated only once
+# resident memory has grown by this fraction since the last compaction
+#
+_compact_growth = 0.1
+
+#
+# summary files with these extensions are written as HDF5, others as ASCII
+#
+_hdf5_extensions = ['.h5', '.hdf5']
 
 def restart(filename):
     """
-    Restart evolution from chosen picked output file
+    Restart evolution from a checkpoint (see Zone.write_checkpoint)
+    or, for older runs, a full pickle dump
     """
 
-    zone = pickle.load( open(filename, 'r'))
+    if h5py.is_hdf5(filename):
+        zone = Zone.from_checkpoint(filename)
+    else:
+        zone = pickle.load( open(filename, 'rb'))
 
     zone.evolve()
 
     return
 
+def _encode_state(value):
+    """
+    Make value JSON serializable, tagging numpy floats so they come
+    back as numpy floats. Raises TypeError if this is not possible
+    """
+
+    if isinstance(value, np.floating):
+        return {'__float64__' : float(value)}
+    elif isinstance(value, (np.integer, np.bool_)):
+        return value.item()
+    elif isinstance(value, dict):
+        return {k : _encode_state(v) for k, v in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [_encode_state(v) for v in value]
+    elif value is None or isinstance(value, (bool, int, float, str)):
+        return value
+
+    raise TypeError
+
+def _decode_state(d):
+    if len(d) == 1 and '__float64__' in d:
+        return np.float64(d['__float64__'])
+    return d
+
+
+def _new_profiler(run_config):
+    """
+    Profiler for a run, set up from run_config.global_values
+    """
+    g = run_config.global_values
+    return perf.Profiler(g.profile_performance, filename = g.profile_filename,
+                         write_interval = g.profile_output_interval,
+                         trace_size = g.trace_size, trace_filename = g.trace_filename)
+
+#
+# star properties given by Zone.snapshot(star_columns = True)
+#
+_snapshot_star_columns = ['mass', 'birth_mass', 'metallicity', 'age', 'type']
+
+class ZoneSnapshot:
+    """
+    State of a Zone at one cycle, as yielded by Zone.evolve_iter:
+    cycle, t, dt, summary (dictionary of the summary output values),
+    and stars (dictionary of star property arrays, or None)
+    """
+
+    __slots__ = ['cycle', 't', 'dt', 'summary', 'stars']
+
+    def __init__(self, cycle, t, dt, summary, stars = None):
+        self.cycle   = cycle
+        self.t       = t
+        self.dt      = dt
+        self.summary = summary
+        self.stars   = stars
+        return
+
+    def summary_array(self, names = None):
+        """
+        Summary values as an array, in the order of names (all by default)
+        """
+        if names is None:
+            names = list(self.summary.keys())
+        return np.array([self.summary[k] for k in names], dtype = float)
+
 
 class Zone:
     """
@@ -63,34 +182,56 @@ class Zone:
         >>> sim.set_initial_abundances(list_of_element_names)
         >>> sim.evolve()
 
+    By default the module level parameters in config are used. To run
+    several zones side by side in one process, give each its own
+    config.RunConfig:
+
+        >>> rc  = config.RunConfig()
+        >>> rc.zone.initial_gas_mass = 1.0E6
+        >>> sim = Zone(run_config = rc)
+
     I/O controlled by config parameters, but can be done manually
-    with a full (pickle) dump or an output of summary statistics:
+    with a checkpoint, a full (pickle) dump, or an output of summary
+    statistics:
 
+        >>> sim.write_checkpoint()
         >>> sim.write_full_pickle()
         >>> sim.write_summary_output()
+
+    Files are written by a background thread when io.background_output
+    is set; sim.config.io.flush_output() waits for them to finish
+    (evolve does this at the end of the run).
+
+    A run is restarted from a checkpoint with:
+
+        >>> sim = Zone.from_checkpoint('checkpoint_0003.h5')
+        >>> sim.evolve()
     """
 
 
-    def __init__(self):
+    def __init__(self, run_config = None):
+
+        if run_config is None:
+            run_config = config.default_run_config()
+        self.config = run_config
 
-        #if config.global_values.profile_performance:
-        config.global_values.profiler =\
-                        perf.PerformanceTimer(config.global_values.profile_performance)
+        self.config.global_values.profiler = _new_profiler(self.config)
 
+        self._initialize_random_streams()
 
         #
         # important values and stars
         #
-        self.M_gas     = config.zone.initial_gas_mass
-        self.M_DM      = config.zone.initial_dark_matter_mass
-        self.all_stars = star.StarList()
-        self.Z         = config.zone.initial_metallicity
+        self.M_gas     = self.config.zone.initial_gas_mass
+        self.M_DM      = self.config.zone.initial_dark_matter_mass
+        self.all_stars = star.StarList(run_config = self.config)
+        self.Z         = self.config.zone.initial_metallicity
         self._M_sf_reservoir = 0.0
 
         self._SFR_initialized = False # only for SF method 4
         self._mass_loading_initialized = False # only for mass_outflow_method 2
 
-        self.initial_abundances = config.zone.initial_abundances
+        self.initial_abundances = self.config.zone.initial_abundances
         self.species_masses     = {} # OrderedDict()
         self.halo_masses        = {} # add other phase models?
 
@@ -103,14 +244,33 @@ class Zone:
         self._cycle_number          = 0
         self._cycle_last_dump       = 0
         self._cycle_last_summary    = 0
+        self._t_last_checkpoint     = 0.0
+        self._cycle_last_checkpoint = 0
         self.pickle_output_number   = 0
+        self._checkpoint_number     = 0
+        self._checkpoint_files      = []
         self._summary_output_number = 0
         self._output_number         = 0
 
-        self.t  = config.zone.t_o
-        self.dt = config.zone.dt
+        # typed snapshot of config values used in the star kernels
+        self._star_parameters       = star.StarParameters(self.config)
+
+        self.t  = self.config.zone.t_o
+        self.dt = self.config.zone.dt
+        self._dt_limiter = 'constant'
 
         self._summary_data = {}
+        self._summary_names = None # fixed summary columns, set at first summary
+        self._summary_rows  = []   # summary rows kept with io.summary_in_memory
+        self._summary_buffer         = None # rows waiting to be written to file
+        self._summary_buffer_count   = 0
+        self._summary_rows_written   = 0
+        self._delta_mass             = None # star values at the last delta snapshot
+        self._write_outputs          = True # False while evolve_iter runs without outputs
+        self._over_memory_budget     = False
+        self._rss_compacted          = 0.0  # resident memory after the last compaction
+        self._delta_type             = None
+        self.Mdot_sf = 0.0
         self.Mdot_ej = 0.0
         self.Mdot_DM = 0.0
         self.Mdot_out = 0.0
@@ -125,13 +285,13 @@ class Zone:
         #
         # Create stars if starting with initial cluster
         #
-        for e in config.zone.species_to_track:
+        for e in self.config.zone.species_to_track:
             self.species_masses[e]   = 0.0
             self.Mdot_out_species[e] = 0.0
             self.halo_masses[e]      = 0.0
 
-        if (config.zone.initial_stellar_mass > 0.0):
-            self._make_new_stars( M_sf = config.zone.initial_stellar_mass )
+        if (self.config.zone.initial_stellar_mass > 0.0):
+            self._make_new_stars( M_sf = self.config.zone.initial_stellar_mass )
 
         self._compute_dt()
 
@@ -140,6 +300,25 @@ class Zone:
 
         return
 
+    def _initialize_random_streams(self):
+        """
+        Set up this zone's random number generators: one numpy Generator
+        (PCG64) per subsystem in _random_streams, spawned from a single
+        SeedSequence seeded with config.zone.random_seed
+        """
+
+        self.random_seed = self.config.zone.random_seed
+        if self.random_seed is None:
+            self.random_seed = int(np.random.randint(0, 2**63 - 1, dtype = np.int64))
+
+        seeds = np.random.SeedSequence(self.random_seed).spawn(len(_random_streams))
+
+        self.random_streams = {}
+        for name, s in zip(_random_streams, seeds):
+            self.random_streams[name] = np.random.Generator(np.random.PCG64(s))
+
+        return
+
     def set_initial_abundances(self, elements, abundances = None):
         """
         Set initial abundances using a list of desired elements and
@@ -182,16 +361,14 @@ class Zone:
 
     def _accumulate_new_sn(self):
         """
-        Looks through all stars, checking to see if any new SN or SNIa
-        occured in current timestep. Adds these to the counters
+        Add the SN and SNIa that occured in the current timestep, as
+        recorded in the event log (see config.event_log), to the counters
         """
 
+        counts = self.config.io.get_event_log().new_counts()
 
-        star_type = list(self.all_stars.property_asarray('type'))
-
-        #if np.size(star_type) > 1:
-        self.N_SNIa += star_type.count('new_SNIa_remnant')
-        self.N_SNII += star_type.count('new_remnant')
+        self.N_SNIa += counts['SNIa']
+        self.N_SNII += counts['SNII']
 
         return
 
@@ -203,118 +380,333 @@ class Zone:
            outputs.
         """
 
-        config.global_values.profiler.start_timer("total_time",True)
-        while self.t <= config.zone.t_final:
+        for snapshot in self.evolve_iter(every = 0):
+            pass
 
-            config.global_values.profiler.start_timer('compute_dt')
-            self._compute_dt()
-            config.global_values.profiler.end_timer('compute_dt')
+        return
 
+    def evolve_iter(self, every = 1, star_columns = None, outputs = True):
+        """
+        Evolve as in evolve, yielding a ZoneSnapshot (see Zone.snapshot)
+        every 'every' cycles and at the end of the run, so results can
+        be used as the run goes without reading output files back:
 
-            #
-            # Check if output conditions are met
-            #
-            config.global_values.profiler.start_timer('check_output')
-            self._check_output()
-            config.global_values.profiler.end_timer('check_output')
+            >>> for snap in sim.evolve_iter(every = 10):
+            ...     print(snap.t, snap.summary['M_gas'])
 
-            #
-            # I) Evolve stars, computing ejecta rates and abundances
-            #
-            config.global_values.profiler.start_timer('evolve_stars')
-            self._evolve_stars()
-            config.global_values.profiler.end_timer('evolve_stars')
+        star_columns are passed on to snapshot. With outputs = False
+        nothing is written to the output files. If the loop is stopped early the
+        pending outputs are flushed, and the run can be continued by
+        calling evolve_iter (or evolve) again. every = 0 never yields.
+        """
 
-            #
-            # II) Sum up and store number of supernovae
-            #
-            config.global_values.profiler.start_timer('accumulate_sn')
-            self._accumulate_new_sn()
-            config.global_values.profiler.end_timer('accumulate_sn')
+        last_yield = -1
+        completed  = False
+
+        self._write_outputs = outputs
+
+        sampler = None
+        if self.config.global_values.sample_profile:
+            sampler = perf.SamplingProfiler(self.config.global_values.sample_interval)
+            sampler.start()
+
+        self.config.global_values.profiler.set_context(self._cycle_number, self.t, self.N_stars)
+        self.config.global_values.profiler.start_timer("total_time",True)
+        self._star_parameters.freeze()
+
+        try:
+            while self.t <= self.config.zone.t_final:
+
+                self._star_parameters.refreeze_if_changed()
+
+                self.config.global_values.profiler.start_timer('compute_dt')
+                self._compute_dt()
+                self.config.global_values.profiler.end_timer('compute_dt')
+
+
+                #
+                # Check if output conditions are met
+                #
+                if outputs:
+                    self.config.global_values.profiler.start_timer('check_output')
+                    self._check_output()
+                    self.config.global_values.profiler.end_timer('check_output')
+
+                #
+                # I) Evolve stars, computing ejecta rates and abundances
+                #
+                self.config.global_values.profiler.start_timer('evolve_stars')
+                self._evolve_stars()
+                self.config.global_values.profiler.end_timer('evolve_stars')
+
+                #
+                # II) Sum up and store number of supernovae
+                #
+                self.config.global_values.profiler.start_timer('accumulate_sn')
+                self._accumulate_new_sn()
+                self.config.global_values.profiler.end_timer('accumulate_sn')
+
+                #
+                # III) Compute SFR and make new stars
+                #
+                self.config.global_values.profiler.start_timer('compute_sfr')
+                self._compute_sfr()
+                self.config.global_values.profiler.end_timer('compute_sfr')
+
+                self.config.global_values.profiler.start_timer('make_stars')
+                self.M_sf = self._make_new_stars()
+                self.config.global_values.profiler.end_timer('make_stars')
+
+                #
+                # IV) Compute inflow and outflow
+                #
+                self.config.global_values.profiler.start_timer('outflow_inflow_mdot')
+                self._compute_outflow()
+                self._compute_inflow()
+                self._compute_mdot_dm()
+                self.config.global_values.profiler.end_timer('outflow_inflow_mdot')
+
+                #
+                # V) Add/remove gas from zone due to inflow,
+                #    outflow, SF, and stellar ejecta
+                #
+                abundances = self.abundances
+
+                temp1 = abundances['m_metal'] * 1.0
+
+                new_gas_mass =  self.M_gas + (self.Mdot_in + self.Mdot_ej_masses['m_tot'] -\
+                               self.Mdot_out) * self.dt - self.M_sf +\
+                               self.SN_ej_masses['m_tot']
+
+                #
+                # VI) Check if reservoir is empty
+                #
+                if self.M_gas <= 0:
+                    self.M_gas = 0.0
+                    _my_print("Gas in zone depleted. Ending simulation")
+                    break
+
+                #
+                # VII) Compute increase / decrease of individual abundances
+                #
+                for e in self.species_masses.keys():
+                    self.species_masses[e] = self.species_masses[e] +  (self.Mdot_in  * self.Mdot_in_abundances(e) +\
+                                               self.Mdot_ej_masses[e] -\
+                                               self.Mdot_out_species[e]) * self.dt -\
+                                               self.M_sf * abundances[e] + self.SN_ej_masses[e]
+
+                    self.halo_masses[e] = self.halo_masses[e] + self.Mdot_out_species[e] * self.dt # no halo accretion for now.
+
+                self.M_gas = new_gas_mass
+                self.M_DM  = self.M_DM + self.Mdot_DM * self.dt
+
+                #
+                # VII) i) ensure metallicity is consistent with new abundances
+                #
+                self._update_metallicity()
+
+                #
+                # VIII) End of evolution, increment counters
+                #
+                self.config.global_values.profiler.start_timer('update_globals')
+                self.t += self.dt
+                self._cycle_number += 1
+                self._update_globals()
+                self.config.global_values.profiler.end_timer('update_globals')
+
+                self._check_memory()
+
+                self.config.global_values.profiler.end_cycle(self._cycle_number, self.t, self.N_stars)
+
+                if every > 0 and (self._cycle_number % every) == 0:
+                    # only sample the run, not the caller's loop body
+                    if not (sampler is None):
+                        sampler.stop()
+                    yield self.snapshot(star_columns)
+                    last_yield = self._cycle_number
+                    if not (sampler is None):
+                        sampler.start()
+
+
+            completed = True
+
+        finally:
+            if not completed:
+                self.config.global_values.profiler.end_timer("total_time")
+                self.config.global_values.profiler.write_trace()
+                self._flush_outputs()
+                self._write_samples(sampler)
 
-            #
-            # III) Compute SFR and make new stars
-            #
-            config.global_values.profiler.start_timer('compute_sfr')
-            self._compute_sfr()
-            config.global_values.profiler.end_timer('compute_sfr')
+        #
+        # At end of simulation, force summary and dump
+        # outputs
+        #
+        self.config.global_values.profiler.end_timer("total_time")
+        self.config.global_values.profiler.write_performance(cycle = self._cycle_number, time = self.t,
+                                                             dt_limiter = self._dt_limiter)
+        self.config.global_values.profiler.write_trace()
 
-            config.global_values.profiler.start_timer('make_stars')
-            self.M_sf = self._make_new_stars()
-            config.global_values.profiler.end_timer('make_stars')
+        if outputs:
+            self._check_output(force=True)
+        self._clean_up()
+        self._write_samples(sampler)
 
-            #
-            # IV) Compute inflow and outflow
-            #
-            config.global_values.profiler.start_timer('outflow_inflow_mdot')
-            self._compute_outflow()
-            self._compute_inflow()
-            self._compute_mdot_dm()
-            config.global_values.profiler.end_timer('outflow_inflow_mdot')
+        if every > 0 and last_yield != self._cycle_number:
+            yield self.snapshot(star_columns)
 
-            #
-            # V) Add/remove gas from zone due to inflow,
-            #    outflow, SF, and stellar ejecta
-            #
-            abundances = self.abundances
+        return
 
-            temp1 = abundances['m_metal'] * 1.0
+    def snapshot(self, star_columns = None):
+        """
+        Current state as a ZoneSnapshot: time, cycle, timestep, the
+        summary values (as written by write_summary_output), and, if
+        star_columns is given, a dictionary of star property arrays
+        (True gives mass, birth_mass, metallicity, age, and type)
+        """
 
-            new_gas_mass =  self.M_gas + (self.Mdot_in + self.Mdot_ej_masses['m_tot'] -\
-                           self.Mdot_out) * self.dt - self.M_sf +\
-                           self.SN_ej_masses['m_tot']
+        self._accumulate_summary_data()
+        summary = dict(self._summary_data)
+        self._summary_data.clear()
 
-            #
-            # VI) Check if reservoir is empty
-            #
-            if self.M_gas <= 0:
-                self.M_gas = 0.0
-                _my_print("Gas in zone depleted. Ending simulation")
-                break
+        stars = None
+        if not (star_columns is None or star_columns is False):
+            if star_columns is True:
+                star_columns = _snapshot_star_columns
 
-            #
-            # VII) Compute increase / decrease of individual abundances
-            #
-            for e in self.species_masses.keys():
-                self.species_masses[e] = self.species_masses[e] +  (self.Mdot_in  * self.Mdot_in_abundances(e) +\
-                                           self.Mdot_ej_masses[e] -\
-                                           self.Mdot_out_species[e]) * self.dt -\
-                                           self.M_sf * abundances[e] + self.SN_ej_masses[e]
+            stars = {}
+            for k in star_columns:
+                if self.N_stars == 0:
+                    stars[k] = np.zeros(0)
+                else:
+                    stars[k] = np.asarray(self.all_stars.property_asarray(k))
 
-                self.halo_masses[e] = self.halo_masses[e] + self.Mdot_out_species[e] * self.dt # no halo accretion for now.
+        return ZoneSnapshot(self._cycle_number, self.t, self.dt, summary, stars)
 
-            self.M_gas = new_gas_mass
-            self.M_DM  = self.M_DM + self.Mdot_DM * self.dt
+    def _flush_outputs(self):
+        """
+        Write out anything buffered or queued for output, without closing files
+        """
 
-            #
-            # VII) i) ensure metallicity is consistent with new abundances
-            #
-            self._update_metallicity()
+        self._flush_summary_buffer()
+        self.config.io.flush_output()
 
-            #
-            # VIII) End of evolution, increment counters
-            #
-            config.global_values.profiler.start_timer('update_globals')
-            self.t += self.dt
-            self._cycle_number += 1
-            self._update_globals()
-            config.global_values.profiler.end_timer('update_globals')
+        for output in [self.config.io._abundance_output, self.config.io._event_log,
+                       self.config.io._memory_log]:
+            if not (output is None):
+                output.flush(force = True)
+                output.wait()
 
-            outstr = "======================================================\n" +\
-                     "===== Cycle = %00005i      time = %5.5E    =======\n"%(self._cycle_number,self.t) +\
-                     "======================================================\n"
+        return
 
-            config.global_values.profiler.write_performance(outstr=outstr)
+    def memory_usage(self):
+        """
+        Memory use of the run as a dictionary with the columns of
+        config.memory_log (sizes in bytes)
+        """
 
-        #
-        # At end of simulation, force summary and dump
-        # outputs
-        #
-        config.global_values.profiler.end_timer("total_time")
-        config.global_values.profiler.write_performance(outstr=outstr)
+        io     = self.config.io
+        values = {'t' : self.t, 'cycle' : self._cycle_number, 'N_stars' : self.N_stars}
 
-        self._check_output(force=True)
-        self._clean_up()
+        for k in config.memory_log.star_types:
+            values['N_' + k] = 0
+        for k, n in self.all_stars.type_counts().items():
+            k = 'N_' + (k[4:] if k.startswith('new_') else k)
+            if k in values:
+                values[k] += n
+
+        values['rss'], values['rss_peak'] = perf.rss()
+
+        if tracemalloc.is_tracing():
+            values['traced'], values['traced_peak'] = tracemalloc.get_traced_memory()
+
+        values['bytes_per_star'] = perf.sample_size(self.all_stars.stars(),
+                                                    ['properties', 'sn_ejecta_masses',
+                                                     'wind_ejecta_abundances'])
+        values['star_bytes']     = values['bytes_per_star'] * values['N_stars']
+
+        values['summary_buffer'] = self._summary_buffer_count
+        if not (io._abundance_output is None):
+            values['abundance_buffer'] = np.sum([b.count for b in io._abundance_output.buffers.values()])
+        if not (io._event_log is None):
+            values['event_buffer'] = io._event_log.count
+        if not (io._output_writer is None):
+            values['output_queue'] = io._output_writer.queue.qsize()
+
+        return values
+
+    def _check_memory(self):
+        """
+        Every io.cycle_memory cycles, record memory use (io.memory_output_filename),
+        take a tracemalloc snapshot (io.cycle_tracemalloc), and check
+        resident memory against io.memory_budget
+        """
+
+        io = self.config.io
+
+        if io.cycle_memory <= 0 or (self._cycle_number % io.cycle_memory) != 0:
+            return
+
+        write = self._write_outputs and not (io.memory_output_filename is None)
+
+        if (not write) and (io.memory_budget is None):
+            return
+
+        if write and io.cycle_tracemalloc > 0:
+            log = io.get_memory_log()
+            log.start_tracing()
+            if (self._cycle_number % io.cycle_tracemalloc) == 0:
+                log.snapshot(self._cycle_number, self.t)
+
+        values = self.memory_usage()
+
+        if write:
+            io.get_memory_log().add(values)
+
+        if io.memory_budget is None:
+            return
+
+        if values['rss'] <= io.memory_budget * 1024.0**2:
+            self._over_memory_budget = False
+            return
+
+        action = io.memory_budget_action
+
+        if callable(action):
+            action(self, values['rss'])
+
+        elif action == 'compact':
+            # compact when the budget is crossed, then again only if memory keeps growing
+            if (not self._over_memory_budget) or\
+               values['rss'] > self._rss_compacted * (1.0 + _compact_growth):
+                self._flush_outputs()
+                gc.collect()
+                self._rss_compacted = perf.rss()[0]
+                _my_print("Resident memory %.1f MB over budget of %.1f MB. Wrote out buffers, now %.1f MB"%(
+                               values['rss'] / 1024.0**2, io.memory_budget, self._rss_compacted / 1024.0**2))
+
+        elif not self._over_memory_budget:
+            # warn once each time the budget is crossed
+            _my_print("WARNING: Resident memory %.1f MB over budget of %.1f MB with %i stars (%.0f bytes per star)"%(
+                           values['rss'] / 1024.0**2, io.memory_budget, values['N_stars'], values['bytes_per_star']))
+
+        self._over_memory_budget = True
+
+        return
+
+    def _write_samples(self, sampler):
+        """
+        Stop the sampling profiler of evolve_iter and write its stacks
+        """
+
+        if sampler is None:
+            return
+
+        sampler.stop()
+        sampler.write(self.config.global_values.sample_filename)
+
+        _my_print("Sampling profiler: %i samples (%.2f%% overhead) written to "%(sampler.N_samples,
+                                                                                100.0 * sampler.overhead) +\
+                  self.config.global_values.sample_filename)
 
         return
 
@@ -322,27 +714,28 @@ class Zone:
         # delete / close things that need closing here. Call other
         # clean-up routines
 
-        config.io._clean_up()
+        self._flush_summary_buffer()
+        self.config.io._clean_up()
 
         return
 
     def _update_globals(self):
 
-        config.global_values.time = self.t
+        self.config.global_values.time = self.t
 
         return
 
     @property
     def current_redshift(self):
 
-        t_h = config.units.hubble_time
+        t_h = self.config.units.hubble_time
         z   = (2.0 * t_h / (3.0*self.t))**(2.0/3.0) - 1.0
 
         return z
 
     def _update_metallicity(self):
 
-        if config.zone.constant_metallicity:
+        if self.config.zone.constant_metallicity:
             return
 
         self.Z = self.species_masses['m_metal'] / self.M_gas
@@ -358,7 +751,11 @@ class Zone:
         abund = {}
 
         for x in self.species_masses.keys():
-            abund[x] = self.species_masses[x] / self.M_gas
+            # a zone that ran out of gas has no abundances left
+            if self.M_gas <= 0:
+                abund[x] = 0.0
+            else:
+                abund[x] = self.species_masses[x] / self.M_gas
 
 
         return abund
@@ -392,20 +789,121 @@ class Zone:
 
     @property
     def M_stars(self):
-        return np.sum(self.all_stars.M())
+        return self.all_stars.totals()['M']
 
     def _compute_dt(self):
 
-        if config.zone.adaptive_timestep:
+        if self.config.zone.adaptive_timestep and self.config.zone.event_timestep:
+            self.dt, self._dt_limiter = self._compute_event_dt()
+
+        elif self.config.zone.adaptive_timestep:
             lifetimes = np.asarray(self.all_stars.property_asarray('lifetime','star'))
 
             if np.size(lifetimes) > 1:
-                max_dt       = config.zone.max_dt  * const.Myr / config.units.time
-                min_lifetime = np.min( lifetimes ) / (config.units.time)
-                self.dt      = np.min(  [min_lifetime / (1.0 * config.zone.timestep_safety_factor), max_dt] )
+                max_dt       = self.config.zone.max_dt  * const.Myr / self.config.units.time
+                min_lifetime = np.min( lifetimes ) / (self.config.units.time)
+                self.dt      = np.min(  [min_lifetime / (1.0 * self.config.zone.timestep_safety_factor), max_dt] )
+                self._dt_limiter = 'max_dt' if self.dt == max_dt else 'lifetime'
 
         return
 
+    def _compute_event_dt(self):
+        """
+        Choose the timestep from the schedule of upcoming events: the next
+        stellar death, start of an AGB wind phase, or Type Ia supernova, and
+        the next output time. Between events stellar winds are constant and
+        the gas equation is integrated exactly (see _step_averaged_gas_mass),
+        so quiescent phases can be crossed in a few large steps, up to
+        event_timestep_max_dt rather than max_dt once star formation has
+        stopped. Closely spaced events are batched by never stepping below
+        the usual lifetime based timestep (or event_timestep_min_dt), so
+        this never takes more steps than the default controller. Returns
+        the timestep and the name of the limiting condition.
+        """
+
+        forming_stars = self.config.zone.star_formation_method > 0 and self.M_gas > 0.0
+
+        if forming_stars:
+            max_dt = self.config.zone.max_dt * const.Myr / self.config.units.time
+        else:
+            max_dt = self.config.zone.event_timestep_max_dt * const.Myr / self.config.units.time
+
+        min_dt = self.config.zone.event_timestep_min_dt * const.Myr / self.config.units.time
+
+        limits = [ (max_dt, 'max_dt') ]
+
+        if self.config.zone.t_final - self.t > 0.0:
+            limits.append( (self.config.zone.t_final - self.t, 't_final') )
+
+        lifetimes = np.asarray(self.all_stars.property_asarray('lifetime','star'))
+        if np.size(lifetimes) > 1:
+            min_lifetime = np.min( lifetimes ) / (self.config.units.time)
+            min_dt       = np.max( [min_dt, min_lifetime / (1.0 * self.config.zone.timestep_safety_factor)])
+
+        #
+        # stars formed this step should not die before the next one, but
+        # as with stellar events, do not step below min_dt for them
+        #
+        if forming_stars:
+            limits.append( (np.max([self._shortest_stellar_lifetime(), min_dt]), 'star_formation') )
+
+        t_event = self.all_stars.next_event_time(self.t, params = self._star_parameters)
+        if t_event > self.t:
+            limits.append( (np.max([t_event - self.t, min_dt]), 'stellar_event') )
+
+        for t_last, dt_out in [ (self._t_last_dump,    self.config.io.dt_dump),
+                                (self._t_last_pickle,  self.config.io.dt_pickle),
+                                (self._t_last_summary, self.config.io.dt_summary)]:
+            if dt_out > 0 and (t_last + dt_out) > self.t:
+                limits.append( (t_last + dt_out - self.t, 'output') )
+
+        dt, limiter = min(limits, key = lambda x : x[0])
+
+        return dt, limiter
+
+    def _shortest_stellar_lifetime(self):
+        """
+        Lifetime (code units) of the most massive star the IMF can form
+        at the current gas metallicity
+        """
+
+        M_max = star.SE_TABLE.x['mass'][-1]
+        if not (self.config.zone.imf is None):
+            M_max = np.min([self.config.zone.imf.M_max, M_max])
+
+        Z = np.clip(self.Z, star.SE_TABLE.x['metallicity'][0] / star._interpolation_hack,
+                            star.SE_TABLE.x['metallicity'][-1])
+
+        return star.SE_TABLE.interpolate([M_max, Z], 'lifetime') / self.config.units.time
+
+    def _step_averaged_gas_mass(self):
+        """
+        Gas mass averaged over the coming timestep. When SFR, outflow, and
+        inflow are all proportional to the gas mass and stellar ejecta are
+        constant over the step, the gas mass obeys dM/dt = S - k M, which is
+        integrated exactly here. Using this average for the SFR makes the
+        explicit update in evolve exact even for steps much longer than the
+        gas consumption time. Only used with event timestepping.
+        """
+
+        if not self.config.zone.event_timestep:
+            return self.M_gas
+
+        k = self.config.zone.SFR_efficiency
+
+        if self.config.zone.mass_outflow_method == 1 and not self.config.zone.cosmological_evolution:
+            k = k * (1.0 + self.config.zone.mass_loading_factor * (1.0 - self.config.zone.inflow_factor))
+
+        if k <= 0.0 or self.dt <= 0.0:
+            return self.M_gas
+
+        M_o  = self.M_gas + self.SN_ej_masses['m_tot']
+        M_eq = self.Mdot_ej_masses['m_tot'] / k
+
+        x = k * self.dt
+
+        return M_eq + (M_o - M_eq) * (-np.expm1(-x) / x)
+
     def _evolve_stars(self):
         """
         Evolve stars using star list methods, and compute the total
@@ -427,19 +925,30 @@ class Zone:
         #
         self.all_stars.evolve(self.t, self.dt, ej_masses    = self.Mdot_ej_masses,
                                                sn_masses    = self.SN_ej_masses,
-                                               special_accumulator = self.special_mass_accumulator)
+                                               special_accumulator = self.special_mass_accumulator,
+                                               params       = self._star_parameters,
+                                               rng          = self.random_streams['SNIa'])
 
-        self.Mdot_ej = self.Mdot_ej_masses['m_tot'] * config.units.time
+        self.Mdot_ej = self.Mdot_ej_masses['m_tot'] * self.config.units.time
 
         for e in self.species_masses.keys():
-            self.Mdot_ej_masses[e] *= config.units.time
+            self.Mdot_ej_masses[e] *= self.config.units.time
+
+        #
+        # check the running star totals for drift now and then
+        #
+        check_cycle = self.config.zone.totals_check_cycle
+        if check_cycle > 0 and self._cycle_number % check_cycle == 0:
+            drift = self.all_stars.recompute_totals()
+            if drift > _totals_drift_tolerance:
+                _my_print("Running star totals drifted by %5.5E (relative). Reset from all stars"%(drift))
 
         return
         #
         # set total dM/dt from all stellar winds
         #
       #  self.Mdot_ej = 0.0
-     #   mass_loss_rate = self.all_stars.property_asarray('Mdot_ej') * config.units.time
+     #   mass_loss_rate = self.all_stars.property_asarray('Mdot_ej') * self.config.units.time
     #    self.Mdot_ej = np.sum( mass_loss_rate )
 
         #
@@ -455,7 +964,7 @@ class Zone:
     #        self.Mdot_ej_masses[e]  = np.sum(self.all_stars.species_asarray('Mdot_ej_' + e, 'star') * self.all_stars.property_asarray('Mdot_ej','star'))
    #         self.Mdot_ej_masses[e] += np.sum(self.all_stars.species_asarray('Mdot_ej_' + e, 'new_WD')      * self.all_stars.property_asarray('Mdot_ej', 'new_WD'))
   #          self.Mdot_ej_masses[e] += np.sum(self.all_stars.species_asarray('Mdot_ej_' + e, 'new_remnant') * self.all_stars.property_asarray('Mdot_ej','new_remnant'))
- #           self.Mdot_ej_masses[e] *= config.units.time
+ #           self.Mdot_ej_masses[e] *= self.config.units.time
 #
 #            self.SN_ej_masses[e]   = np.sum(self.all_stars.species_asarray('SN_ej_' + e, 'new_SNIa_remnant'))
 #            self.SN_ej_masses[e]  += np.sum(self.all_stars.species_asarray('SN_ej_' + e, 'new_remnant'))
@@ -478,7 +987,7 @@ class Zone:
         if (M_sf < 0.0):
             M_sf = self.dt * self.Mdot_sf
 
-        if config.zone.use_SF_mass_reservoir and M_sf > 0.0:
+        if self.config.zone.use_SF_mass_reservoir and M_sf > 0.0:
             #
             # Accumulate mass into "reservoir" and wait until
             # this is surpassed to form stars
@@ -486,7 +995,7 @@ class Zone:
 
             self._M_sf_reservoir += M_sf
 
-            if (self._M_sf_reservoir > config.zone.SF_mass_reservoir_size):
+            if (self._M_sf_reservoir > self.config.zone.SF_mass_reservoir_size):
 
                 # sample from IMF until M_sf is reached
                 M_sf = self._M_sf_reservoir
@@ -494,18 +1003,18 @@ class Zone:
             else:
                 M_sf = 0.0
 
-        elif (config.zone.use_stochastic_mass_sampling and\
-                M_sf < config.zone.stochastic_sample_mass) and M_sf > 0.0:
+        elif (self.config.zone.use_stochastic_mass_sampling and\
+                M_sf < self.config.zone.stochastic_sample_mass) and M_sf > 0.0:
             #
             # Prevent undersampling the IMF by requiring minimum mass
             # threshold. Allow SF to happen stochastically when M_sf is
             # below this threshold
             #
 
-            probability_of_sf = M_sf / config.zone.stochastic_sample_mass
+            probability_of_sf = M_sf / self.config.zone.stochastic_sample_mass
 
-            if (probability_of_sf > np.random.random()):
-                M_sf = config.zone.stochastic_sample_mass
+            if (probability_of_sf > self.random_streams['star_formation'].random()):
+                M_sf = self.config.zone.stochastic_sample_mass
             else:
                 M_sf = 0.0
 
@@ -516,16 +1025,16 @@ class Zone:
 
             # sample from IMF and sum sampled stars
             # to get actual star formation mass
-            config.global_values.profiler.start_timer('make_stars-imf',True)
-            star_masses = config.zone.imf.sample(M = M_sf)
-            config.global_values.profiler.end_timer('make_stars-imf')
+            self.config.global_values.profiler.start_timer('make_stars-imf',True)
+            star_masses = self.config.zone.imf.sample(M = M_sf, rng = self.random_streams['imf'])
+            self.config.global_values.profiler.end_timer('make_stars-imf')
             M_sf = np.sum(star_masses)
 
-            if config.zone.minimum_star_particle_mass > 0:
+            if self.config.zone.minimum_star_particle_mass > 0:
 
-                select       = star_masses > config.zone.minimum_star_particle_mass
+                select       = star_masses > self.config.zone.minimum_star_particle_mass
                 i_unresolved = 0
-                if np.size(star_masses[star_masses<=config.zone.minimum_star_particle_mass]) > 0:
+                if np.size(star_masses[star_masses<=self.config.zone.minimum_star_particle_mass]) > 0:
                     i_unresolved = 1
 
                 # add each new star to the star list
@@ -534,35 +1043,68 @@ class Zone:
                     ids = [ids]
 
                 i = 0
-                config.global_values.profiler.start_timer('make_stars-add',True)
+                new_stars = []
+                self.config.global_values.profiler.start_timer('make_stars-add',True)
                 for i,m in enumerate(star_masses[select]):
                     ids[i] = self._assign_particle_id()
-                    self.all_stars.add_new_star( star.Star(M=m,Z=self.Z,
-                                                 abundances=self.abundances,
-                                                 tform=self.t,id=ids[i]))
+                    new_stars.append( star.Star(M=m,Z=self.Z,
+                                                abundances=self.abundances,
+                                                tform=self.t,id=ids[i],
+                                                params=self._star_parameters,
+                                                write_abundances=False))
+                    self.all_stars.add_new_star(new_stars[-1])
                 if i_unresolved > 0:
                     if i > 0:
                         i = i + 1
 
                     ids[i] = self._assign_particle_id()
-                    M_unresolved = np.sum( star_masses[star_masses<=config.zone.minimum_star_particle_mass])
-                    self.all_stars.add_new_star( star.Star(M=M_unresolved,Z=self.Z,
-                                                 abundances=self.abundances,tform=self.t,
-                                                 id= ids[i], star_type = "unresolved_star"))
-
-                config.global_values.profiler.end_timer('make_stars-add')
+                    M_unresolved = np.sum( star_masses[star_masses<=self.config.zone.minimum_star_particle_mass])
+                    new_stars.append( star.Star(M=M_unresolved,Z=self.Z,
+                                                abundances=self.abundances,tform=self.t,
+                                                id= ids[i], star_type = "unresolved_star",
+                                                params=self._star_parameters,
+                                                write_abundances=False))
+                    self.all_stars.add_new_star(new_stars[-1])
+
+                self._write_new_star_abundances(new_stars)
+                self.config.global_values.profiler.end_timer('make_stars-add')
             else:
                 # add each new star to the star list
                 ids = np.zeros(np.size(star_masses))
+                new_stars = []
 
                 for i,m in enumerate(star_masses):
                     ids[i] = self._assign_particle_id()
-                    self.all_stars.add_new_star( star.Star(M=m, Z=self.Z,
-                                                 abundances=self.abundances,
-                                                 tform=self.t,id=ids[i]))
+                    new_stars.append( star.Star(M=m, Z=self.Z,
+                                                abundances=self.abundances,
+                                                tform=self.t,id=ids[i],
+                                                params=self._star_parameters,
+                                                write_abundances=False))
+                    self.all_stars.add_new_star(new_stars[-1])
+
+                self._write_new_star_abundances(new_stars)
 
         return M_sf
 
+    def _write_new_star_abundances(self, new_stars):
+        """
+        Add the stars formed this step to the abundance output as a
+        single formation event
+        """
+
+        output = self.config.io._abundance_output
+
+        if output is None or len(new_stars) == 0 or not self._write_outputs:
+            return
+
+        # all stars formed this step share the gas abundances
+        output.add_stars(self.t, self.Z,
+                         [self.abundances[e] for e in self.config.zone.species_to_track],
+                         [x.id for x in new_stars], [x.M for x in new_stars],
+                         [x.properties['lifetime'] for x in new_stars])
+
+        return
+
 
     def _assign_particle_id(self):
         """
@@ -584,16 +1126,16 @@ class Zone:
 
         self.Mdot_DM = 0.0
 
-        if not config.zone.cosmological_evolution:
+        if not self.config.zone.cosmological_evolution:
             return
 
         self.Mdot_DM = 46.1 * ( self.M_DM / 1.0E12 )**(1.1) *\
                        (1.0 + 1.11 * self.current_redshift) *\
-              np.sqrt( config.units.omega_matter * (1.0 + self.current_redshift)**3 + config.units.omega_lambda)
+              np.sqrt( self.config.units.omega_matter * (1.0 + self.current_redshift)**3 + self.config.units.omega_lambda)
 
         self.Mdot_DM *= const.yr_to_s
 
-        self.Mdot_DM /= config.units.time
+        self.Mdot_DM /= self.config.units.time
 
         return
 
@@ -602,7 +1144,7 @@ class Zone:
         Compute inflow rate, as a function of outflow
         """
 
-        self.Mdot_in  = config.zone.inflow_factor * self.Mdot_out
+        self.Mdot_in  = self.config.zone.inflow_factor * self.Mdot_out
         return
 
     def _compute_outflow(self):
@@ -614,30 +1156,30 @@ class Zone:
         # outflow should be determined by mass of stars formed, not
         # rate
 
-        factor = config.zone.mass_loading_factor
+        factor = self.config.zone.mass_loading_factor
 
-        if config.zone.cosmological_evolution:
-            factor = factor * (1.0 + self.current_redshift)**(-config.zone.mass_loading_index/2.0)
+        if self.config.zone.cosmological_evolution:
+            factor = factor * (1.0 + self.current_redshift)**(-self.config.zone.mass_loading_index/2.0)
 
-        elif config.zone.mass_outflow_method == 1:
+        elif self.config.zone.mass_outflow_method == 1:
             # mass outflow is controlled by a mass loading factor parameter
-            if config.zone.use_SF_mass_reservoir or config.zone.use_stochastic_mass_sampling:
-                self.Mdot_out = config.zone.mass_loading_factor * self.M_sf / self.dt
+            if self.config.zone.use_SF_mass_reservoir or self.config.zone.use_stochastic_mass_sampling:
+                self.Mdot_out = self.config.zone.mass_loading_factor * self.M_sf / self.dt
             else:
-                self.Mdot_out = config.zone.mass_loading_factor * self.Mdot_sf
+                self.Mdot_out = self.config.zone.mass_loading_factor * self.Mdot_sf
 
-        elif config.zone.mass_outflow_method == 4:
+        elif self.config.zone.mass_outflow_method == 4:
 
-            self.Mdot_out = self._interpolate_tabulated_outflow('m_tot') * config.zone.outflow_factor * self.Mdot_sf * self.M_gas
+            self.Mdot_out = self._interpolate_tabulated_outflow('m_tot') * self.config.zone.outflow_factor * self.Mdot_sf * self.M_gas
 
             for e in self.Mdot_out_species.keys():
-                self.Mdot_out_species[e] = self.Mdot_ej_masses[e] * config.zone.wind_ejection_fraction +\
-                                           (self.SN_ej_masses[e]   * config.zone.sn_ejection_fraction / self.dt)
+                self.Mdot_out_species[e] = self.Mdot_ej_masses[e] * self.config.zone.wind_ejection_fraction +\
+                                           (self.SN_ej_masses[e]   * self.config.zone.sn_ejection_fraction / self.dt)
 
             for e in ['H','He']: # throw out ambient
                 self.Mdot_out_species[e] = self.Mdot_out * self.abundances[e]
 
-        elif config.zone.mass_outflow_method == 2 or config.zone.mass_outflow_method == 3:
+        elif self.config.zone.mass_outflow_method == 2 or self.config.zone.mass_outflow_method == 3:
 
             # these are fractional outflow rates:
             self.Mdot_out             = self._interpolate_tabulated_outflow('m_tot')     # get total outflow rate
@@ -645,7 +1187,7 @@ class Zone:
             for e in self.Mdot_out_species.keys():
                 self.Mdot_out_species[e]  = self._interpolate_tabulated_outflow(e)       # for each species
 
-            if config.zone.mass_outflow_method == 2: # outflow depends on sfr
+            if self.config.zone.mass_outflow_method == 2: # outflow depends on sfr
 
                 # multiply by SFR and current total amount of each species
                 self.Mdot_out = self.Mdot_out * self.Mdot_sf * self.M_gas
@@ -654,7 +1196,7 @@ class Zone:
                     self.Mdot_out_species[e] = self.Mdot_out_species[e] * self.Mdot_sf * (self.M_gas * self.abundances[e])
 
             else: # outflow is a fixed fraction of injection - use mass loading factor for total, H, and He
-                self.Mdot_out = config.zone.mass_loading_factor * (self.M_sf / self.dt)
+                self.Mdot_out = self.config.zone.mass_loading_factor * (self.M_sf / self.dt)
 
                 for e in self.abundances.keys():
                     self.Mdot_out_species[e] = (self.Mdot_ej_masses[e] + self.SN_ej_masses[e]) / self.dt # converted to a rate for consistency
@@ -669,32 +1211,32 @@ class Zone:
 
     @property
     def t_dyn(self):
-        if not config.zone.cosmological_evolution:
+        if not self.config.zone.cosmological_evolution:
             _my_print("Error: Cannot compute cosmological dynamical time with non-cosmological simulation")
             raise NotImplementedError
 
-        return 0.1 * config.units.hubble_time * (1.0 + self.current_redshift)**(-3.0/2.0)
+        return 0.1 * self.config.units.hubble_time * (1.0 + self.current_redshift)**(-3.0/2.0)
 
     def _compute_sfr(self):
         """
         Compute SFR using method set in config
         """
 
-        if config.zone.star_formation_method == 0:
+        if self.config.zone.star_formation_method == 0:
             # no star formation
             self.Mdot_sf = 0.0
 
-        elif config.zone.star_formation_method == 1:
+        elif self.config.zone.star_formation_method == 1:
             # constant, user supplied SFR
-            self.Mdot_sf = config.zone.constant_SFR
+            self.Mdot_sf = self.config.zone.constant_SFR
 
-        elif config.zone.star_formation_method == 2 :
-            self.Mdot_sf = config.zone.SFR_efficiency * self.M_gas
+        elif self.config.zone.star_formation_method == 2 :
+            self.Mdot_sf = self.config.zone.SFR_efficiency * self._step_averaged_gas_mass()
 
-        elif config.zone.star_formation_method == 3:
-            self.Mdot_sf = config.zone.SFR_dyn_efficiency * self.M_gas / self.t_dyn
+        elif self.config.zone.star_formation_method == 3:
+            self.Mdot_sf = self.config.zone.SFR_dyn_efficiency * self.M_gas / self.t_dyn
 
-        elif config.zone.star_formation_method == 4 :
+        elif self.config.zone.star_formation_method == 4 :
             # interpolate SFR from tabulated SFH
             self.Mdot_sf = self._interpolate_SFR()
 
@@ -745,18 +1287,18 @@ class Zone:
 
     def _initialize_tabulated_sfr(self):
 
-        if not (config.zone.SFR_filename is None):
-            if not os.path.isfile(config.zone.SFR_filename):
-                _my_print(config.zone.SFR_filename + " does not exist. Must set to use tabulated SFR")
+        if not (self.config.zone.SFR_filename is None):
+            if not os.path.isfile(self.config.zone.SFR_filename):
+                _my_print(self.config.zone.SFR_filename + " does not exist. Must set to use tabulated SFR")
                 raise ValueError
         else:
-            _my_print("Must set config.zone.SFR_file to use tabulated SFR")
+            _my_print("Must set self.config.zone.SFR_file to use tabulated SFR")
             raise ValueError
 
-        data = np.genfromtxt(config.zone.SFR_filename, names = True)
+        data = np.genfromtxt(self.config.zone.SFR_filename, names = True)
 
-        self._tabulated_SFR_t = data['t']   * const.Myr / config.units.time  # in Myr
-        self._tabulated_SFR   = data['SFR'] / const.yr_to_s * config.units.time
+        self._tabulated_SFR_t = data['t']   * const.Myr / self.config.units.time  # in Myr
+        self._tabulated_SFR   = data['SFR'] / const.yr_to_s * self.config.units.time
 
 
         self._SFR_interpolation_function = interp1d(self._tabulated_SFR_t,
@@ -769,18 +1311,18 @@ class Zone:
 
     def _initialize_tabulated_mass_outflow(self):
 
-        if not (config.zone.outflow_filename is None):
-            if not os.path.isfile(config.zone.outflow_filename):
-                _my_print(config.zone.outflow_filename + " does not exist. Must set properly to use tabulated outflow rates")
+        if not (self.config.zone.outflow_filename is None):
+            if not os.path.isfile(self.config.zone.outflow_filename):
+                _my_print(self.config.zone.outflow_filename + " does not exist. Must set properly to use tabulated outflow rates")
                 raise ValueError
         else:
-            _my_print("Must set config.zone.outflow_filename to use tabulated outflow rates")
+            _my_print("Must set self.config.zone.outflow_filename to use tabulated outflow rates")
             raise ValueError
 
         # skip header assuming this is generated by galaxy_analysis generation utilities
-        data = np.genfromtxt(config.zone.outflow_filename, names = True, skip_header = 5)
+        data = np.genfromtxt(self.config.zone.outflow_filename, names = True, skip_header = 5)
 
-        self._tabulated_outflow_t  = data['t'] * const.Myr / config.units.time
+        self._tabulated_outflow_t  = data['t'] * const.Myr / self.config.units.time
 
         species = [x for x in data.dtype.names if x is not 't']
 
@@ -815,15 +1357,25 @@ class Zone:
 
         return
 
+    def _timed_output(self, name):
+        """
+        Call output method name under a timer of the same name
+        """
+        self.config.global_values.profiler.start_timer(name)
+        getattr(self, name)()
+        self.config.global_values.profiler.end_timer(name)
+        return
+
     def _check_output(self, force = False):
         """
         Checks output conditions, output if any are met
         """
 
         if force:
-            self.write_output()
-            self.write_full_pickle()
-            self.write_summary_output()
+            self._timed_output('write_output')
+            self._timed_output('write_full_pickle')
+            self._timed_output('write_summary_output')
+            self._timed_output('write_checkpoint')
             return
 
         #
@@ -833,108 +1385,141 @@ class Zone:
         #
         # check for full write out
         #
-        if( (self.t - self._t_last_dump) >= config.io.dt_dump and\
-              config.io.dt_dump > 0 ):
-            self._t_last_dump = self.t
-            self.write_output()
+        t_next = self._next_output_time(self._t_last_dump, self.config.io.dt_dump)
+        if t_next > self._t_last_dump:
+            self._t_last_dump = t_next
+            self._timed_output('write_output')
 
         if( self._cycle_number == 0 or\
-           ((self._cycle_number - self._cycle_last_dump) >= config.io.cycle_dump )\
-           and config.io.cycle_dump > 0 ):
+           ((self._cycle_number - self._cycle_last_dump) >= self.config.io.cycle_dump )\
+           and self.config.io.cycle_dump > 0 ):
             self._cycle_last_dump = self._cycle_number
-            self.write_output()
+            self._timed_output('write_output')
 
-        if( (self.t - self._t_last_pickle) >= config.io.dt_pickle and\
-              config.io.dt_pickle > 0 ):
-            self._t_last_pickle = self.t
-            self.write_full_pickle()
+        t_next = self._next_output_time(self._t_last_pickle, self.config.io.dt_pickle)
+        if t_next > self._t_last_pickle:
+            self._t_last_pickle = t_next
+            self._timed_output('write_full_pickle')
 
         if( self._cycle_number == 0 or\
-           ((self._cycle_number - self._cycle_last_pickle) >= config.io.cycle_pickle )\
-           and config.io.cycle_pickle > 0 ):
+           ((self._cycle_number - self._cycle_last_pickle) >= self.config.io.cycle_pickle )\
+           and self.config.io.cycle_pickle > 0 ):
             self._cycle_last_pickle = self._cycle_number
-            self.write_full_pickle()
+            self._timed_output('write_full_pickle')
 
         #
         # now check for partial (summary) writes
         #
         if(  self._cycle_number == 0 or\
-            (self._cycle_number - self._cycle_last_summary >= config.io.cycle_summary)\
-            and config.io.cycle_summary > 0):
+            (self._cycle_number - self._cycle_last_summary >= self.config.io.cycle_summary)\
+            and self.config.io.cycle_summary > 0):
 
             self._cycle_last_summary = self._cycle_number
-            self.write_summary_output()
+            self._timed_output('write_summary_output')
 
-        if( ((self.t - self._t_last_summary) > config.io.dt_summary) and
-            config.io.dt_summary > 0 ):
-            self._t_last_summary = self.t
-            self.write_summary_output()
+        t_next = self._next_output_time(self._t_last_summary, self.config.io.dt_summary,
+                                        strict = True)
+        if t_next > self._t_last_summary:
+            self._t_last_summary = t_next
+            self._timed_output('write_summary_output')
+
+        #
+        # checkpoints go last so a restart does not repeat this cycle's outputs
+        #
+        t_next = self._next_output_time(self._t_last_checkpoint, self.config.io.dt_checkpoint)
+        if t_next > self._t_last_checkpoint:
+            self._t_last_checkpoint = t_next
+            self._timed_output('write_checkpoint')
+
+        if( (self._cycle_number - self._cycle_last_checkpoint) >= self.config.io.cycle_checkpoint and\
+              self.config.io.cycle_checkpoint > 0 ):
+            self._cycle_last_checkpoint = self._cycle_number
+            self._timed_output('write_checkpoint')
 
         return
 
+    def _next_output_time(self, t_last, dt_out, strict = False):
+        """
+        Time of the latest output every dt_out after t_last that is due
+        at the current time, or t_last if none is. With event
+        timestepping, output times stay on multiples of dt_out from t_last,
+        rather than drifting with the timestep, and are matched to within
+        _output_tolerance. Otherwise an output is due once dt_out has
+        passed (more than dt_out if strict) and is taken at the current time.
+        """
+
+        if dt_out <= 0:
+            return t_last
+
+        if not (self.config.zone.adaptive_timestep and self.config.zone.event_timestep):
+            elapsed = self.t - t_last
+            if elapsed > dt_out or (elapsed == dt_out and not strict):
+                return self.t
+
+            return t_last
+
+        n_out = np.floor((self.t - t_last) / dt_out + _output_tolerance)
+
+        if n_out < 1:
+            return t_last
+
+        return t_last + n_out * dt_out
+
     def write_output(self):
         """
         Output the full information needed to reconstruct the simulation. This
         is the mass, metallicity, birth mass, age, abundance, and type for each star,
         along with the current gas mass, dark matter mass, sfr, and gas abundances.
+        The data is gathered here and written to file by _write_dump_file
+        (on the background writer thread if io.background_output is set).
 
-        """
-
-        # make an HDF5 file to write out to
-        name = config.io.dump_output_basename + "_%0004i"%(self._output_number) + '.h5'
+        With io.dump_single_file, all dumps go into one file,
+        dump_output_basename + '.h5', instead of one file per dump: the
+        parameters are written once and each dump is appended as a group
+        'snapshots/XXXX' with the stars in a single structured dataset.
+        The 'index' dataset (output number, time, cycle, number of stars)
+        gives random access to the snapshots.
 
-        hf = h5py.File(name, 'w')
-
-        zone_grp = hf.create_group('zone')
-        star_grp = hf.create_group('star')
-        params   = hf.create_group('parameters')
+        """
 
-        # save parameters
-        for param_list, grpname in [ (config.units,'units'),\
-                                     (config.zone,'zone'),\
-                                     (config.stars,'stars'),\
-                                     (config.io,'io'), (config.data,'data_table')]:
-            subgrp = params.create_group(grpname)
+        if self.config.io.dump_output_basename is None:
+            return
 
-            for p in dir(param_list):
-                # There may be a better way to do this, but I don't want to have
-                # to explicityly state any params, just print all. Need to skip
-                # all objects or functions though
-                if ('__' in p) or\
-                   callable( getattr(param_list, p))\
-                   or (p[0] == '_') or p == 'imf':
-                  continue
-                #print p, getattr(param_list,p)
+        single_file = self.config.io.dump_single_file
 
-                val = getattr(param_list,p)
-                if val is None:
-                    val = "None"
+        # make an HDF5 file to write out to
+        if single_file:
+            name = self.config.io.dump_output_basename + '.h5'
+        else:
+            name = self.config.io.dump_output_basename + "_%0004i"%(self._output_number) + '.h5'
 
-                subgrp.attrs[p] = val
+        # save parameters (only once with a single file)
+        parameters = None
+        if not (single_file and self._output_number > 0):
+            parameters = self._gather_parameters()
 
         #
         # save meta-data as attributes
         #
         self._accumulate_summary_data()
 
-        hf.attrs['current_time'] = self.t
-
-
         #
         # Save zone parameters. This is anything to do with gas or DM
         # properties
-        zone_grp.attrs['M_gas']    = self.M_gas
-        zone_grp.attrs['M_DM']     = self.M_DM
-        zone_grp.attrs['M_star']   = self._summary_data['M_star']
-        zone_grp.attrs['M_star_o'] = self._summary_data['M_star_o']
-        zone_grp.attrs['Z_gas']    = self.Z
+        zone_attrs = {}
+        zone_attrs['M_gas']    = self.M_gas
+        zone_attrs['M_DM']     = self.M_DM
+        zone_attrs['M_star']   = self._summary_data['M_star']
+        zone_attrs['M_star_o'] = self._summary_data['M_star_o']
+        zone_attrs['Z_gas']    = self.Z
 
         for e in self.abundances.keys():
-            zone_grp.attrs[e] = self.abundances[e]
-            zone_grp.attrs[e + '_mass'] = self.species_masses[e]
+            zone_attrs[e] = self.abundances[e]
+            zone_attrs[e + '_mass'] = self.species_masses[e]
 
         #
-        # Save star parameters as lists of values
+        # Save star parameters as lists of values. These are new arrays,
+        # so later changes to the stars do not touch them
         #
         star_dict = {} # OrderedDict()
         _gather_properties = { 'mass' : 'mass', 'birth_mass' : 'birth_mass',
@@ -945,100 +1530,308 @@ class Zone:
 
         star_dict['type']         = np.asarray(self.all_stars.property_asarray('type')).astype('S')
 
-        Nstars = np.size(star_dict['mass'])
-
-        if Nstars > 1:
-            # there has to be a better way to do this... but various iterations
-            # of the below did not work b/c of the different variable types...
-            # doing this the slow way......
-        #    star_data = [None]*Nstars
-        #    for i in np.arange(Nstars):
-        #        star_data[i] = (star_dict['id'][i], star_dict['type'][i],
-        #                        star_dict['initial_mass'][i],
-        #                        star_dict['masses'][i], star_dict['age'][i],
-        #                        star_dict['metallicity'][i])
-        #    star_data = np.array(star_data, dtype = [ ('id',star_dict['id'].dtype),
-        #                                              ('type',star_dict['type'].dtype),
-        #                                              ('birth_mass',star_dict['initial_mass'].dtype),
-        #                                              ('mass',star_dict['masses'].dtype),
-        #                                              ('age',star_dict['age'].dtype),
-        #                                              ('metallicity',star_dict['metallicity'].dtype)])
-
-#            star_data = np.column_stack(
-#                                        (star_dict['masses'].astype('float64'), star_dict['initial_mass'].astype('float64'),
-#                                         star_dict['metallicity'].astype('float64'), star_dict['id'].astype('int64'),
-#                                         star_dict['type'].astype('str'),
-#                                         star_dict['age'].astype('float64'))).ravel().view([ ('mass', np.dtype('float64')),
-#                                                                           ('initial_mass', np.dtype('float64')),
-#                                                                           ('metallicity', np.dtype('float64')),
-#                                                                           ('id', np.dtype('int64')),
-#                                                                           ('type', np.dtype('str')),
-#                                                                           ('age', np.dtype('float64'))])
-
-            for k in star_dict.keys():
-                star_grp.create_dataset(k, data=star_dict[k])
-        else:
-            Nstars    = 0
-            star_data = np.zeros(1)
-            for k in star_dict.keys():
-                star_grp.create_dataset(k, data = star_data)
+        if single_file:
+            if self.N_stars == 0:
+                star_dict = {k : v[:0] for k, v in star_dict.items()}
 
-        star_grp.attrs['number_of_stars'] = Nstars
+            if self.config.io.dump_delta:
+                datasets, static = self._star_deltas(star_dict)
+            else:
+                datasets, static = {'stars' : _structured_array(star_dict)}, None
 
-        hf.close()
+            self.config.io._submit_output(_append_dump_snapshot, name, self._output_number,
+                                          self.t, self._cycle_number, self.N_stars,
+                                          parameters, zone_attrs, datasets, static,
+                                          self.config.io.dump_compression)
+        else:
+            self.config.io._submit_output(_write_dump_file, name, self.t, parameters, zone_attrs, star_dict)
 
         self._output_number += 1
 
         return
 
+    def _star_deltas(self, star_dict):
+        """
+        Star data for a delta snapshot (io.dump_delta): the fixed values
+        (id, birth_mass, metallicity, tform) of stars formed since the last
+        snapshot, and the mass and type of only those stars that are new
+        or whose mass or type has changed since then
+        """
+
+        N_old = 0
+        if self._output_number > 0 and not (self._delta_mass is None):
+            N_old = np.size(self._delta_mass)
+
+        masses = star_dict['mass']
+        types  = star_dict['type']
+
+        changed = np.ones(np.size(masses), dtype = bool)
+        if N_old > 0:
+            changed[:N_old] = (masses[:N_old] != self._delta_mass) | (types[:N_old] != self._delta_type)
+
+        self._delta_mass = masses
+        self._delta_type = types
+
+        static = {'id'          : np.asarray(self.all_stars.property_asarray('id'))[N_old:self.N_stars],
+                  'birth_mass'  : star_dict['birth_mass'][N_old:],
+                  'metallicity' : star_dict['metallicity'][N_old:],
+                  'tform'       : np.asarray(self.all_stars.property_asarray('tform'))[N_old:self.N_stars]}
+
+        changes = {'index' : np.where(changed)[0],
+                   'mass'  : masses[changed],
+                   'type'  : types[changed]}
+
+        return {'changes' : _structured_array(changes)}, _structured_array(static)
+
+    def _gather_parameters(self):
+        """
+        All config parameter values, by parameter group, for the dumps
+        """
+
+        parameters = {}
+
+        for param_list, grpname in [ (self.config.units,'units'),\
+                                     (self.config.zone,'zone'),\
+                                     (self.config.stars,'stars'),\
+                                     (self.config.io,'io'), (self.config.data,'data_table')]:
+            parameters[grpname] = {}
+
+            for p in dir(param_list):
+                # There may be a better way to do this, but I don't want to have
+                # to explicityly state any params, just print all. Need to skip
+                # all objects or functions though
+                if ('__' in p) or\
+                   callable( getattr(param_list, p))\
+                   or (p[0] == '_') or p == 'imf':
+                  continue
+                #print p, getattr(param_list,p)
+
+                val = getattr(param_list,p)
+                if val is None:
+                    val = "None"
+
+                parameters[grpname][p] = copy.copy(val)
+
+        return parameters
+
     def write_full_pickle(self):
         """
         Pickle current simulation
         """
 
-        name = str(config.io.pickle_output_basename + "_%00004i"%(self.pickle_output_number))
+        if self.config.io.pickle_output_basename is None:
+            return
+
+        name = str(self.config.io.pickle_output_basename + "_%00004i"%(self.pickle_output_number))
 
         _my_print("Writing full dump output as " + name + " at time t = %4.4f"%(self.t))
 
-        pickle.dump( self , open(name, "wb"), -1)
+        self.config.io._submit_output(_write_bytes, name, pickle.dumps(self, -1))
 
         self.pickle_output_number += 1
 
         return
 
 
+    def write_checkpoint(self):
+        """
+        Write a checkpoint: gas state, counters, random number generator
+        state, and the star population (as typed columns) in one HDF5
+        file. The file is written under a temporary name and renamed, so
+        a checkpoint on disk is always complete, and only the last
+        io.checkpoints_to_keep checkpoints are kept. Restart from it with
+        Zone.from_checkpoint.
+        """
+
+        if self.config.io.checkpoint_basename is None:
+            return
+
+        name = self.config.io.checkpoint_basename + "_%0004i"%(self._checkpoint_number) + '.h5'
+
+        _my_print("Writing checkpoint " + name + " at time t = %4.4f"%(self.t))
+
+        self._checkpoint_number += 1
+        self._checkpoint_files.append(name)
+
+        expired = []
+        keep    = self.config.io.checkpoints_to_keep
+        if (not keep is None) and keep > 0 and len(self._checkpoint_files) > keep:
+            expired                = self._checkpoint_files[:-keep]
+            self._checkpoint_files = self._checkpoint_files[-keep:]
+
+        #
+        # record how far the appended outputs have got, so a restart
+        # can drop anything written after this point
+        #
+        self._flush_summary_buffer()
+        outputs = {'abundance_rows' : None, 'summary_rows' : self._summary_rows_written,
+                   'event_rows'     : None, 'memory_rows' : None}
+
+        for key, output in [('abundance_rows', self.config.io._abundance_output),
+                            ('event_rows',     self.config.io._event_log),
+                            ('memory_rows',    self.config.io._memory_log)]:
+            if not (output is None):
+                output.flush(force = True)
+                output.wait()
+                outputs[key] = output.rows_written
+
+        #
+        # plain values go in a JSON encoded attribute, anything else is pickled
+        #
+        state = {}
+        extra = {}
+        for k, v in self.__dict__.items():
+            if k in _checkpoint_special:
+                continue
+            try:
+                state[k] = _encode_state(v)
+            except TypeError:
+                extra[k] = v
+
+        # by value, even when this is the module level default config
+        run_config = config.RunConfig(*[getattr(self.config, p) for p in config.RunConfig._parameter_names])
+
+        contents = {'state'          : json.dumps(state),
+                    'config'         : pickle.dumps(run_config, -1),
+                    'extra'          : pickle.dumps(extra, -1) if len(extra) > 0 else None,
+                    'summary_rows'   : np.array(self._summary_rows, dtype = float),
+                    'random_streams' : {k : json.dumps(g.bit_generator.state)\
+                                                 for k, g in self.random_streams.items()},
+                    'stars'          : self.all_stars.as_columns()}
+
+        self.config.io._submit_output(_write_checkpoint_file, name, contents, outputs, expired)
+
+        return
+
+    @classmethod
+    def from_checkpoint(cls, filename, run_config = None):
+        """
+        Rebuild a Zone from a checkpoint written by write_checkpoint,
+        ready to continue with evolve. The RunConfig saved in the
+        checkpoint is used unless one is given. Summary and abundance
+        outputs are cut back to where they were when the checkpoint
+        was written.
+        """
+
+        hf = h5py.File(filename, 'r')
+
+        if run_config is None:
+            run_config = pickle.loads(hf['config'][()].tobytes())
+
+        sim        = cls.__new__(cls)
+        sim.config = run_config
+        sim.config.global_values.profiler = _new_profiler(sim.config)
+
+        sim.__dict__.update(json.loads(hf.attrs['state'], object_hook = _decode_state))
+        if 'extra' in hf:
+            sim.__dict__.update(pickle.loads(hf['extra'][()].tobytes()))
+
+        sim._summary_rows   = hf['summary_rows'][()].tolist()
+        sim._summary_buffer = None
+
+        sim.random_streams = {}
+        for k, state in hf['random_streams'].attrs.items():
+            generator = np.random.Generator(np.random.PCG64())
+            generator.bit_generator.state = json.loads(state)
+            sim.random_streams[k] = generator
+
+        star_grp = hf['stars']
+        columns  = {grpname : {k : v[()] for k, v in star_grp[grpname].items()}\
+                                for grpname in ['attributes', 'properties', 'present']}
+        columns['species'] = [e.decode() for e in star_grp.attrs['species']]
+        columns['wind_ejecta_abundances'] = star_grp['wind_ejecta_abundances'][()]
+        columns['sn_ejecta_masses']       = star_grp['sn_ejecta_masses'][()]
+
+        outputs = json.loads(hf.attrs['outputs'])
+
+        hf.close()
+
+        sim.all_stars        = star.StarList.from_columns(columns, run_config = sim.config)
+        sim._star_parameters = star.StarParameters(sim.config)
+
+        sim._restore_outputs(outputs)
+        sim._update_globals()
+
+        _my_print("Restarted from checkpoint " + filename + " at time t = %4.4f"%(sim.t))
+
+        return sim
+
+    def _restore_outputs(self, outputs):
+        """
+        Reopen the abundance, event, and memory outputs and trim the appended
+        outputs back to their size at the time of the checkpoint
+        """
+
+        io = self.config.io
+
+        if (not io.abundance_output_filename is None) and (io._abundance_output is None):
+            io._initialize_abundance_output(overwrite = False)
+
+            if not (outputs['abundance_rows'] is None):
+                _truncate_output('abundance', io._abundance_output, outputs['abundance_rows'])
+
+        if (not io.event_output_filename is None) and (io._event_log is None):
+            io._initialize_event_log(overwrite = False)
+
+            if not (outputs.get('event_rows') is None):
+                _truncate_output('event', io._event_log, outputs['event_rows'])
+
+        if (not io.memory_output_filename is None) and (io._memory_log is None) and\
+           (not outputs.get('memory_rows') is None):
+            io._initialize_memory_log(overwrite = False)
+            _truncate_output('memory', io._memory_log, outputs['memory_rows'])
+
+        if (not io.summary_output_filename is None) and os.path.isfile(io.summary_output_filename):
+            _truncate_summary_file(io.summary_output_filename, outputs['summary_rows'])
+
+        if io.dump_single_file and (not io.dump_output_basename is None) and\
+           os.path.isfile(io.dump_output_basename + '.h5'):
+            _truncate_dump_snapshots(io.dump_output_basename + '.h5', self._output_number)
+
+        return
+
+
     def _accumulate_summary_data(self):
         """
-        Set up list of all of the data to output. Sum over particle properties
-        to do this.
+        Set up list of all of the data to output. Sums over particle
+        properties are the running totals kept by the star list (see
+        StarList.totals).
         """
 
+        io = self.config.io
+
+        bin_edges = None
+        if io.radiation_binned_output:
+            if len(io.radiation_bin_names) != len(io.radiation_bin_edges) - 1:
+                _my_print("Need one io.radiation_bin_names entry per bin in io.radiation_bin_edges")
+                raise ValueError
+            bin_edges = io.radiation_bin_edges
+
+        sums = self.all_stars.totals(bin_edges)
+
         self._summary_data = {} # OrderedDict()
 
         self._summary_data['t']       = self.t
 
         self._summary_data['M_gas']   = self.M_gas
         self._summary_data['M_DM']    = self.M_DM
-        self._summary_data['M_star']  = np.sum(self.all_stars.M())
-        self._summary_data['M_star_o'] = np.sum( self.all_stars.M_o())
+        self._summary_data['M_star']  = sums['M']
+        self._summary_data['M_star_o'] = sums['M_o']
 
         self._summary_data['Z_gas']   = self.Z
-        self._summary_data['Z_star']  = np.average( self.all_stars.Z() )
+        self._summary_data['Z_star']  = sums['Z'] / sums['N'] if sums['N'] > 0 else np.nan
 
         self._summary_data['N_star']  = self.N_stars
 
         self._summary_data['N_SNIa']  = self.N_SNIa
         self._summary_data['N_SNII']  = self.N_SNII
 
-        sum_names = ['Mdot_ej', 'L_FUV', 'L_LW', 'Q0', 'Q1']
-        for n in sum_names:
-            self._summary_data[n] = np.sum(np.asarray(self.all_stars.property_asarray(n)))
+        for n in ['Mdot_ej', 'L_FUV', 'L_LW', 'Q0', 'Q1', 'L_bol', 'L_wind', 'L_Q0', 'L_Q1']:
+            self._summary_data[n] = sums[n]
 
-        self._summary_data['L_bol']  = np.sum(np.asarray(self.all_stars.property_asarray('luminosity')))
-        self._summary_data['L_wind'] = np.sum(np.asarray(self.all_stars.property_asarray('mechanical_luminosity')))
-
-        self._summary_data['L_Q0'] = np.sum(self.all_stars.property_asarray('Q0') * self.all_stars.property_asarray('E0'))
-        self._summary_data['L_Q1'] = np.sum(self.all_stars.property_asarray('Q1') * self.all_stars.property_asarray('E1'))
+        if self.config.zone.event_timestep:
+            self._summary_data['dt']         = self.dt
+            self._summary_data['dt_limiter'] = _dt_limiters.index(self._dt_limiter)
 
         # now do all of the abundances
         for e in self.abundances.keys():
@@ -1049,89 +1842,355 @@ class Zone:
         for key in self.special_mass_accumulator.keys():
             self._summary_data[key] = self.special_mass_accumulator[key]
 
-        if config.io.radiation_binned_output:
-            condition_1 = {'mass': lambda x : (x.M_o >= 1.0)  * (x.M_o < 8.0) *  (x.properties['type'] == 'star')}
-            condition_2 = {'mass': lambda x : (x.M_o >= 8.0)  * (x.M_o < 16.0) * (x.properties['type'] == 'star')}
-            condition_3 = {'mass': lambda x : (x.M_o >= 16.0) * (x.M_o < 24.0) * (x.properties['type'] == 'star')}
-            condition_4 = {'mass': lambda x : (x.M_o >= 24.0) * (x.M_o < 1000.0) * (x.properties['type'] == 'star')}
-
-            self._summary_data['low_mass_LQ0']   = np.sum(self.all_stars.property_asarray('Q0', subset_condition = condition_1) *\
-                                                          self.all_stars.property_asarray('E0', subset_condition = condition_1))
-            self._summary_data['int_mass_LQ0']   = np.sum(self.all_stars.property_asarray('Q0', subset_condition = condition_2) *\
-                                                          self.all_stars.property_asarray('E0', subset_condition = condition_2))
-            self._summary_data['high_mass_LQ0']  = np.sum(self.all_stars.property_asarray('Q0', subset_condition = condition_3) *\
-                                                          self.all_stars.property_asarray('E0', subset_condition = condition_3))
-            self._summary_data['vhigh_mass_LQ0'] = np.sum(self.all_stars.property_asarray('Q0', subset_condition = condition_4) *\
-                                                          self.all_stars.property_asarray('E0', subset_condition = condition_4))
-
-            self._summary_data['low_mass_LQ1']   = np.sum(self.all_stars.property_asarray('Q1', subset_condition = condition_1) *\
-                                                          self.all_stars.property_asarray('E1', subset_condition = condition_1))
-            self._summary_data['int_mass_LQ1']   = np.sum(self.all_stars.property_asarray('Q1', subset_condition = condition_2) *\
-                                                          self.all_stars.property_asarray('E1', subset_condition = condition_2))
-            self._summary_data['high_mass_LQ1']  = np.sum(self.all_stars.property_asarray('Q1', subset_condition = condition_3) *\
-                                                          self.all_stars.property_asarray('E1', subset_condition = condition_3))
-            self._summary_data['vhigh_mass_LQ1'] = np.sum(self.all_stars.property_asarray('Q1', subset_condition = condition_4) *\
-                                                          self.all_stars.property_asarray('E1', subset_condition = condition_4))
-
-            FUV_1 = self.all_stars.property_asarray('L_FUV', subset_condition = condition_1)
-            FUV_2 = self.all_stars.property_asarray('L_FUV', subset_condition = condition_2)
-            FUV_3 = self.all_stars.property_asarray('L_FUV', subset_condition = condition_3)
-            FUV_4 = self.all_stars.property_asarray('L_FUV', subset_condition = condition_4)
-
-            self._summary_data['low_mass_LFUV']   = np.sum(FUV_1)
-            self._summary_data['int_mass_LFUV']   = np.sum(FUV_2)
-            self._summary_data['high_mass_LFUV']  = np.sum(FUV_3)
-            self._summary_data['vhigh_mass_LFUV'] = np.sum(FUV_4)
-
-            LW_1 = self.all_stars.property_asarray('L_LW', subset_condition = condition_1)
-            LW_2 = self.all_stars.property_asarray('L_LW', subset_condition = condition_2)
-            LW_3 = self.all_stars.property_asarray('L_LW', subset_condition = condition_3)
-            LW_4 = self.all_stars.property_asarray('L_LW', subset_condition = condition_4)
-
-            self._summary_data['low_mass_LLW']   = np.sum(LW_1)
-            self._summary_data['int_mass_LLW']   = np.sum(LW_2)
-            self._summary_data['high_mass_LLW']  = np.sum(LW_3)
-            self._summary_data['vhigh_mass_LLW'] = np.sum(LW_4)
-
-            self._summary_data['low_mass_count'] = np.size(FUV_1)
-            self._summary_data['int_mass_count'] = np.size(FUV_2)
-            self._summary_data['high_mass_count'] = np.size(FUV_3)
-            self._summary_data['vhigh_mass_count'] = np.size(FUV_4)
+        if io.radiation_binned_output:
+            #
+            # e.g. 'int_mass_LQ0' is Q0 * E0 summed over 8 - 16 Msun stars
+            #
+            for name, column in [('L_Q0', 'LQ0'), ('L_Q1', 'LQ1'), ('L_FUV', 'LFUV'),
+                                 ('L_LW', 'LLW'), ('count', 'count')]:
+                for j, bin_name in enumerate(io.radiation_bin_names):
+                    self._summary_data[bin_name + '_' + column] = sums['bins'][name][j]
 
         return
 
     def write_summary_output(self):
         """
-        Write out summary output by appending to ASCII file. Filename is overwritten
-        at first write out, so be careful.
+        Add a row of summary output. Rows are kept in a buffer of
+        io.summary_buffer_size rows and written to summary_output_filename
+        a block at a time: as an HDF5 dataset at full precision if the
+        file name ends in .h5 or .hdf5, otherwise appended to an ASCII
+        file. The file is overwritten at the first write out, so be
+        careful. If io.summary_in_memory is set, the values are also kept
+        (see summary_table) and no file is written if
+        io.summary_output_filename is None.
         """
 
         self._accumulate_summary_data()
 
-        ncol = np.size(self._summary_data.keys())
+        if self._summary_names is None:
+            self._summary_names = list(self._summary_data.keys())
+        elif len(self._summary_names) != len(self._summary_data) or\
+             any(k1 != k2 for k1, k2 in zip(self._summary_names, self._summary_data.keys())):
+            _my_print("Summary output columns changed during the run")
+            raise RuntimeError
 
-        if self._summary_output_number == 0: # print the header only once
-            header = " " + " ".join(list(self._summary_data.keys())) + "\n"
+        if self.config.io.summary_in_memory:
+            self._summary_rows.append( list(self._summary_data.values()) )
 
-            f = open(config.io.summary_output_filename,'w')
-            f.write(header)
-        else:
-            f = open(config.io.summary_output_filename, 'a')
+        if not (self.config.io.summary_output_filename is None):
 
+            if self._summary_buffer is None:
+                self._summary_buffer = np.zeros( (max(self.config.io.summary_buffer_size, 1),
+                                                  len(self._summary_names)))
 
-        fmt = "%5.5E "*ncol + "\n"
-#        output_val  = list(self._summary_data.values())
-#        f.write(fmt% ())
-        #print(self._summary_data)
-        #print(self._summary_data.values())
-        f.writelines("%5.5E "% x for x in self._summary_data.values() )
-        f.write("\n")
+            self._summary_buffer[self._summary_buffer_count] = list(self._summary_data.values())
+            self._summary_buffer_count += 1
+
+            if self._summary_buffer_count == np.shape(self._summary_buffer)[0]:
+                self._flush_summary_buffer()
 
         self._summary_output_number += 1
         self._summary_data.clear()
+
+        return
+
+    def _flush_summary_buffer(self):
+        """
+        Hand the buffered summary rows to the output writer
+        """
+
+        if self._summary_buffer_count == 0 or self.config.io.summary_output_filename is None:
+            return
+
+        self.config.io._submit_output(_write_summary_block, self.config.io.summary_output_filename,
+                                      list(self._summary_names),
+                                      self._summary_buffer[:self._summary_buffer_count].copy(),
+                                      self._summary_rows_written == 0)
+
+        self._summary_rows_written += self._summary_buffer_count
+        self._summary_buffer_count  = 0
+
+        return
+
+    def summary_table(self):
+        """
+        Summary output kept in memory (io.summary_in_memory) as a list of
+        column names and a (N_outputs, N_columns) array
+        """
+
+        if self._summary_names is None or len(self._summary_rows) == 0:
+            return [], np.zeros((0,0))
+
+        return list(self._summary_names), np.array(self._summary_rows, dtype = float)
+
+
+def _write_checkpoint_file(name, contents, outputs, expired):
+    """
+    Write a checkpoint gathered by Zone.write_checkpoint under a temporary
+    name, rename it into place, and remove the expired checkpoints
+    """
+
+    tmp_name = name + '.tmp'
+    hf = h5py.File(tmp_name, 'w')
+
+    hf.attrs['state']   = contents['state']
+    hf.attrs['outputs'] = json.dumps(outputs)
+
+    hf.create_dataset('config', data = np.void(contents['config']))
+    if not (contents['extra'] is None):
+        hf.create_dataset('extra', data = np.void(contents['extra']))
+
+    hf.create_dataset('summary_rows', data = contents['summary_rows'])
+
+    rng_grp = hf.create_group('random_streams')
+    for k, state in contents['random_streams'].items():
+        rng_grp.attrs[k] = state
+
+    columns  = contents['stars']
+    star_grp = hf.create_group('stars')
+    for grpname in ['attributes', 'properties', 'present']:
+        subgrp = star_grp.create_group(grpname)
+        for k, v in columns[grpname].items():
+            subgrp.create_dataset(k, data = v)
+
+    star_grp.attrs['species'] = np.array(columns['species'], dtype = 'S')
+    star_grp.create_dataset('wind_ejecta_abundances', data = columns['wind_ejecta_abundances'])
+    star_grp.create_dataset('sn_ejecta_masses',       data = columns['sn_ejecta_masses'])
+
+    hf.close()
+
+    os.replace(tmp_name, name)
+
+    for old in expired:
+        if os.path.isfile(old):
+            os.remove(old)
+
+    return
+
+def _append_dump_snapshot(name, number, current_time, cycle, N_stars,
+                          parameters, zone_attrs, datasets, static, compression):
+    """
+    Append a dump gathered by Zone.write_output to the single dump file,
+    starting the file (and writing the parameters) if parameters is given.
+    datasets are the star data for this snapshot; static, if given, are
+    rows to add to the 'stars_static' dataset of fixed star values
+    """
+
+    if not (parameters is None):
+        hf = h5py.File(name, 'w')
+
+        params = hf.create_group('parameters')
+        for grpname, values in parameters.items():
+            subgrp = params.create_group(grpname)
+            for p, val in values.items():
+                subgrp.attrs[p] = val
+
+        hf.create_group('snapshots')
+        hf.create_dataset('index', shape = (0,), maxshape = (None,),
+                          dtype = _dump_index_dtype, chunks = (256,))
+
+        if not (static is None):
+            hf.create_dataset('stars_static', shape = (0,), maxshape = (None,),
+                              dtype = static.dtype, chunks = (10000,),
+                              compression = compression)
+    else:
+        hf = h5py.File(name, 'a')
+
+    grp = hf['snapshots'].create_group("%0004i"%(number))
+    grp.attrs['current_time'] = current_time
+
+    zone_grp = grp.create_group('zone')
+    for k, val in zone_attrs.items():
+        zone_grp.attrs[k] = val
+
+    for k, data in datasets.items():
+        grp.create_dataset(k, data = data, compression = compression if np.size(data) > 0 else None)
+
+    if not (static is None):
+        dataset = hf['stars_static']
+        n       = dataset.shape[0]
+        dataset.resize( (n + np.size(static),) )
+        dataset[n:] = static
+
+    index = hf['index']
+    n     = index.shape[0]
+    index.resize( (n + 1,) )
+    index[n] = (number, current_time, cycle, N_stars)
+
+    hf.close()
+
+    return
+
+def _truncate_dump_snapshots(name, number):
+    """
+    Remove snapshots numbered number and above from the single dump file
+    """
+
+    with h5py.File(name, 'a') as hf:
+        index = hf['index'][()]
+        keep  = index['output_number'] < number
+
+        for n in index['output_number'][~keep]:
+            del hf['snapshots']["%0004i"%(n)]
+
+        hf['index'].resize( (np.sum(keep),) )
+
+        if 'stars_static' in hf:
+            N_stars = index['N_stars'][keep][-1] if np.any(keep) else 0
+            hf['stars_static'].resize( (N_stars,) )
+
+    return
+
+def _structured_array(columns):
+    """
+    Dictionary of equal length arrays as one structured array
+    """
+
+    N    = np.size(list(columns.values())[0])
+    data = np.zeros(N, dtype = [(k, np.asarray(v).dtype) for k, v in columns.items()])
+
+    for k, v in columns.items():
+        data[k] = v
+
+    return data
+
+def _write_dump_file(name, current_time, parameters, zone_attrs, star_dict):
+    """
+    Write the HDF5 dump gathered by Zone.write_output
+    """
+
+    hf = h5py.File(name, 'w')
+
+    zone_grp = hf.create_group('zone')
+    star_grp = hf.create_group('star')
+    params   = hf.create_group('parameters')
+
+    for grpname, values in parameters.items():
+        subgrp = params.create_group(grpname)
+        for p, val in values.items():
+            subgrp.attrs[p] = val
+
+    hf.attrs['current_time'] = current_time
+
+    for k, val in zone_attrs.items():
+        zone_grp.attrs[k] = val
+
+    Nstars = np.size(star_dict['mass'])
+
+    if Nstars > 1:
+        # there has to be a better way to do this... but various iterations
+        # of the below did not work b/c of the different variable types...
+        # doing this the slow way......
+    #    star_data = [None]*Nstars
+    #    for i in np.arange(Nstars):
+    #        star_data[i] = (star_dict['id'][i], star_dict['type'][i],
+    #                        star_dict['initial_mass'][i],
+    #                        star_dict['masses'][i], star_dict['age'][i],
+    #                        star_dict['metallicity'][i])
+    #    star_data = np.array(star_data, dtype = [ ('id',star_dict['id'].dtype),
+    #                                              ('type',star_dict['type'].dtype),
+    #                                              ('birth_mass',star_dict['initial_mass'].dtype),
+    #                                              ('mass',star_dict['masses'].dtype),
+    #                                              ('age',star_dict['age'].dtype),
+    #                                              ('metallicity',star_dict['metallicity'].dtype)])
+
+        for k in star_dict.keys():
+            star_grp.create_dataset(k, data=star_dict[k])
+    else:
+        Nstars    = 0
+        star_data = np.zeros(1)
+        for k in star_dict.keys():
+            star_grp.create_dataset(k, data = star_data)
+
+    star_grp.attrs['number_of_stars'] = Nstars
+
+    hf.close()
+
+    return
+
+def _write_summary_block(filename, names, rows, new_file):
+    """
+    Write a block of summary rows, starting the file over if new_file
+    """
+
+    if os.path.splitext(filename)[1] in _hdf5_extensions:
+        hf = h5py.File(filename, 'w' if new_file else 'a')
+
+        if not ('summary' in hf):
+            hf.attrs['names'] = np.array(names, dtype = 'S')
+            hf.create_dataset('summary', shape = (0, len(names)),
+                                         maxshape = (None, len(names)), dtype = np.float64,
+                                         chunks = (max(np.shape(rows)[0], 1), len(names)))
+
+        dataset = hf['summary']
+        nrows   = dataset.shape[0]
+        dataset.resize( (nrows + np.shape(rows)[0], len(names)) )
+        dataset[nrows:] = rows
+
+        hf.close()
+
+    else:
+        if new_file:
+            f = open(filename, 'w')
+            f.write(" " + " ".join(names) + "\n")
+        else:
+            f = open(filename, 'a')
+
+        for row in rows:
+            f.writelines("%5.5E "% x for x in row)
+            f.write("\n")
+
         f.close()
 
+    return
+
+def _truncate_output(name, output, rows):
+    """
+    Cut an appended output back to its rows at a checkpoint (rows, as
+    from output.rows_written). An output with fewer rows than that, e.g.
+    one overwritten since the checkpoint, is left as it is, with a
+    warning, rather than padded with zeros
+    """
+
+    written = output.rows_written
+
+    if isinstance(rows, dict):
+        short = any([written[k] < n for k, n in rows.items()])
+    else:
+        short = written < rows
 
+    if short:
+        _my_print("WARNING: " + name + " output has fewer rows than at the checkpoint (" +\
+                  str(written) + " < " + str(rows) + "). Not truncating it")
+        return
+
+    output.truncate(rows)
+    return
+
+def _truncate_summary_file(filename, nrows):
+    """
+    Cut a summary file back to its first nrows rows
+    """
+
+    if os.path.splitext(filename)[1] in _hdf5_extensions:
+        with h5py.File(filename, 'a') as hf:
+            if 'summary' in hf:
+                hf['summary'].resize( (nrows, hf['summary'].shape[1]) )
+
+    else:
+        with open(filename, 'r') as f:
+            lines = f.readlines()
+
+        if len(lines) > nrows + 1: # + header
+            with open(filename, 'w') as f:
+                f.writelines(lines[:nrows + 1])
+
+    return
+
+def _write_bytes(name, data):
+    with open(name, 'wb') as f:
+        f.write(data)
+    return
 
 def _my_print(string):
     print('[Zone]: ' + string)
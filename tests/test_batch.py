@@ -0,0 +1,70 @@
+"""
+    ZoneBatch against the same zones run one at a time
+"""
+
+from onezone import zone, imf, config, batch
+
+_etas = [1.0, 8.0, 32.0]
+
+def _run_config(t_final = 100.0):
+    rc = config.RunConfig()
+    rc.zone.t_final                  = t_final
+    rc.zone.species_to_track         = ['m_tot', 'm_metal', 'H', 'He', 'O', 'Fe']
+    rc.zone.initial_gas_mass         = 1.0E6
+    rc.zone.initial_metallicity      = 0.001
+    rc.zone.star_formation_method    = 2
+    rc.zone.SFR_efficiency           = 1.0E-4
+    rc.zone.mass_outflow_method      = 1
+    rc.zone.inflow_factor            = 0.3
+    rc.zone.adaptive_timestep        = True
+    rc.zone.imf                      = imf.salpeter(M_min = 1.0, M_max = 100.0, alpha = 1.35)
+    rc.zone.random_seed              = 42
+
+    for name in ['dt_dump', 'dt_summary', 'dt_pickle', 'cycle_dump', 'cycle_summary', 'cycle_pickle']:
+        setattr(rc.io, name, 0)
+
+    rc.io.summary_output_filename = None
+    rc.io.dump_output_basename    = None
+    rc.io.pickle_output_basename  = None
+    rc.io.checkpoint_basename     = None
+
+    return rc
+
+def _serial(rc, eta):
+    rc = rc.copy()
+    rc.zone.mass_loading_factor = eta
+    z = zone.Zone(run_config = rc)
+    z.set_initial_abundances(rc.zone.species_to_track)
+    z.evolve()
+    return z
+
+def test_batch_matches_serial_zones():
+    rc = _run_config()
+
+    b = batch.ZoneBatch.from_sweep(rc, {'mass_loading_factor' : _etas})
+    b.set_initial_abundances(rc.zone.species_to_track)
+    b.evolve()
+
+    for z, eta in zip(b.zones, _etas):
+        alone = _serial(rc, eta)
+
+        # each zone keeps its own timestep, so takes no more cycles than alone
+        assert z._cycle_number == alone._cycle_number
+        assert z.M_gas  == alone.M_gas
+        assert z.N_stars == alone.N_stars
+
+def test_depleted_zone_stops_with_no_gas():
+    rc = _run_config()
+
+    etas = [1.0, 5000.0]   # the second zone runs out of gas
+    b = batch.ZoneBatch.from_sweep(rc, {'mass_loading_factor' : etas})
+    b.set_initial_abundances(rc.zone.species_to_track)
+    b.evolve()
+
+    alone = _serial(rc, etas[1])
+
+    assert alone.t < rc.zone.t_final
+    assert b.zones[1].M_gas == 0.0
+    assert b.zones[1]._cycle_number == alone._cycle_number
+    assert b.zones[0].t >= rc.zone.t_final
+    assert b.zones[0].M_gas > 0.0
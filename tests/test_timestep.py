@@ -0,0 +1,45 @@
+"""
+    Event aligned timestepping (config.zone.event_timestep) against the
+    default adaptive timestep
+"""
+
+import pytest
+
+from onezone import zone, imf, config
+
+def _run_config(star_formation_method, event_timestep, t_final = 3000.0):
+    rc = config.RunConfig()
+    rc.zone.t_final                  = t_final
+    rc.zone.species_to_track         = ['m_tot', 'm_metal', 'H', 'He', 'O', 'Fe']
+    rc.zone.initial_gas_mass         = 1.0E6
+    rc.zone.initial_metallicity      = 0.001
+    rc.zone.star_formation_method    = star_formation_method
+    rc.zone.constant_SFR             = 1.0
+    rc.zone.adaptive_timestep        = True
+    rc.zone.event_timestep           = event_timestep
+    rc.zone.imf                      = imf.salpeter(M_min = 1.0, M_max = 100.0, alpha = 1.35)
+    rc.zone.random_seed              = 42
+
+    for name in ['dt_dump', 'dt_summary', 'dt_pickle', 'cycle_dump', 'cycle_summary', 'cycle_pickle']:
+        setattr(rc.io, name, 0)
+
+    rc.io.summary_output_filename = None
+    rc.io.dump_output_basename    = None
+    rc.io.pickle_output_basename  = None
+    rc.io.checkpoint_basename     = None
+
+    return rc
+
+def _evolve(rc):
+    z = zone.Zone(run_config = rc)
+    z.set_initial_abundances(rc.zone.species_to_track)
+    z.evolve()
+    return z
+
+@pytest.mark.parametrize('star_formation_method', [0, 1])
+def test_event_timestep_takes_fewer_steps(star_formation_method):
+    default = _evolve(_run_config(star_formation_method, False))
+    event   = _evolve(_run_config(star_formation_method, True))
+
+    assert event.t >= event.config.zone.t_final
+    assert event._cycle_number < default._cycle_number